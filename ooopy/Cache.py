@@ -0,0 +1,617 @@
+#!/usr/bin/env python
+# Copyright (C) 2008-20 Dr. Ralf Schlatterbeck Open Source Consulting.
+# Reichergasse 131, A-3411 Weidling.
+# Web: http://www.runtux.com Email: office@runtux.com
+# All rights reserved
+# ****************************************************************************
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+# ****************************************************************************
+
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import json
+import os
+import pickle
+import sys
+from collections             import OrderedDict
+from copy                    import deepcopy
+from hashlib                 import sha256
+from io                      import BytesIO
+from tempfile                import mkstemp
+from threading               import Lock
+from xml.etree.ElementTree   import fromstring
+from ooopy.autosuper         import autosuper
+from ooopy.OOoPy             import OOoPy, OOoElementTree, files
+from ooopy.Index             import file_hash
+from ooopy.Version           import VERSION
+
+class Disk_Cache (autosuper) :
+    """ Directory of parsed templates (the XML trees, mimetype and
+        size of a Template) stored in pickle format, so a new process
+        need not parse a template again. Entries are keyed by the
+        sha256 hash of the template file, the OOoPy version and the
+        python version, a changed template simply gets a new entry.
+        Loading an entry marks it as recently used (by updating its
+        modification time), when storing a new entry makes the
+        directory exceed max_bytes, the least recently used entries are
+        removed. Entries that cannot be loaded are removed, too.
+
+        Loading a pickle can execute arbitrary code, so the directory
+        must only be writable by the user running OOoPy: It is created
+        with mode 0700, a directory or entry owned by another user is
+        not used.
+
+        >>> import shutil
+        >>> if os.path.exists ('testout.cache') :
+        ...     shutil.rmtree ('testout.cache')
+        >>> d = Disk_Cache ('testout.cache', max_bytes = 100000)
+        >>> t1 = Template ('testfiles/rechng.odt', disk = d)
+        >>> t2 = Template ('testfiles/rechng.odt', disk = d)
+        >>> from xml.etree.ElementTree import tostring
+        >>> for f in t1.roots :
+        ...     if tostring (t1.roots [f]) != tostring (t2.roots [f]) :
+        ...         print ("Mismatch:", f)
+        >>> print (t1.size == t2.size, t2.mimetype)
+        True application/vnd.oasis.opendocument.text
+        >>> t = Template ('testfiles/test.odt', disk = d)
+        >>> def stats () :
+        ...     s = d.stats ()
+        ...     print (' '.join ('%s=%s' % (k, s [k]) for k in sorted (s)))
+        >>> stats ()
+        entries=1 errors=0 hits=1 misses=2 removed=1
+        >>> for f in os.listdir ('testout.cache') :
+        ...     with open (os.path.join ('testout.cache', f), 'wb') as x :
+        ...         x.write (b'garbage')
+        7
+        >>> t = Template ('testfiles/test.odt', disk = d)
+        >>> stats ()
+        entries=1 errors=1 hits=1 misses=3 removed=1
+        >>> print ('%o' % (os.stat ('testout.cache').st_mode & 0o777))
+        700
+
+        An entry of another user is refused (we pretend to be another
+        user here):
+
+        >>> uid, d.uid = d.uid, -1
+        >>> t = Template ('testfiles/test.odt', disk = d)
+        >>> stats ()
+        entries=1 errors=2 hits=1 misses=4 removed=1
+        >>> d.uid = uid
+        >>> shutil.rmtree ('testout.cache')
+    """
+
+    extension = '.pickle'
+    suffix    = '-%s-py%s.%s%s' \
+              % ((VERSION,) + sys.version_info [:2] + (extension,))
+
+    def __init__ (self, directory, max_bytes = 256 * 1024 * 1024) :
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock      = Lock ()
+        self.counts    = dict.fromkeys \
+            (('hits', 'misses', 'errors', 'removed'), 0)
+        self.uid       = getattr (os, 'getuid', lambda : None) ()
+        if not os.path.isdir (directory) :
+            os.makedirs (directory, 0o700)
+        if not self.trusted (os.stat (directory)) :
+            raise ValueError \
+                ("Cache directory %s is owned by another user" % directory)
+    # end def __init__
+
+    def trusted (self, st) :
+        """ Check that a file was created by our user """
+        return self.uid is None or st.st_uid == self.uid
+    # end def trusted
+
+    def path (self, digest) :
+        return os.path.join (self.directory, digest + self.suffix)
+    # end def path
+
+    def count (self, name) :
+        with self.lock :
+            self.counts [name] += 1
+    # end def count
+
+    def load (self, digest) :
+        """ Return the stored state for digest or None """
+        path = self.path (digest)
+        try :
+            with open (path, 'rb') as f :
+                if not self.trusted (os.fstat (f.fileno ())) :
+                    # Never unpickle an entry of another user
+                    self.count ('errors')
+                    self.count ('misses')
+                    return None
+                state = self.read (f)
+        except (IOError, OSError) :
+            self.count ('misses')
+            return None
+        except Exception :
+            # Truncated or otherwise broken entry
+            self.count ('errors')
+            self.count ('misses')
+            self.remove (path)
+            return None
+        try :
+            os.utime (path, None)
+        except OSError :
+            pass
+        self.count ('hits')
+        return state
+    # end def load
+
+    def store (self, digest, state) :
+        """ Store state for digest, the file is written under a
+            temporary name and renamed, so concurrent readers never see
+            a partial entry.
+        """
+        fd, tmp = mkstemp (suffix = '.tmp', dir = self.directory)
+        try :
+            with os.fdopen (fd, 'wb') as f :
+                self.write (f, state)
+            os.rename (tmp, self.path (digest))
+        except Exception :
+            self.remove (tmp)
+            raise
+        self.cleanup ()
+    # end def store
+
+    def read (self, f) :
+        return pickle.load (f)
+    # end def read
+
+    def write (self, f, state) :
+        pickle.dump (state, f, pickle.HIGHEST_PROTOCOL)
+    # end def write
+
+    def remove (self, path) :
+        try :
+            os.unlink (path)
+        except OSError :
+            pass
+    # end def remove
+
+    def entries (self) :
+        """ List of (mtime, size, path) of the entries """
+        entries = []
+        for f in os.listdir (self.directory) :
+            if not f.endswith (self.extension) :
+                continue
+            path = os.path.join (self.directory, f)
+            try :
+                st = os.stat (path)
+            except OSError :
+                continue
+            entries.append ((st.st_mtime, st.st_size, path))
+        return entries
+    # end def entries
+
+    def cleanup (self) :
+        """ Remove least recently used entries until the directory is
+            below max_bytes.
+        """
+        entries = sorted (self.entries ())
+        total   = sum (e [1] for e in entries)
+        while entries and total > self.max_bytes :
+            mtime, size, path = entries.pop (0)
+            self.remove (path)
+            self.count ('removed')
+            total -= size
+    # end def cleanup
+
+    def stats (self) :
+        with self.lock :
+            s = dict (self.counts)
+        s ['entries'] = len (self.entries ())
+        return s
+    # end def stats
+# end class Disk_Cache
+
+class Template (autosuper) :
+    """ A template document kept in memory: The raw bytes of the file
+        and the parsed XML members, if a Disk_Cache is given, parsed
+        members are loaded from there. Each OOoPy object returned by open
+        gets a copy of a parsed tree when the tree is read (copying a
+        tree is much faster than parsing it again). Since the
+        Transformer reads members only when a transform accesses them,
+        members that are not modified are neither copied nor written
+        again but copied from the template bytes.
+
+        >>> t = Template ('testfiles/test.odt')
+        >>> print (t.mimetype)
+        application/vnd.oasis.opendocument.text
+        >>> for name in sorted (t.roots) :
+        ...     print (name)
+        META-INF/manifest.xml
+        content.xml
+        meta.xml
+        settings.xml
+        styles.xml
+        >>> o = t.open (BytesIO ())
+        >>> o.read ('content.xml').getroot () is t.roots ['content.xml']
+        False
+        >>> o.close ()
+
+        The Field_Index of a member is computed only once per template:
+
+        >>> idx = t.field_index ('content.xml')
+        >>> idx is t.open (BytesIO ()).field_index ('content.xml')
+        True
+        >>> print (len (idx.names))
+        7
+    """
+
+    def __init__ (self, filename, data = None, disk = None) :
+        self.filename = filename
+        if data is None :
+            with open (filename, 'rb') as f :
+                data = f.read ()
+        self.data    = data
+        self.digest  = sha256 (data).hexdigest ()
+        self.indexes = {}
+        if disk :
+            state = disk.load (self.digest)
+            if state :
+                self.mimetype, self.size, self.roots = state
+                return
+        self.parse ()
+        if disk :
+            disk.store (self.digest, (self.mimetype, self.size, self.roots))
+    # end def __init__
+
+    def parse (self) :
+        o = OOoPy (infile = BytesIO (self.data))
+        try :
+            self.mimetype = o.mimetype
+            names         = o.izip.namelist ()
+            self.size     = len (self.data)
+            self.roots    = {}
+            for f in files :
+                if f in names :
+                    xml = o.izip.read (f)
+                    self.size += len (xml)
+                    self.roots [f] = fromstring (xml)
+        finally :
+            o.close ()
+    # end def parse
+
+    def field_index (self, zname) :
+        """ The Field_Index of the given member, computed on first use """
+        if zname not in self.indexes :
+            from ooopy.Transforms import Field_Index
+            o = OOoPy (infile = BytesIO (self.data))
+            try :
+                xml = o.izip.read (zname)
+            finally :
+                o.close ()
+            self.indexes [zname] = Field_Index (xml, self.mimetype)
+        return self.indexes [zname]
+    # end def field_index
+
+    def open (self, outfile) :
+        return Template_OOoPy (self, outfile)
+    # end def open
+# end class Template
+
+class Template_OOoPy (OOoPy) :
+    """ OOoPy object reading from an in-memory Template: The XML
+        members are not parsed but copied from the parsed trees of the
+        template, everything else is read from the template bytes.
+    """
+
+    def __init__ (self, template, outfile) :
+        self.template = template
+        self.__super.__init__ \
+            (infile = BytesIO (template.data), outfile = outfile)
+    # end def __init__
+
+    def read (self, zname) :
+        if zname in self.template.roots :
+            root = deepcopy (self.template.roots [zname])
+            return OOoElementTree (self, zname, root)
+        return self.__super.read (zname)
+    # end def read
+
+    def field_index (self, zname) :
+        return self.template.field_index (zname)
+    # end def field_index
+# end class Template_OOoPy
+
+class Template_Cache (autosuper) :
+    """ Cache of parsed templates with least-recently-used eviction.
+        Templates are identified by their path, modification time and
+        size or, if by_hash is set, by the sha256 hash of their
+        contents (then identical templates under different paths share
+        one entry and the hash is only recomputed if the modification
+        time or size of a path changes). The size of a template is
+        the size of the file plus the size of its XML members, when
+        the total size exceeds max_bytes the least recently used
+        templates are evicted. Note that parsed trees need several
+        times the memory of their XML. A template larger than
+        max_bytes is not kept at all. With max_bytes None the cache is
+        unbounded. When a file changes, the outdated entry is dropped.
+        If a Disk_Cache is given in disk, templates not in memory are
+        loaded from there if possible.
+
+        >>> from ooopy.Transformer import Transformer
+        >>> import ooopy.Transforms as Transforms
+        >>> c = Template_Cache (max_bytes = 100000)
+        >>> for i in range (3) :
+        ...     out = BytesIO ()
+        ...     o   = c.open ('testfiles/rechng.odt', out)
+        ...     t   = Transformer \\
+        ...         ( o.mimetype
+        ...         , Transforms.Field_Replace
+        ...             (replace = {'address.firstname' : 'Erika'})
+        ...         )
+        ...     t.transform (o)
+        ...     o.close ()
+        >>> from ooopy.Text import paragraphs
+        >>> o = OOoPy (infile = out)
+        >>> print (list (paragraphs (o)) [3])
+        Dr. Erika Zahler
+        >>> o.close ()
+        >>> def stats () :
+        ...     s = c.stats ()
+        ...     print (' '.join ('%s=%s' % (k, s [k]) for k in sorted (s)))
+        >>> stats ()
+        bytes=73857 entries=1 evictions=0 hits=2 misses=1
+        >>> t = c.get ('testfiles/test.odt')
+        >>> stats ()
+        bytes=44457 entries=1 evictions=1 hits=2 misses=2
+        >>> t = c.get ('testfiles/carta.odt')
+        >>> stats ()
+        bytes=44457 entries=1 evictions=1 hits=2 misses=3
+        >>> c.clear ()
+        >>> stats ()
+        bytes=0 entries=0 evictions=0 hits=0 misses=0
+
+        With by_hash a copy of a template is found under its hash:
+
+        >>> import shutil
+        >>> f = shutil.copy ('testfiles/test.odt', 'testout.odt')
+        >>> c = Template_Cache (by_hash = True)
+        >>> c.get ('testfiles/test.odt') is c.get ('testout.odt')
+        True
+        >>> stats ()
+        bytes=44457 entries=1 evictions=0 hits=1 misses=1
+
+        A modified file is read again, the old entry is dropped:
+
+        >>> c = Template_Cache ()
+        >>> t = c.get ('testout.odt')
+        >>> os.utime ('testout.odt', (0, 0))
+        >>> c.get ('testout.odt') is t
+        False
+        >>> stats ()
+        bytes=44457 entries=1 evictions=0 hits=0 misses=2
+        >>> os.unlink ('testout.odt')
+    """
+
+    def __init__ \
+        (self, max_bytes = 64 * 1024 * 1024, by_hash = False, disk = None) :
+        self.max_bytes = max_bytes
+        self.by_hash   = by_hash
+        self.disk      = disk
+        self.lock      = Lock ()
+        self.clear ()
+    # end def __init__
+
+    def clear (self) :
+        """ Drop all templates and reset the statistics """
+        with self.lock :
+            self.entries = OrderedDict ()
+            self.hashes  = {}
+            self.bytes   = 0
+            self.counts  = dict.fromkeys (('hits', 'misses', 'evictions'), 0)
+    # end def clear
+
+    def key (self, filename) :
+        st  = os.stat (filename)
+        key = (os.path.abspath (filename), st.st_mtime, st.st_size)
+        if not self.by_hash :
+            return key
+        with self.lock :
+            h = self.hashes.get (key [0])
+        if h is None or h [0] != key :
+            h = (key, file_hash (filename))
+            with self.lock :
+                self.hashes [key [0]] = h
+        return h [1]
+    # end def key
+
+    def get (self, filename) :
+        """ Get the Template for the given file """
+        key = self.key (filename)
+        with self.lock :
+            t = self.entries.get (key)
+            if t is not None :
+                self.counts ['hits'] += 1
+                # move to the end (most recently used)
+                del self.entries [key]
+                self.entries [key] = t
+                return t
+            self.counts ['misses'] += 1
+        # Parse outside the lock, another thread may do the same
+        t = Template (filename, disk = self.disk)
+        with self.lock :
+            if key in self.entries :
+                return self.entries [key]
+            if self.max_bytes is not None and t.size > self.max_bytes :
+                return t
+            if not self.by_hash :
+                # Drop outdated version of the same file
+                for k in [k for k in self.entries if k [0] == key [0]] :
+                    self.bytes -= self.entries.pop (k).size
+            self.entries [key] = t
+            self.bytes += t.size
+            if self.max_bytes is not None :
+                while self.bytes > self.max_bytes :
+                    k, old = self.entries.popitem (last = False)
+                    self.bytes -= old.size
+                    self.counts ['evictions'] += 1
+        return t
+    # end def get
+
+    def open (self, filename, outfile) :
+        """ OOoPy object for the given template writing to outfile """
+        return self.get (filename).open (outfile)
+    # end def open
+
+    def stats (self) :
+        """ Counts of hits, misses, evictions and the number of entries
+            and bytes in the cache
+        """
+        with self.lock :
+            s = dict (self.counts)
+            s ['entries'] = len (self.entries)
+            s ['bytes']   = self.bytes
+        return s
+    # end def stats
+# end class Template_Cache
+
+class Result_Cache (Disk_Cache) :
+    """ Directory of rendered documents, e.g., for field replacement
+        pipelines where the same template is often rendered with the
+        same values. The key is computed from the hash of the template
+        and the configuration of the pipeline: transform gets it from
+        the classes of the transforms and their parameters as returned
+        by their cache_key method (e.g., the replacement dict of
+        Field_Replace, a callable can't be cached). A transform that
+        does not implement cache_key can't be cached. Additional
+        settings that change the output must be given in config.
+        Entries are written atomically and evicted by least-recent use
+        like for Disk_Cache, so several processes can share the
+        directory.
+
+        >>> from ooopy.Transformer import Transformer
+        >>> import ooopy.Transforms as Transforms
+        >>> import shutil
+        >>> if os.path.exists ('testout.cache') :
+        ...     shutil.rmtree ('testout.cache')
+        >>> rc = Result_Cache ('testout.cache')
+        >>> def render (fields, date = '2020-01-01T00:00:00') :
+        ...     t = Transformer \\
+        ...         ( 'application/vnd.oasis.opendocument.text'
+        ...         , Transforms.Editinfo      (date = date)
+        ...         , Transforms.Field_Replace (replace = fields)
+        ...         )
+        ...     out = BytesIO ()
+        ...     hit = rc.transform (t, 'testfiles/rechng.odt', out)
+        ...     o   = OOoPy (infile = out)
+        ...     print (hit, list (paragraphs (o)) [3])
+        ...     o.close ()
+        >>> from ooopy.Text import paragraphs
+        >>> render ({'address.firstname' : 'Erika'})
+        False Dr. Erika Zahler
+        >>> render ({'address.firstname' : 'Max'})
+        False Dr. Max Zahler
+        >>> render ({'address.firstname' : 'Erika'})
+        True Dr. Erika Zahler
+        >>> render ({'address.firstname' : 'Erika'}, '2021-01-01T00:00:00')
+        False Dr. Erika Zahler
+        >>> s = rc.stats ()
+        >>> print (s ['entries'], s ['hits'], s ['misses'])
+        3 1 3
+        >>> try :
+        ...     render (lambda name : name)
+        ... except TypeError as err :
+        ...     print (err)
+        Only a dict of field values can be cached
+        >>> t = Transformer \\
+        ...     ( 'application/vnd.oasis.opendocument.text'
+        ...     , Transforms.Concatenate ('testfiles/test.odt')
+        ...     )
+        >>> try :
+        ...     rc.transform (t, 'testfiles/rechng.odt', BytesIO ())
+        ... except TypeError as err :
+        ...     print (err)
+        Transform Concatenate can't be cached
+        >>> try :
+        ...     rc.key ('0', lambda name : name)
+        ... except TypeError as err :
+        ...     print (err)
+        Only a dict of field values can be cached
+        >>> shutil.rmtree ('testout.cache')
+    """
+
+    extension = '.result'
+    suffix    = extension
+
+    def key (self, digest, fields, config = ()) :
+        """ Hash of template digest, fields and config """
+        if not isinstance (fields, dict) :
+            raise TypeError ("Only a dict of field values can be cached")
+        k = json.dumps \
+            ( [VERSION, digest, fields, config]
+            , sort_keys    = True
+            , separators   = (',', ':')
+            , ensure_ascii = False
+            )
+        return sha256 (k.encode ('utf-8')).hexdigest ()
+    # end def key
+
+    def config (self, transformer) :
+        """ Configuration of the transforms of the transformer: prio,
+            class name and cache_key of each transform.
+        """
+        return \
+            [ (p, t.__class__.__name__, t.cache_key ())
+              for p in sorted (transformer.transforms)
+              for t in transformer.transforms [p]
+            ]
+    # end def config
+
+    def transform \
+        (self, transformer, infile, outfile, fields = None, config = ()) :
+        """ Render infile (a file name or a Template) with transformer
+            to outfile (a file-like object) unless the result is in the
+            cache, returns True if the result came from the cache. The
+            field values of a Field_Replace are part of its parameters,
+            fields is only needed for values used by other means.
+        """
+        if isinstance (infile, Template) :
+            digest = infile.digest
+        else :
+            digest = file_hash (infile)
+        key  = self.key \
+            (digest, fields or {}, [self.config (transformer), config])
+        data = self.load (key)
+        if data is not None :
+            outfile.write (data)
+            return True
+        out = BytesIO ()
+        if isinstance (infile, Template) :
+            o = infile.open (out)
+        else :
+            o = OOoPy (infile = infile, outfile = out)
+        transformer.transform (o)
+        o.close ()
+        data = out.getvalue ()
+        self.store (key, data)
+        outfile.write (data)
+        return False
+    # end def transform
+
+    def read (self, f) :
+        return f.read ()
+    # end def read
+
+    def write (self, f, data) :
+        f.write (data)
+    # end def write
+# end class Result_Cache
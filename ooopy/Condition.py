@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# Copyright (C) 2008-20 Dr. Ralf Schlatterbeck Open Source Consulting.
+# Reichergasse 131, A-3411 Weidling.
+# Web: http://www.runtux.com Email: office@runtux.com
+# All rights reserved
+# ****************************************************************************
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+# ****************************************************************************
+
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import re
+from ooopy.autosuper         import autosuper
+
+class Condition_Error (ValueError) :
+    pass
+# end class Condition_Error
+
+class Condition (autosuper) :
+    """ A compiled OOo condition (e.g., of a conditional section or a
+        hidden paragraph). Only simple expressions are supported:
+        Variable names (which may contain dots), string literals in
+        double quotes, numbers, TRUE and FALSE, the comparison
+        operators (==, !=, <>, <, <=, >, >= and EQ, NEQ, LT, LEQ, GT,
+        GEQ), AND, OR, NOT (also &&, ||, !) and parentheses. Keywords
+        are case-insensitive, a leading namespace prefix (ooow:) is
+        ignored. Values that look like numbers are compared as numbers,
+        other values as strings. A value used as a condition is true if
+        it is a non-empty string (other than "0") or a non-zero number.
+        Calling the condition with a lookup function for variable values
+        evaluates it, unknown variables (lookup returns None) are empty.
+        A Condition_Error is raised for syntax errors.
+
+        >>> values = dict (a = '1', b = '', name = 'Max', n = '10')
+        >>> for c in \\
+        ...     ( 'ooow:a == "1"', 'a == 1.0', 'b', 'NOT b', 'n > 9'
+        ...     , 'n GT 9 AND name == "Max"', 'b != "" OR name LEQ "Ma"'
+        ...     , 'NOT (a != "" OR b != "")', 'x.y == ""', 'name < "Moritz"'
+        ...     , 'a', 'TRUE', 'not false && !(n<>10)'
+        ...     ) :
+        ...     print (c, Condition (c) (values.get))
+        ooow:a == "1" True
+        a == 1.0 True
+        b False
+        NOT b True
+        n > 9 True
+        n GT 9 AND name == "Max" True
+        b != "" OR name LEQ "Ma" False
+        NOT (a != "" OR b != "") False
+        x.y == "" True
+        name < "Moritz" True
+        a True
+        TRUE True
+        not false && !(n<>10) True
+        >>> for c in 'a ==', 'a = b', '(a', 'a b' :
+        ...     try :
+        ...         Condition (c)
+        ...     except Condition_Error as err :
+        ...         print (err)
+        Unexpected end of condition: a ==
+        Invalid condition: a = b
+        Unexpected end of condition: (a
+        Invalid condition: a b
+    """
+
+    token_re  = re.compile \
+        ( r'\s*(?:'
+          r'(?P<string>"[^"]*")'
+          r'|(?P<number>\d+(?:\.\d*)?|\.\d+)'
+          r'|(?P<op>==|!=|<>|<=|>=|<|>|&&|\|\||!|\(|\))'
+          r'|(?P<name>[A-Za-z_][\w.]*)'
+          r')'
+        )
+    prefix_re = re.compile (r'^\s*[a-z]+:(?![=:])')
+    compare   = dict \
+        ( EQ  = '==', NEQ = '!=', LT = '<', LEQ = '<=', GT = '>', GEQ = '>='
+        )
+    compare.update ((op, op) for op in ('==', '!=', '<', '<=', '>', '>='))
+    compare ['<>'] = '!='
+    operators = \
+        { '==' : lambda a, b : a == b
+        , '!=' : lambda a, b : a != b
+        , '<'  : lambda a, b : a <  b
+        , '<=' : lambda a, b : a <= b
+        , '>'  : lambda a, b : a >  b
+        , '>=' : lambda a, b : a >= b
+        }
+    symbols   = {'&&' : 'AND', '||' : 'OR', '!' : 'NOT'}
+    cache     = {}
+
+    def __init__ (self, expr) :
+        self.expr   = expr
+        self.tokens = self._tokenize (self.prefix_re.sub ('', expr))
+        self.pos    = 0
+        self.fn     = self._or ()
+        if self.pos < len (self.tokens) :
+            raise Condition_Error ("Invalid condition: %s" % expr)
+        del self.tokens
+    # end def __init__
+
+    def __call__ (self, lookup) :
+        return _truth (self.fn (lookup))
+    # end def __call__
+
+    @classmethod
+    def compiled (cls, expr) :
+        """ Return cached compiled condition for expr, None if expr is
+            not a valid condition.
+        """
+        try :
+            return cls.cache [expr]
+        except KeyError :
+            pass
+        try :
+            c = cls (expr)
+        except Condition_Error :
+            c = None
+        # Another thread may have compiled it in the meantime
+        return cls.cache.setdefault (expr, c)
+    # end def compiled
+
+    def _tokenize (self, expr) :
+        tokens = []
+        pos    = 0
+        expr   = expr.rstrip ()
+        while pos < len (expr) :
+            m = self.token_re.match (expr, pos)
+            if not m or m.end () == pos :
+                raise Condition_Error ("Invalid condition: %s" % self.expr)
+            pos = m.end ()
+            kind = m.lastgroup
+            value = m.group (kind)
+            if kind == 'name' :
+                u = value.upper ()
+                if u in ('AND', 'OR', 'NOT') :
+                    kind, value = 'op', u
+                elif u in self.compare :
+                    kind, value = 'op', u
+                elif u in ('TRUE', 'FALSE') :
+                    kind, value = 'number', str (int (u == 'TRUE'))
+            elif kind == 'op' :
+                value = self.symbols.get (value, value)
+            tokens.append ((kind, value))
+        return tokens
+    # end def _tokenize
+
+    def _peek (self) :
+        if self.pos < len (self.tokens) :
+            return self.tokens [self.pos]
+        return (None, None)
+    # end def _peek
+
+    def _next (self) :
+        if self.pos >= len (self.tokens) :
+            raise Condition_Error \
+                ("Unexpected end of condition: %s" % self.expr)
+        self.pos += 1
+        return self.tokens [self.pos - 1]
+    # end def _next
+
+    def _or (self) :
+        left = self._and ()
+        while self._peek () == ('op', 'OR') :
+            self._next ()
+            right = self._and ()
+            left  = _or (left, right)
+        return left
+    # end def _or
+
+    def _and (self) :
+        left = self._not ()
+        while self._peek () == ('op', 'AND') :
+            self._next ()
+            right = self._not ()
+            left  = _and (left, right)
+        return left
+    # end def _and
+
+    def _not (self) :
+        if self._peek () == ('op', 'NOT') :
+            self._next ()
+            arg = self._not ()
+            return lambda v : not _truth (arg (v))
+        return self._compare ()
+    # end def _not
+
+    def _compare (self) :
+        left = self._atom ()
+        kind, value = self._peek ()
+        if kind == 'op' and value in self.compare :
+            self._next ()
+            right = self._atom ()
+            op    = self.operators [self.compare [value]]
+            return lambda v : op (* _coerce (left (v), right (v)))
+        return left
+    # end def _compare
+
+    def _atom (self) :
+        kind, value = self._next ()
+        if kind == 'op' and value == '(' :
+            e = self._or ()
+            if self._next () != ('op', ')') :
+                raise Condition_Error ("Invalid condition: %s" % self.expr)
+            return e
+        if kind == 'string' :
+            s = value [1:-1]
+            return lambda v : s
+        if kind == 'number' :
+            n = float (value)
+            return lambda v : n
+        if kind == 'name' :
+            return lambda v : _value (v (value))
+        raise Condition_Error ("Invalid condition: %s" % self.expr)
+    # end def _atom
+# end class Condition
+
+def _or (left, right) :
+    return lambda v : _truth (left (v)) or _truth (right (v))
+# end def _or
+
+def _and (left, right) :
+    return lambda v : _truth (left (v)) and _truth (right (v))
+# end def _and
+
+def _value (value) :
+    if value is None :
+        return ''
+    return value
+# end def _value
+
+def _number (value) :
+    if isinstance (value, (int, float)) :
+        return value
+    try :
+        return float (value)
+    except (TypeError, ValueError) :
+        return None
+# end def _number
+
+def _coerce (a, b) :
+    """ Make a and b comparable: numbers if both are numeric """
+    na, nb = _number (a), _number (b)
+    if na is not None and nb is not None :
+        return na, nb
+    return '%s' % a, '%s' % b
+# end def _coerce
+
+def _truth (value) :
+    if isinstance (value, (bool, int, float)) :
+        return bool (value)
+    n = _number (value)
+    if n is not None :
+        return bool (n)
+    return bool (value)
+# end def _truth
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# Copyright (C) 2008-20 Dr. Ralf Schlatterbeck Open Source Consulting.
+# Reichergasse 131, A-3411 Weidling.
+# Web: http://www.runtux.com Email: office@runtux.com
+# All rights reserved
+# ****************************************************************************
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+# ****************************************************************************
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import sqlite3
+from hashlib                 import sha256
+from multiprocessing         import Pool
+from ooopy.autosuper         import autosuper
+from ooopy.OOoPy             import OOoPy
+from ooopy.Text              import paragraphs
+
+def file_hash (filename, bufsize = 65536) :
+    """ Compute sha256 hexdigest of the contents of the given file """
+    h = sha256 ()
+    with open (filename, 'rb') as f :
+        while True :
+            b = f.read (bufsize)
+            if not b :
+                break
+            h.update (b)
+    return h.hexdigest ()
+# end def file_hash
+
+def meta_fields (ooopy) :
+    """ Generator for the non-empty text of the elements in meta.xml
+        (title, subject, keywords, author etc.)
+    """
+    if 'meta.xml' not in ooopy.izip.namelist () :
+        return
+    for ev, value in ooopy.iterevents ('meta.xml') :
+        if ev == 'data' and value.strip () :
+            yield value.strip ()
+# end def meta_fields
+
+def _extract (args) :
+    """ Worker for Index.update: Compute hash of the file and, if it
+        differs from the old hash, the text of the file as a list of
+        (part, number, text) tuples. Returns filename, mtime, size, the
+        hash, the list (or None if the hash is unchanged) and an error
+        message (or None).
+    """
+    filename, oldhash, meta = args
+    try :
+        st    = os.stat (filename)
+        hash  = file_hash (filename)
+        if hash == oldhash :
+            return filename, st.st_mtime, st.st_size, hash, None, None
+        o     = OOoPy (infile = filename)
+        try :
+            paras = \
+                [('content', n, p) for n, p in enumerate (paragraphs (o), 1)
+                 if p.strip ()
+                ]
+            if meta :
+                paras.extend \
+                    ( ('meta', n, p)
+                      for n, p in enumerate (meta_fields (o), 1)
+                    )
+        finally :
+            o.close ()
+    except Exception as err :
+        return filename, None, None, None, None, str (err) or repr (err)
+    return filename, st.st_mtime, st.st_size, hash, paras, None
+# end def _extract
+
+class Index (autosuper) :
+    """ Persistent full-text index of the paragraphs of OOo documents
+        in an SQLite database using the FTS5 (or, if not available,
+        FTS4) extension. Documents are identified by their absolute
+        path. Updating the index is incremental: A document is only
+        re-read if its modification time or size changed, and text is
+        only re-extracted if the sha256 hash of the file changed.
+        Extraction can run in a pool of worker processes. The
+        paragraphs of a document get consecutive rowids, the document
+        stores the range, so a document is removed from the full-text
+        table by rowid (the doc column is not indexed).
+
+        >>> from ooopy.Text import document_files
+        >>> if os.path.exists ('testout.db') :
+        ...     os.unlink ('testout.db')
+        >>> idx = Index ('testout.db')
+        >>> files = list (document_files (['testfiles'], recursive = True))
+        >>> st = idx.update (files, meta = True, jobs = 2)
+        >>> for k in sorted (st) :
+        ...     print (k, st [k])
+        added 11
+        errors 0
+        removed 0
+        unchanged 0
+        updated 0
+        >>> for path, part, n, text in idx.query ('Zahler') :
+        ...     print (os.path.relpath (path), part, n, text [:30])
+        testfiles/rechng.odt content 4 Dr. Vorname Zahler
+        testfiles/rechng.odt content 16 Dr. Vorname Zahler
+        testfiles/rechng.odt content 21 Dr. Vorname Zahler
+        testfiles/rechng.odt content 25 Anrede Dr. Vorname Zahler Funk
+        testfiles/rechng.sxw content 4 Dr. Vorname Zahler
+        testfiles/rechng.sxw content 16 Dr. Vorname Zahler
+        testfiles/rechng.sxw content 21 Dr. Vorname Zahler
+        testfiles/rechng.sxw content 25 Anrede Dr. Vorname Zahler Funk
+        >>> for path in idx.files ('thrush OR Abonnent') :
+        ...     print (os.path.relpath (path))
+        testfiles/page1.odt
+        testfiles/rechng.odt
+        testfiles/rechng.sxw
+        >>> for path, part, n, text in idx.query ('minino', limit = 3) :
+        ...     print (os.path.relpath (path), part, n, text)
+        testfiles/page1.odt meta 1 minino
+        testfiles/page1.odt meta 4 minino
+        testfiles/page2.odt meta 1 minino
+        >>> st = idx.update (files)
+        >>> print (st ['unchanged'], st ['added'], st ['updated'])
+        11 0 0
+
+        Touching a file only updates the modification time, the text is
+        not extracted again if the contents did not change:
+
+        >>> import shutil
+        >>> def hits (expr) :
+        ...     return [r [2] for r in idx.query (expr)
+        ...             if r [0].endswith ('testout-index.odt')
+        ...            ]
+        >>> x = shutil.copy ('testfiles/test.odt', 'testout-index.odt')
+        >>> st = idx.update (['testout-index.odt'])
+        >>> print (st ['unchanged'], st ['added'], st ['updated'])
+        0 1 0
+        >>> os.utime ('testout-index.odt', None)
+        >>> st = idx.update (['testout-index.odt'])
+        >>> print (st ['unchanged'], st ['added'], st ['updated'])
+        1 0 0
+        >>> print (hits ('Testman'), hits ('Zahler'))
+        [1, 30] []
+
+        A changed document replaces its paragraphs, the paragraphs of
+        the other documents are kept:
+
+        >>> x = shutil.copy ('testfiles/rechng.odt', 'testout-index.odt')
+        >>> st = idx.update (['testout-index.odt'])
+        >>> print (st ['unchanged'], st ['added'], st ['updated'])
+        0 0 1
+        >>> print (hits ('Testman'), hits ('Zahler'))
+        [] [4, 16, 21, 25]
+        >>> idx.remove ('testout-index.odt')
+        >>> print (hits ('Zahler'), len (list (idx.query ('Zahler'))))
+        [] 8
+        >>> idx.close ()
+        >>> os.unlink ('testout.db')
+        >>> os.unlink ('testout-index.odt')
+    """
+
+    def __init__ (self, filename) :
+        self.filename = filename
+        self.db       = sqlite3.connect (filename)
+        self.db.execute \
+            ( 'create table if not exists document'
+              ' ( id     integer primary key'
+              ' , path   text unique not null'
+              ' , mtime  real'
+              ' , size   integer'
+              ' , sha256 text'
+              ' , first  integer'
+              ' , last   integer'
+              ' )'
+            )
+        try :
+            self.db.execute \
+                ( 'create virtual table if not exists paragraph using fts5'
+                  ' (doc unindexed, part unindexed, n unindexed, text)'
+                )
+        except sqlite3.OperationalError :
+            self.db.execute \
+                ( 'create virtual table if not exists paragraph using fts4'
+                  ' ( doc, part, n, text'
+                  ' , notindexed=doc, notindexed=part, notindexed=n'
+                  ' )'
+                )
+        self.db.commit ()
+    # end def __init__
+
+    def close (self) :
+        self.db.close ()
+    # end def close
+
+    def update (self, filenames, jobs = 1, meta = False, prune = False) :
+        """ Update index for the given filenames, if meta is True, text
+            of meta.xml is also indexed. If prune is True, documents in
+            the index that no longer exist are removed. Returns a dict
+            of counts for 'added', 'updated', 'unchanged', 'removed' and
+            'errors'.
+        """
+        stats = dict.fromkeys \
+            (('added', 'updated', 'unchanged', 'removed', 'errors'), 0)
+        known = {}
+        for id, path, mtime, size, hash in self.db.execute \
+            ('select id, path, mtime, size, sha256 from document') :
+            known [path] = (id, mtime, size, hash)
+        todo  = []
+        for f in filenames :
+            f = os.path.abspath (f)
+            if f in known :
+                id, mtime, size, hash = known [f]
+                try :
+                    st = os.stat (f)
+                except OSError :
+                    continue
+                if st.st_mtime == mtime and st.st_size == size :
+                    stats ['unchanged'] += 1
+                    continue
+                todo.append ((f, hash, meta))
+            else :
+                todo.append ((f, None, meta))
+        if jobs > 1 and len (todo) > 1 :
+            pool    = Pool (jobs)
+            results = pool.imap_unordered (_extract, todo)
+        else :
+            pool    = None
+            results = (_extract (t) for t in todo)
+        try :
+            for path, mtime, size, hash, paras, err in results :
+                if err :
+                    stats ['errors'] += 1
+                    continue
+                if path in known :
+                    id = known [path][0]
+                    self.db.execute \
+                        ( 'update document'
+                          ' set mtime = ?, size = ?, sha256 = ? where id = ?'
+                        , (mtime, size, hash, id)
+                        )
+                    if paras is None :
+                        stats ['unchanged'] += 1
+                        continue
+                    self.remove_paragraphs (id)
+                    stats ['updated'] += 1
+                else :
+                    id = self.db.execute \
+                        ( 'insert into document (path, mtime, size, sha256)'
+                          ' values (?, ?, ?, ?)'
+                        , (path, mtime, size, hash)
+                        ).lastrowid
+                    stats ['added'] += 1
+                self.insert_paragraphs (id, paras)
+        finally :
+            if pool :
+                pool.close ()
+                pool.join ()
+        if prune :
+            for path in known :
+                if not os.path.exists (path) :
+                    self.remove (path)
+                    stats ['removed'] += 1
+        self.db.commit ()
+        return stats
+    # end def update
+
+    def insert_paragraphs (self, id, paras) :
+        """ Insert paragraphs of document id with consecutive rowids
+            after the largest rowid in use, the range is stored with
+            the document.
+        """
+        first, = self.db.execute \
+            ( 'select coalesce (max (rowid), 0) + 1 from paragraph'
+            ).fetchone ()
+        self.db.executemany \
+            ( 'insert into paragraph (rowid, doc, part, n, text)'
+              ' values (?, ?, ?, ?, ?)'
+            , ( (r, id, part, n, text)
+                for r, (part, n, text) in enumerate (paras, first)
+              )
+            )
+        self.db.execute \
+            ( 'update document set first = ?, last = ? where id = ?'
+            , (first, first + len (paras) - 1, id)
+            )
+    # end def insert_paragraphs
+
+    def remove_paragraphs (self, id) :
+        """ Remove paragraphs of document id by their rowid range """
+        first, last = self.db.execute \
+            ( 'select first, last from document where id = ?', (id,)
+            ).fetchone ()
+        if first is not None :
+            self.db.execute \
+                ( 'delete from paragraph where rowid between ? and ?'
+                , (first, last)
+                )
+    # end def remove_paragraphs
+
+    def remove (self, path) :
+        """ Remove document with given path from the index """
+        path = os.path.abspath (path)
+        for id, in self.db.execute \
+            ('select id from document where path = ?', (path,)).fetchall () :
+            self.remove_paragraphs (id)
+            self.db.execute ('delete from document where id = ?', (id,))
+        self.db.commit ()
+    # end def remove
+
+    def query (self, expr, limit = None) :
+        """ Generator for (path, part, paragraph number, text) of the
+            paragraphs matching the full-text query expr (in the query
+            syntax of SQLite FTS), ordered by path and position.
+        """
+        sql = \
+            ( 'select d.path, p.part, p.n, p.text'
+              ' from paragraph p join document d on d.id = p.doc'
+              ' where paragraph match ?'
+              ' order by d.path, p.part, p.n'
+            )
+        args = (expr,)
+        if limit is not None :
+            sql  += ' limit ?'
+            args += (limit,)
+        for row in self.db.execute (sql, args) :
+            yield row
+    # end def query
+
+    def files (self, expr) :
+        """ Generator for paths of documents matching the query expr """
+        sql = \
+            ( 'select distinct d.path'
+              ' from paragraph p join document d on d.id = p.doc'
+              ' where paragraph match ?'
+              ' order by d.path'
+            )
+        for path, in self.db.execute (sql, (expr,)) :
+            yield path
+    # end def files
+# end class Index
@@ -22,20 +22,33 @@
 
 from __future__ import absolute_import, print_function, unicode_literals
 
-from zipfile                 import ZipFile, ZIP_DEFLATED, ZipInfo
+from zipfile                 import ZipFile, ZIP_DEFLATED, ZIP_STORED, ZipInfo
 try :
     from io                  import BytesIO
 except ImportError :
     from StringIO            import StringIO as BytesIO
 from datetime                import datetime
+from copy                    import copy
+from hashlib                 import sha256
+from struct                  import pack, unpack
+from zlib                    import compressobj, decompressobj, crc32
+from zlib                    import DEFLATED
+from zlib                    import Z_DEFAULT_COMPRESSION, Z_FULL_FLUSH
 try :
     from xml.etree.ElementTree   import ElementTree, fromstring, _namespace_map
 except ImportError :
     from elementtree.ElementTree import ElementTree, fromstring, _namespace_map
+from xml.parsers.expat       import ParserCreate
 from tempfile                import mkstemp
+from threading               import Thread, Event, Lock, current_thread
+try :
+    from queue               import Queue
+except ImportError :
+    from Queue               import Queue
 from ooopy.autosuper         import autosuper
 from ooopy.Version           import VERSION
 import os
+import re
 
 files = \
     [ 'content.xml'
@@ -123,6 +136,11 @@ namespace_by_name = \
   }
 namespace_by_name [mimetypes [2]] = namespace_by_name [mimetypes [1]]
 
+# ElementTree uses the global _namespace_map for the prefixes when
+# writing, it is only modified here (at import time, protected by the
+# import lock). For the reverse lookup we keep our own copy, it is never
+# modified later, so it can be read by several threads.
+name_by_namespace = {}
 for ns in namespace_by_name :
     mimetype = namespace_by_name [ns]
     for k in mimetype :
@@ -130,6 +148,88 @@ for ns in namespace_by_name :
         if v in _namespace_map :
             assert (_namespace_map [v] == k)
         _namespace_map [v] = k
+        name_by_namespace [v] = k
+
+class _Names (dict) :
+    """ Cache for converting expat names "uri}local" to "{uri}local" """
+    def __missing__ (self, name) :
+        n = name
+        if '}' in name :
+            n = '{' + name
+        self [name] = n
+        return n
+    # end def __missing__
+# end class _Names
+
+def iterevents (file, data = True, chunksize = 65536, close = False) :
+    """ Generator for streaming parse events of an XML file without
+        building an ElementTree: The file is read in chunks and fed to
+        the expat parser, memory usage does not depend on the size of
+        the file. Yields 2-tuples of the event and its value:
+
+         * 'start', (tag, attrib): start of an element
+         * 'end',   tag:           end of an element
+         * 'data',  text:          character data
+
+        Tags and attribute names use the ElementTree notation
+        "{namespace}name". Adjacent character data is merged, so each
+        'data' event corresponds to the text or tail of an element of
+        the ElementTree representation. If data is False, no 'data'
+        events are generated (and character data is not processed at
+        all). If close is True, the file is closed when the generator
+        is exhausted or closed.
+
+        >>> xml = b'<a xmlns="urn:x" xmlns:b="urn:y" b:c="1">t<b:d/>&amp;'
+        >>> xml += b' tail</a>'
+        >>> for ev in iterevents (BytesIO (xml), chunksize = 4) :
+        ...     print (ev)
+        ('start', ('{urn:x}a', {'{urn:y}c': '1'}))
+        ('data', 't')
+        ('start', ('{urn:y}d', {}))
+        ('end', '{urn:y}d')
+        ('data', '& tail')
+        ('end', '{urn:x}a')
+    """
+    events = []
+    names  = _Names ()
+    def start (tag, attrib) :
+        if attrib :
+            attrib = dict ((names [k], v) for k, v in attrib.items ())
+        events.append (('start', (names [tag], attrib)))
+    def end (tag) :
+        events.append (('end', names [tag]))
+    parser = ParserCreate (namespace_separator = '}')
+    parser.buffer_text            = True
+    parser.buffer_size            = chunksize
+    parser.StartElementHandler    = start
+    parser.EndElementHandler      = end
+    if data :
+        parser.CharacterDataHandler = lambda text : events.append \
+            (('data', text))
+    text = []
+    try :
+        while True :
+            chunk = file.read (chunksize)
+            parser.Parse (chunk, not chunk)
+            if data :
+                for ev in events :
+                    if ev [0] == 'data' :
+                        text.append (ev [1])
+                        continue
+                    if text :
+                        yield ('data', ''.join (text))
+                        text = []
+                    yield ev
+            else :
+                for ev in events :
+                    yield ev
+            del events [:]
+            if not chunk :
+                break
+    finally :
+        if close :
+            file.close ()
+# end def iterevents
 
 class OOoElementTree (autosuper) :
     """
@@ -138,15 +238,30 @@ class OOoElementTree (autosuper) :
         real instance of ElementTree) except for the write method, that
         writes itself back to the OOo XML file in the OOo zip archive it
         came from.
+
+        Large generated parts of a member (e.g., rows of a big table)
+        need not be built as elements: A Comment element with a unique
+        key is inserted into the tree instead and an iterable of byte
+        strings registered for the key with splice. When writing, the
+        serialised comment is replaced by the byte strings, they are
+        streamed into the archive member.
     """
     def __init__ (self, ooopy, zname, root) :
-        self.ooopy = ooopy
-        self.zname = zname
-        self.tree  = ElementTree (root)
+        self.ooopy   = ooopy
+        self.zname   = zname
+        self.tree    = ElementTree (root)
+        self.splices = {}
     # end def __init__
 
+    def splice (self, key, chunks) :
+        """ Register iterable of byte strings to be written instead of
+            the comment with text key.
+        """
+        self.splices [key] = chunks
+    # end def splice
+
     def write (self) :
-        self.ooopy.write (self.zname, self.tree)
+        self.ooopy.write (self.zname, self.tree, self.splices)
     # end def write
 
     def __getattr__ (self, name) :
@@ -162,6 +277,330 @@ class OOoElementTree (autosuper) :
 
 # end class OOoElementTree
 
+class _Digest_Writer (autosuper) :
+    """ Write-only file computing the sha256 hash of the data written.
+        It can't seek, so zipfile writes the archive sequentially.
+    """
+
+    def __init__ (self, file) :
+        self.opened = not hasattr (file, 'write')
+        if self.opened :
+            file = open (file, 'wb')
+        self.file   = file
+        self.hash   = sha256 ()
+        self.pos    = 0
+    # end def __init__
+
+    def write (self, data) :
+        self.hash.update (data)
+        self.pos += len (data)
+        return self.file.write (data)
+    # end def write
+
+    def tell (self) :
+        return self.pos
+    # end def tell
+
+    def flush (self) :
+        self.file.flush ()
+    # end def flush
+
+    def close (self) :
+        if self.opened :
+            self.file.close ()
+            self.opened = False
+    # end def close
+
+    def hexdigest (self) :
+        return self.hash.hexdigest ()
+    # end def hexdigest
+# end class _Digest_Writer
+
+def crc32_tables (length) :
+    """ Tables for combining CRC-32 values: If b has the given length,
+        crc32 (a + b) == crc32_combine (tables, crc32 (a), crc32 (b)).
+        Appending length bytes is linear in the CRC of the prefix, the
+        tables are computed from the images of the 32 bits.
+
+        >>> a, b = b'Hello ', b'World'
+        >>> t = crc32_tables (len (b))
+        >>> crc32_combine (t, crc32 (a), crc32 (b)) == crc32 (a + b)
+        True
+    """
+    zeros  = b'\0' * length
+    z      = crc32 (zeros)
+    bits   = [crc32 (zeros, 1 << i) ^ z for i in range (32)]
+    tables = []
+    for k in range (4) :
+        t = [0] * 256
+        for b in range (1, 256) :
+            low   = b & -b
+            t [b] = t [b ^ low] ^ bits [8 * k + low.bit_length () - 1]
+        tables.append (t)
+    return tables
+# end def crc32_tables
+
+def crc32_combine (tables, crc1, crc2) :
+    """ CRC-32 of the concatenation, see crc32_tables """
+    crc1 &= 0xffffffff
+    return \
+        ( tables [0][crc1 & 0xff]
+        ^ tables [1][(crc1 >> 8)  & 0xff]
+        ^ tables [2][(crc1 >> 16) & 0xff]
+        ^ tables [3][crc1 >> 24]
+        ^ crc2 & 0xffffffff
+        )
+# end def crc32_combine
+
+class _Raw_Compressor (object) :
+    """ Compressor for zipfile passing through already deflated data """
+    def compress (self, data) :
+        return data
+    # end def compress
+
+    def flush (self) :
+        return b''
+    # end def flush
+# end class _Raw_Compressor
+
+class Deflated_Fragments (autosuper) :
+    """ The fragments of an archive member (e.g., the static text of a
+        template between fields) compressed once as independent raw
+        deflate blocks flushed to a byte boundary (a full flush resets
+        the compression history). An output member is assembled by
+        concatenating the compressed fragments with freshly compressed
+        replacements for some of them, the CRC-32 of the static
+        fragments is combined with precomputed tables instead of
+        computing it over the whole member again. Fragments shorter
+        than min_combine bytes are not worth the tables, the CRC is
+        computed directly for these.
+
+        >>> f = Deflated_Fragments ([b'<a>', b'old', b'</a>' * 1000])
+        >>> m = f.member ({1 : b'&amp;new'})
+        >>> print (m.data [:16].decode ('ascii'))
+        <a>&amp;new</a><
+        >>> out = BytesIO ()
+        >>> o = OOoPy (outfile = out, mimetype = 'text/plain')
+        >>> m.write (o, 'content.xml')
+        >>> o.close ()
+        >>> o = OOoPy (infile = out)
+        >>> o.izip.read ('content.xml') == m.data
+        True
+        >>> i = o.izip.getinfo ('content.xml')
+        >>> print (i.file_size, i.compress_size < 100)
+        4011 True
+        >>> o.close ()
+    """
+    final       = b'\x03\x00' # empty final block with fixed codes
+    min_stored  = 1024
+    min_combine = 4096
+
+    def __init__ (self, fragments, level = Z_DEFAULT_COMPRESSION) :
+        self.level     = level
+        self.fragments = fragments
+        self.packed    = []
+        c = compressobj (level, DEFLATED, -15)
+        for f in fragments :
+            data   = c.compress (f) + c.flush (Z_FULL_FLUSH) if f else b''
+            tables = None
+            if len (f) >= self.min_combine :
+                tables = crc32_tables (len (f))
+            self.packed.append ((data, crc32 (f), tables))
+    # end def __init__
+
+    def compress (self, data) :
+        """ Raw deflate blocks for a replacement, short replacements
+            are not worth compressing and are written as stored blocks.
+        """
+        if len (data) >= self.min_stored :
+            c = compressobj (self.level, DEFLATED, -15)
+            return c.compress (data) + c.flush (Z_FULL_FLUSH)
+        if not data :
+            return b''
+        return b''.join ((b'\0', pack ('<HH', len (data), len (data) ^ 0xffff)
+                         , data
+                        ))
+    # end def compress
+
+    def member (self, replace) :
+        """ The member with the fragments indexed by the keys of the
+            dict replace replaced by the (uncompressed) byte strings.
+        """
+        return Deflated_Member (self, replace)
+    # end def member
+# end class Deflated_Fragments
+
+class Deflated_Member (autosuper) :
+    """ An archive member assembled from Deflated_Fragments """
+
+    def __init__ (self, fragments, replace) :
+        self.fragments = fragments
+        self.replace   = replace
+        self._data     = None
+    # end def __init__
+
+    @property
+    def data (self) :
+        """ Uncompressed bytes of the member """
+        if self._data is None :
+            r = self.replace
+            self._data = b''.join \
+                ( r [n] if n in r else f
+                  for n, f in enumerate (self.fragments.fragments)
+                )
+        return self._data
+    # end def data
+
+    def write (self, ooopy, zname) :
+        """ Write compressed member to the output archive of ooopy """
+        chunks = []
+        crc    = size = 0
+        r      = self.replace
+        frags  = self.fragments
+        for n, (data, fcrc, tables) in enumerate (frags.packed) :
+            if n in r :
+                v      = r [n]
+                crc    = crc32 (v, crc)
+                size  += len (v)
+                chunks.append (frags.compress (v))
+                continue
+            f      = frags.fragments [n]
+            if tables is None :
+                crc    = crc32 (f, crc)
+            else :
+                crc    = crc32_combine (tables, crc, fcrc)
+            size  += len (f)
+            chunks.append (data)
+        chunks.append (frags.final)
+        ooopy.write_deflated (zname, chunks, crc & 0xffffffff, size)
+    # end def write
+# end class Deflated_Member
+
+class Write_Job (autosuper) :
+    """ A function call queued in a Write_Behind queue """
+
+    def __init__ (self, func, args) :
+        self.func     = func
+        self.args     = args
+        self.thread   = None
+        self.result   = None
+        self.error    = None
+        self.reported = False
+        self.done     = Event ()
+    # end def __init__
+
+    def run (self) :
+        self.thread = current_thread ()
+        try :
+            self.result = self.func (* self.args)
+        except Exception as err :
+            self.error  = err
+        self.done.set ()
+    # end def run
+
+    def wait (self) :
+        """ Wait for the job, return its result or raise its error """
+        self.done.wait ()
+        if self.error is not None :
+            self.reported = True
+            raise self.error
+        return self.result
+    # end def wait
+# end class Write_Job
+
+class Write_Behind (autosuper) :
+    """ Bounded queue of write jobs run by background threads: A
+        Transformer (see Transformer.transform) can hand the transformed
+        document to the queue, the XML members are serialised,
+        compressed and written and the document is closed in the
+        background while the caller transforms the next document. At
+        most maxsize jobs are waiting, submitting another one blocks
+        until a job is taken from the queue, this caps the memory used
+        by finished trees. The error of a failed job is raised when
+        waiting for that job (e.g., by closing the OOoPy object), if
+        nobody waited it is raised by the next submit or by close.
+
+        >>> wb = Write_Behind (maxsize = 1)
+        >>> jobs = [wb.submit (pow, 2, n) for n in range (4)]
+        >>> print ([j.wait () for j in jobs])
+        [1, 2, 4, 8]
+        >>> j = wb.submit (pow, 2, 'x')
+        >>> try :
+        ...     wb.close ()
+        ... except TypeError as err :
+        ...     print ("Error")
+        Error
+    """
+
+    def __init__ (self, maxsize = 2, threads = 1) :
+        self.queue   = Queue (maxsize)
+        self.jobs    = []
+        self.lock    = Lock ()
+        self.threads = []
+        for n in range (threads) :
+            t = Thread (target = self._run, name = 'Write_Behind-%d' % n)
+            t.daemon = True
+            t.start ()
+            self.threads.append (t)
+    # end def __init__
+
+    def _run (self) :
+        while True :
+            job = self.queue.get ()
+            if job is None :
+                break
+            job.run ()
+    # end def _run
+
+    def check (self) :
+        """ Raise the first error of a finished job nobody waited for """
+        with self.lock :
+            error = None
+            jobs  = []
+            for j in self.jobs :
+                if j.done.is_set () and (j.error is None or j.reported) :
+                    continue
+                if error is None and j.done.is_set () :
+                    j.reported = True
+                    error      = j.error
+                    continue
+                jobs.append (j)
+            self.jobs = jobs
+        if error is not None :
+            raise error
+    # end def check
+
+    def submit (self, func, * args) :
+        """ Queue call of func with args, blocks if the queue is full.
+            Returns a Write_Job.
+        """
+        self.check ()
+        job = Write_Job (func, args)
+        with self.lock :
+            self.jobs.append (job)
+        self.queue.put (job)
+        return job
+    # end def submit
+
+    def close (self) :
+        """ Wait for all jobs and stop the threads """
+        for t in self.threads :
+            self.queue.put (None)
+        for t in self.threads :
+            t.join ()
+        self.threads = []
+        self.check ()
+    # end def close
+
+    def __enter__ (self) :
+        return self
+    # end def __enter__
+
+    def __exit__ (self, * args) :
+        self.close ()
+    # end def __exit__
+# end class Write_Behind
+
 class OOoPy (autosuper) :
     """
         Wrapper for OpenOffice.org zip files (all OOo documents are
@@ -204,13 +643,39 @@ class OOoPy (autosuper) :
         mimetype 0 8
         settings.xml 0 8
         styles.xml 0 8
+        >>> o.close ()
+
+        With a timestamp the output is reproducible, with digest the
+        sha256 hash of the output is returned by close:
+
+        >>> from hashlib import sha256
+        >>> def copy (infile) :
+        ...     out = BytesIO ()
+        ...     o   = OOoPy \\
+        ...         (infile = infile, outfile = out, timestamp = 0, digest = True)
+        ...     for f in files :
+        ...         o.read (f).write ()
+        ...     return o.close (), out.getvalue ()
+        >>> d1, out1 = copy ('testfiles/test.odt')
+        >>> d2, out2 = copy ('testfiles/test.odt')
+        >>> out1 == out2, d1 == d2 == sha256 (out1).hexdigest ()
+        (True, True)
+        >>> o = OOoPy (infile = BytesIO (out1))
+        >>> print (set (f.date_time for f in o.izip.infolist ()))
+        {(1980, 1, 1, 0, 0, 0)}
+        >>> o.close ()
     """
+    # Private attributes of zipfile's member writer used by _write_raw
+    raw_attributes = ('_compressor', '_crc', '_file_size')
+
     def __init__ \
         ( self
         , infile     = None
         , outfile    = None
         , write_mode = 'w'
         , mimetype   = None
+        , timestamp  = None
+        , digest     = False
         ) :
         """
             Open an OOo document, if no outfile is given, we open the
@@ -237,12 +702,34 @@ class OOoPy (autosuper) :
             The mimetype is automatically determined if an infile is
             given. If only writing is desired, the mimetype should be
             set.
+
+            For reproducible output a timestamp (a datetime in UTC or
+            seconds since the epoch) can be given, it is used for all
+            members of the output archive instead of the current time
+            and attributes of XML members are written in sorted order,
+            so identical input produces identical bytes. If no
+            timestamp is given, the environment variable
+            SOURCE_DATE_EPOCH is used if set. If digest is set, the
+            sha256 hash of the output is computed while it is written
+            and returned (as a hex string) by close. The zip file is
+            written without seeking back then (the sizes of members
+            follow the member data).
         """
         assert (infile != outfile)
         self.izip = self.ozip = None
+        self.out  = None
+        if timestamp is None and os.environ.get ('SOURCE_DATE_EPOCH') :
+            timestamp = int (os.environ ['SOURCE_DATE_EPOCH'])
+        if timestamp is not None and not isinstance (timestamp, datetime) :
+            timestamp = datetime.utcfromtimestamp (timestamp)
+        self.timestamp = timestamp
+        self.job       = None
         if infile :
             self.izip    = ZipFile (infile,  'r',        ZIP_DEFLATED)
         if outfile :
+            if digest :
+                assert (write_mode == 'w')
+                self.out = outfile = _Digest_Writer (outfile)
             self.ozip    = ZipFile (outfile, write_mode, ZIP_DEFLATED)
             self.written = {}
         if mimetype :
@@ -272,31 +759,175 @@ class OOoPy (autosuper) :
         return OOoElementTree (self, zname, fromstring (self.izip.read (zname)))
     # end def read
 
-    def _write (self, zname, str) :
-        now  = datetime.utcnow ().timetuple ()
-        info = ZipInfo (zname, date_time = now)
+    def iterevents (self, zname, data = True) :
+        """ Streaming parse events for the given archive member, see
+            the iterevents function. In contrast to read the member is
+            not parsed into an ElementTree.
+        """
+        assert (self.izip)
+        return iterevents (self.izip.open (zname), data, close = True)
+    # end def iterevents
+
+    def open (self, zname, mode = 'r', force_zip64 = False) :
+        """ Return a file-like object for reading (mode 'r', from the
+            input archive) or writing (mode 'w', to the output archive)
+            the given member as a stream, e.g., for writing large
+            members without building them in memory. When writing, the
+            returned file must be closed before anything else is written
+            to the archive. If the member may get larger than 2GiB,
+            force_zip64 must be set.
+        """
+        if mode == 'r' :
+            assert (self.izip)
+            return self.izip.open (zname)
+        assert (self.ozip and mode == 'w')
+        if 'mimetype' not in self.written :
+            self._write ('mimetype', self.mimetype.encode ('ascii'))
+        if zname in self.written :
+            raise ValueError ("Rewrite file: %s" % zname)
+        self.written [zname] = 1
+        return self.ozip.open \
+            (self._zipinfo (zname), 'w', force_zip64 = force_zip64)
+    # end def open
+
+    def write_deflated (self, zname, chunks, crc, size) :
+        """ Write a member from already compressed data: chunks is an
+            iterable of byte strings forming a raw deflate stream, crc
+            and size are the CRC-32 and the length of the uncompressed
+            data, see Deflated_Fragments. Zipfile has no interface for
+            this, the compressor of the member is replaced by one that
+            passes the data through and the CRC and size computed by
+            zipfile are overwritten before closing. These are private
+            attributes of zipfile: If a zipfile version doesn't have
+            them, the data is decompressed and written normally.
+
+            >>> from zipfile import ZipFile
+            >>> def check () :
+            ...     out = BytesIO ()
+            ...     o   = OOoPy (infile = 'testfiles/carta.odt', outfile = out)
+            ...     f   = Deflated_Fragments ([b'<a>', b'x', b'</a>' * 2000])
+            ...     f.member ({1 : b'y'}).write (o, 'extra.xml')
+            ...     o.close ()
+            ...     z   = ZipFile (out)
+            ...     print (z.testzip (), z.read ('extra.xml') [:8].decode ())
+            ...     z.close ()
+            >>> check ()
+            None <a>y</a>
+            >>> saved, OOoPy.raw_attributes = OOoPy.raw_attributes, ('_x',)
+            >>> check ()
+            None <a>y</a>
+            >>> OOoPy.raw_attributes = saved
+        """
+        f = self.open (zname, 'w', force_zip64 = size > 0x7fffffff)
+        self._write_raw (f, chunks, crc, size, ZIP_DEFLATED)
+    # end def write_deflated
+
+    def _write_raw (self, f, chunks, crc, size, compress_type) :
+        """ Write compressed chunks to the zipfile member f """
+        if all (hasattr (f, a) for a in self.raw_attributes) :
+            if f._compressor :
+                f._compressor = _Raw_Compressor ()
+            for c in chunks :
+                f.write (c)
+            f._crc       = crc
+            f._file_size = size
+        elif compress_type == ZIP_DEFLATED :
+            d = decompressobj (-15)
+            for c in chunks :
+                f.write (d.decompress (c))
+            f.write (d.flush ())
+        else :
+            for c in chunks :
+                f.write (c)
+        f.close ()
+    # end def _write_raw
+
+    def _copy (self, info) :
+        """ Copy member of the input archive with the given ZipInfo to
+            the output: The compressed data is copied, a member is not
+            decompressed and compressed again. Only encrypted members
+            or compression methods we don't know are recompressed.
+        """
+        fp  = self.izip.fp
+        fp.seek (info.header_offset)
+        h   = fp.read (30)
+        if  (   info.flag_bits & 1
+            or  info.compress_type not in (ZIP_STORED, ZIP_DEFLATED)
+            or  h [:4] != b'PK\x03\x04'
+            ) :
+            self.ozip.writestr (info, self.izip.read (info.filename))
+            return
+        n, m = unpack ('<HH', h [26:30])
+        fp.seek (info.header_offset + 30 + n + m)
+        data = fp.read (info.compress_size)
+        crc, size = info.CRC, info.file_size
+        f = self.ozip.open (info, 'w', force_zip64 = size > 0x7fffffff)
+        self._write_raw (f, [data], crc, size, info.compress_type)
+    # end def _copy
+
+    def _date_time (self) :
+        if self.timestamp is None :
+            return datetime.utcnow ().timetuple () [:6]
+        # zip files can't represent dates before 1980
+        return max (self.timestamp.timetuple () [:6], (1980, 1, 1, 0, 0, 0))
+    # end def _date_time
+
+    def _zipinfo (self, zname) :
+        info = ZipInfo (zname, date_time = self._date_time ())
         info.create_system = 0 # pretend to be fat
         info.compress_type = ZIP_DEFLATED
-        self.ozip.writestr (info, str)
+        return info
+    # end def _zipinfo
+
+    def _write (self, zname, str) :
+        self.ozip.writestr (self._zipinfo (zname), str)
         self.written [zname] = 1
     # end def _write
 
-    def write (self, zname, etree) :
+    def write (self, zname, etree, splices = None) :
+        """ Write the given ElementTree to the archive member zname.
+            If splices (a dict of iterables of byte strings indexed by
+            comment text, see OOoElementTree) is given, the comments
+            are replaced by the byte strings which are streamed into the
+            member.
+        """
         assert (self.ozip)
         # assure mimetype is the first member in new archive
         if 'mimetype' not in self.written :
             self._write ('mimetype', self.mimetype.encode ('ascii'))
         if zname in self.written :
             raise ValueError ("Rewrite file: %s" % zname)
+        if self.timestamp is not None :
+            for e in etree.iter () :
+                if len (e.attrib) > 1 :
+                    attrib = sorted (e.attrib.items ())
+                    e.attrib.clear ()
+                    e.attrib.update (attrib)
         str = BytesIO ()
         etree.write (str)
-        self._write (zname, str.getvalue ())
+        if not splices :
+            self._write (zname, str.getvalue ())
+            return
+        marker = re.compile \
+            ( b'<!--(%s)-->'
+            % b'|'.join (re.escape (k.encode ('utf-8')) for k in splices)
+            )
+        f = self.open (zname, 'w')
+        for n, part in enumerate (marker.split (str.getvalue ())) :
+            if n % 2 :
+                for chunk in splices [part.decode ('utf-8')] :
+                    f.write (chunk)
+            else :
+                f.write (part)
+        f.close ()
     # end def write
 
     def append_file (self, zname, str) :
         """ Official interface to _write: Append a file to the end of
             the archive.
         """
+        if 'mimetype' not in self.written :
+            self._write ('mimetype', self.mimetype.encode ('ascii'))
         if zname not in self.written :
             self._write (zname, str)
     # end def append_file
@@ -306,16 +937,46 @@ class OOoPy (autosuper) :
             Close the zip files. According to documentation of zipfile in
             the standard python lib, this has to be done to be sure
             everything is written. We copy over the not-yet written files
-            from izip before closing ozip.
+            from izip before closing ozip, their compressed data is
+            copied as is. Returns the hex digest of the output if
+            digest was requested.
+
+            >>> out = BytesIO ()
+            >>> o = OOoPy (infile = 'testfiles/carta.odt', outfile = out)
+            >>> i = o.izip.getinfo ('styles.xml')
+            >>> o.close ()
+            >>> o = OOoPy (infile = out)
+            >>> c = o.izip.getinfo ('styles.xml')
+            >>> c.compress_size == i.compress_size, c.CRC == i.CRC
+            (True, True)
+            >>> len (o.izip.read ('styles.xml'))
+            163840
+            >>> o.close ()
+
+            If the document was handed to a Write_Behind queue, close
+            waits for the queued job (which closes the document).
         """
-        if self.izip and self.ozip :
-            for f in self.izip.infolist () :
-                if f.filename not in self.written :
-                    self.ozip.writestr (f, self.izip.read (f.filename))
-        for i in self.izip, self.ozip :
-            if i :
-                i.close ()
-        self.izip = self.ozip = None
+        job = self.job
+        if job is not None and job.thread is not current_thread () :
+            self.job = None
+            return job.wait ()
+        izip, ozip = self.izip, self.ozip
+        try :
+            if izip and ozip :
+                for f in izip.infolist () :
+                    if f.filename not in self.written :
+                        f = copy (f)
+                        if self.timestamp is not None :
+                            f.date_time = self._date_time ()
+                        self._copy (f)
+        finally :
+            self.izip = self.ozip = None
+            for i in izip, ozip :
+                if i :
+                    i.close ()
+        if self.out :
+            self.out.close ()
+            return self.out.hexdigest ()
     # end def close
     __del__ = close # auto-close on deletion of object
 
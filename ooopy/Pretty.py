@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# Copyright (C) 2005-20 Dr. Ralf Schlatterbeck Open Source Consulting.
+# Reichergasse 131, A-3411 Weidling.
+# Web: http://www.runtux.com Email: office@runtux.com
+# All rights reserved
+# ****************************************************************************
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+# ****************************************************************************
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from ooopy.autosuper         import autosuper
+from ooopy.Transformer       import split_tag
+
+class Pretty_Printer (autosuper) :
+    """ Pretty-print XML from a stream of parse events (see
+        OOoPy.iterevents) without building a tree and without
+        recursion, memory does not depend on the size of the XML.
+        Each element is printed on its own line, indented by its depth,
+        with sorted attributes. With with_text the TEXT of an element
+        is printed on the element line, the TAIL, too, if the element
+        has no children; otherwise the TAIL is printed on a separate
+        line after the subtree of the element.
+        If select is given, only subtrees of elements matching it are
+        printed. It is a tag ("table:table") or a path of tags
+        separated by "/" that must match the end of the path of an
+        element, a leading "/" anchors the path at the root element.
+        With max_depth, elements nested deeper than max_depth below the
+        printed root are not shown, neither is their text and TAIL.
+
+        >>> import sys
+        >>> from io import BytesIO
+        >>> from ooopy.OOoPy import iterevents
+        >>> ns  = b'urn:oasis:names:tc:opendocument:xmlns:text:1.0'
+        >>> xml = b'<text:r xmlns:text="%s"><text:a/>x<text:b>t<text:c/>' % ns
+        >>> xml += b'y</text:b>z</text:r>'
+        >>> def pretty (** kw) :
+        ...     pp = Pretty_Printer (sys.stdout, ** kw)
+        ...     data = kw.get ('with_text', False)
+        ...     pp.pretty (iterevents (BytesIO (xml), data = data))
+        >>> pretty ()
+        text:r
+            text:a
+            text:b
+                text:c
+        >>> pretty (with_text = True)
+        text:r
+            text:a TAIL="x"
+            text:b TEXT="t"
+                text:c TAIL="y"
+            TAIL="z"
+        >>> pretty (with_text = True, select = 'text:b')
+        text:b TEXT="t"
+            text:c TAIL="y"
+        >>> pretty (with_text = True, select = 'text:a')
+        text:a
+        >>> pretty (with_text = True, select = '/text:b')
+        >>> pretty (with_text = True, select = 'text:r/text:b/text:c')
+        text:c
+        >>> pretty (with_text = True, max_depth = 1)
+        text:r
+            text:a TAIL="x"
+            text:b TEXT="t" TAIL="z"
+        >>> pretty (with_text = True, max_depth = 0)
+        text:r
+        >>> pretty (with_text = True, select = 'text:b', max_depth = 0)
+        text:b TEXT="t"
+    """
+
+    def __init__ \
+        ( self
+        , out
+        , with_text = False
+        , ext_ns    = False
+        , select    = None
+        , max_depth = None
+        , bufsize   = 65536
+        ) :
+        self.out       = out
+        self.with_text = with_text
+        self.ext_ns    = ext_ns
+        self.max_depth = max_depth
+        self.bufsize   = bufsize
+        self.names     = {}
+        self.anchored  = False
+        self.select    = None
+        if select :
+            self.anchored = select.startswith ('/')
+            self.select   = select.strip ('/').split ('/')
+    # end def __init__
+
+    def clean (self, tag) :
+        try :
+            return self.names [tag]
+        except KeyError :
+            n = tag
+            if not self.ext_ns :
+                n = cleantag (tag)
+            self.names [tag] = n
+            return n
+    # end def clean
+
+    def matches (self, path) :
+        sel = self.select
+        if sel is None :
+            return True
+        if self.anchored and len (path) != len (sel) :
+            return False
+        return path [-len (sel):] == sel
+    # end def matches
+
+    def pretty (self, events) :
+        buf     = []
+        size    = 0
+        path    = []    # cleaned tags of open elements
+        level   = None  # length of path of the selected root or None
+        pending = None  # line of last printed element, may get TEXT/TAIL
+        pdepth  = None  # depth of pending element
+        tail    = None  # depth of last closed element if printed
+        hidden  = False # last event closed an element below max_depth
+        for ev, value in events :
+            if ev == 'data' :
+                # Text outside the selection and TAIL of hidden elements
+                if level is None or hidden :
+                    continue
+                if tail is not None :
+                    if pending is not None and pdepth == tail :
+                        pending.append (' TAIL="%s"' % value)
+                    else :
+                        buf.append ('%sTAIL="%s"' % ("    " * tail, value))
+                        size += len (buf [-1])
+                elif pending is not None and pdepth == len (path) - level :
+                    pending.append (' TEXT="%s"' % value)
+                continue
+            closed = None
+            tail   = None
+            hidden = False
+            if ev == 'start' :
+                tag, attrib = value
+                path.append (self.clean (tag))
+                if level is None and self.matches (path) :
+                    level = len (path)
+                if level is None :
+                    continue
+                depth = len (path) - level
+                if self.max_depth is not None and depth > self.max_depth :
+                    continue
+            else :
+                if level is not None :
+                    depth = len (path) - level
+                    if self.max_depth is not None and depth > self.max_depth :
+                        hidden = True
+                        path.pop ()
+                        continue
+                    closed = depth
+                    # The TAIL of a printed root is not part of it
+                    if depth :
+                        tail = depth
+                    else :
+                        level = None
+                path.pop ()
+            if pending is not None and pdepth != closed :
+                buf.append (''.join (pending))
+                size   += len (buf [-1])
+                pending = None
+            if ev == 'start' :
+                pending = ["    " * depth, path [-1]]
+                pdepth  = depth
+                for a in sorted (attrib) :
+                    pending.append (' %s="%s"' % (self.clean (a), attrib [a]))
+            if size >= self.bufsize :
+                self.out.write ('\n'.join (buf) + '\n')
+                buf  = []
+                size = 0
+        if pending is not None :
+            buf.append (''.join (pending))
+        if buf :
+            self.out.write ('\n'.join (buf) + '\n')
+    # end def pretty
+# end class Pretty_Printer
+
+def cleantag (tag) :
+    """ Tag with the namespace prefix instead of the namespace """
+    return ':'.join (split_tag (tag))
+# end def cleantag
@@ -0,0 +1,623 @@
+#!/usr/bin/env python
+# Copyright (C) 2008-20 Dr. Ralf Schlatterbeck Open Source Consulting.
+# Reichergasse 131, A-3411 Weidling.
+# Web: http://www.runtux.com Email: office@runtux.com
+# All rights reserved
+# ****************************************************************************
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+# ****************************************************************************
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import json
+import os
+import time
+from io                      import BytesIO
+from threading               import Lock
+from multiprocessing         import Process, Pipe, TimeoutError
+try :
+    from queue               import Queue, Empty
+except ImportError :
+    from Queue               import Queue, Empty
+from http.server             import HTTPServer, BaseHTTPRequestHandler
+from socketserver            import ThreadingMixIn, UnixStreamServer
+from ooopy.autosuper         import autosuper
+from ooopy.OOoPy             import OOoPy
+from ooopy.Cache             import Template_Cache, Disk_Cache, Result_Cache
+from ooopy.Transformer       import Transformer
+import ooopy.Transforms      as     Transforms
+
+class Renderer (autosuper) :
+    """ Render jobs from warm templates. Templates are registered with
+        an id and are parsed once, they are re-read when the file
+        changes (see Template_Cache, by default the cache is not
+        limited). A job either replaces fields (a dict, like
+        ooo_fieldreplace) or does a mailmerge of a list of records
+        (like ooo_mailmerge, optionally with repeat regions and
+        evaluation of conditions). If a Result_Cache is given in
+        results, documents rendered by field replacement are cached.
+        The renderer counts jobs, errors and the time spent per
+        template, see metrics.
+
+        >>> r = Renderer (dict (rechng = 'testfiles/rechng.odt'))
+        >>> out = BytesIO ()
+        >>> r.render ('rechng', out, fields = {'address.firstname' : 'Erika'})
+        'application/vnd.oasis.opendocument.text'
+        >>> from ooopy.Text import paragraphs
+        >>> o = OOoPy (infile = out)
+        >>> print (list (paragraphs (o)) [3])
+        Dr. Erika Zahler
+        >>> o.close ()
+        >>> records = [{'address.firstname' : n} for n in ('Erika', 'Max')]
+        >>> out = BytesIO ()
+        >>> r.render ('rechng', out, records = records)
+        'application/vnd.oasis.opendocument.text'
+        >>> o = OOoPy (infile = out)
+        >>> sorted (set (p for p in paragraphs (o) if p.startswith ('Dr.')))
+        ['Dr. Erika Zahler', 'Dr. Max Zahler', 'Dr. VorName Abonnent']
+        >>> o.close ()
+        >>> try :
+        ...     r.render ('nonexisting', BytesIO ())
+        ... except KeyError as err :
+        ...     print (err)
+        'nonexisting'
+        >>> m = r.metrics ()
+        >>> print (m ['jobs'], m ['errors'], m ['templates']['rechng']['jobs'])
+        2 1 2
+
+        With a result cache, repeated field replacements are not
+        rendered again:
+
+        >>> import shutil
+        >>> r = renderer (dict (rechng = 'testfiles/rechng.odt')
+        ...              , result_dir = 'testout.cache'
+        ...              )
+        >>> for n in 'Erika', 'Max', 'Erika' :
+        ...     out = BytesIO ()
+        ...     f   = {'address.firstname' : n}
+        ...     mt  = r.render ('rechng', out, fields = f)
+        ...     o   = OOoPy (infile = out)
+        ...     print (list (paragraphs (o)) [3])
+        ...     o.close ()
+        Dr. Erika Zahler
+        Dr. Max Zahler
+        Dr. Erika Zahler
+        >>> m = r.metrics ()
+        >>> print (m ['jobs'], m ['results']['hits'], m ['results']['misses'])
+        3 1 2
+        >>> shutil.rmtree ('testout.cache')
+    """
+
+    def __init__ (self, templates = None, cache = None, results = None) :
+        self.filenames = {}
+        self.cache     = cache or Template_Cache (max_bytes = None)
+        self.results   = results
+        self.lock      = Lock ()
+        self.counts    = dict.fromkeys \
+            (('jobs', 'errors', 'timeouts', 'busy'), 0)
+        self.seconds   = 0.0
+        self.per_tpl   = {}
+        self.started   = time.time ()
+        for id, filename in sorted ((templates or {}).items ()) :
+            self.add (id, filename)
+    # end def __init__
+
+    def add (self, id, filename) :
+        """ Register (and parse) template with the given id """
+        self.filenames [id] = filename
+        self.template (id)
+    # end def add
+
+    def template (self, id) :
+        """ Get template by id, (re-)read it if necessary """
+        return self.cache.get (self.filenames [id])
+    # end def template
+
+    def transformer (self, mimetype, fields = None, records = None, ** kw) :
+        """ Create the Transformer for a job """
+        if records is not None :
+            return Transformer \
+                ( mimetype
+                , Transforms.get_meta           (mimetype)
+                , Transforms.Addpagebreak_Style ()
+                , Transforms.Mailmerge
+                    ( iterator   = records
+                    , repeat     = kw.get ('repeat', ())
+                    , conditions = kw.get ('conditions', False)
+                    )
+                , Transforms.renumber_all
+                    (mimetype, only_duplicates = kw.get ('only_duplicates'))
+                , Transforms.set_meta           (mimetype)
+                , Transforms.Fix_OOo_Tag        ()
+                )
+        return Transformer \
+            ( mimetype
+            , Transforms.Editinfo      ()
+            , Transforms.Field_Replace
+                (replace = fields or {}, repeat = kw.get ('repeat', ()))
+            , Transforms.Fix_OOo_Tag   ()
+            )
+    # end def transformer
+
+    def render (self, id, outfile, fields = None, records = None, ** kw) :
+        """ Render the template with the given id to outfile (a file
+            name or a file-like object that need not be seekable), the
+            keyword arguments are passed to transformer. Returns the
+            mimetype of the document.
+        """
+        start = self.begin ()
+        try :
+            t  = self.template (id)
+            tr = self.transformer (t.mimetype, fields, records, ** kw)
+            if self.results and records is None :
+                config = sorted (kw.items ())
+                self.results.transform (tr, t, outfile, config = config)
+            else :
+                o = t.open (outfile)
+                try :
+                    tr.transform (o)
+                finally :
+                    o.close ()
+        except Exception :
+            self.account (id, start, 'errors')
+            raise
+        self.account (id, start)
+        return t.mimetype
+    # end def render
+
+    def begin (self) :
+        """ Count a started job, returns the start time """
+        with self.lock :
+            self.counts ['busy'] += 1
+        return time.time ()
+    # end def begin
+
+    def account (self, id, start, error = None) :
+        """ Update the statistics for a finished job """
+        with self.lock :
+            self.counts ['busy'] -= 1
+            if error :
+                self.counts [error] += 1
+                return
+            elapsed = time.time () - start
+            self.counts ['jobs'] += 1
+            self.seconds += elapsed
+            s = self.per_tpl.setdefault (id, dict (jobs = 0, seconds = 0.0))
+            s ['jobs']    += 1
+            s ['seconds'] += elapsed
+    # end def account
+
+    def metrics (self) :
+        with self.lock :
+            m = dict (self.counts)
+            m ['seconds']   = self.seconds
+            m ['uptime']    = time.time () - self.started
+            m ['templates'] = dict \
+                ((k, dict (v)) for k, v in self.per_tpl.items ())
+        m ['cache'] = self.cache.stats ()
+        if self.results :
+            m ['results'] = self.results.stats ()
+        return m
+    # end def metrics
+# end class Renderer
+
+def renderer (templates, cache_dir = None, result_dir = None) :
+    """ Renderer with an unbounded Template_Cache, if cache_dir is
+        given, parsed templates are stored there, e.g., for the next
+        start of the server or for new worker processes. If result_dir
+        is given, results of field replacement are cached there.
+    """
+    disk = results = None
+    if cache_dir :
+        disk = Disk_Cache (cache_dir)
+    if result_dir :
+        results = Result_Cache (result_dir)
+    cache = Template_Cache (max_bytes = None, disk = disk)
+    return Renderer (templates, cache, results)
+# end def renderer
+
+# The renderer of a worker process of a Render_Pool
+_renderer = None
+
+def _init_worker (templates, cache_dir, result_dir) :
+    global _renderer
+    _renderer = renderer (templates, cache_dir, result_dir)
+# end def _init_worker
+
+def _render_job (args) :
+    id, kw = args
+    out = BytesIO ()
+    mt  = _renderer.render (id, out, ** kw)
+    return mt, out.getvalue ()
+# end def _render_job
+
+def _worker (conn, templates, cache_dir, result_dir) :
+    """ Main loop of a worker process of a Render_Pool: Receives jobs
+        on conn and sends back a flag (True for success) and the result
+        or the error. None stops the worker.
+    """
+    _init_worker (templates, cache_dir, result_dir)
+    while True :
+        try :
+            job = conn.recv ()
+        except EOFError :
+            break
+        if job is None :
+            break
+        try :
+            result = (True, _render_job (job))
+        except Exception as err :
+            result = (False, err)
+        try :
+            conn.send (result)
+        except Exception :
+            # e.g., an exception that can't be pickled
+            conn.send ((False, RuntimeError (str (result [1]))))
+# end def _worker
+
+class Render_Pool (autosuper) :
+    """ Pool of worker processes each holding warm copies of the
+        templates. A job that does not finish in timeout seconds
+        (including the time waiting for a free worker) is reported
+        with a TimeoutError, the worker running the job is terminated
+        and replaced by a new one, so stuck jobs don't occupy the pool.
+        Render_Pool may be used by several threads.
+
+        >>> p = Render_Pool \\
+        ...     (dict (test = 'testfiles/test.odt'), jobs = 1, timeout = 5)
+        >>> mt, data = p.render ('test', fields = {})
+        >>> print (mt, data [:2] == b'PK')
+        application/vnd.oasis.opendocument.text True
+        >>> p.close ()
+
+        A job that takes too long (a mailmerge of many records) is
+        stopped, the pool still works afterwards:
+
+        >>> p = Render_Pool \\
+        ...     (dict (test = 'testfiles/test.odt'), jobs = 1, timeout = 1)
+        >>> start = time.time ()
+        >>> try :
+        ...     p.render ('test', records = [{}] * 1000000)
+        ... except TimeoutError :
+        ...     print ("Timeout")
+        Timeout
+        >>> time.time () - start < 10
+        True
+        >>> mt, data = p.render ('test', fields = {})
+        >>> print (data [:2] == b'PK')
+        True
+        >>> p.close ()
+    """
+
+    def __init__ \
+        ( self
+        , templates
+        , jobs
+        , timeout    = None
+        , cache_dir  = None
+        , result_dir = None
+        ) :
+        self.templates = templates
+        self.timeout   = timeout
+        self.args      = (templates, cache_dir, result_dir)
+        self.jobs      = jobs
+        self.idle      = Queue ()
+        for n in range (jobs) :
+            self.idle.put (self._start ())
+    # end def __init__
+
+    def _start (self) :
+        """ Start a worker process, returns process and connection """
+        conn, child = Pipe ()
+        process     = Process (target = _worker, args = (child,) + self.args)
+        process.daemon = True
+        process.start ()
+        child.close ()
+        return process, conn
+    # end def _start
+
+    def _stop (self, worker) :
+        process, conn = worker
+        process.terminate ()
+        process.join ()
+        conn.close ()
+    # end def _stop
+
+    def render (self, id, ** kw) :
+        """ Returns mimetype and content of the rendered document """
+        if id not in self.templates :
+            raise KeyError (id)
+        end = None
+        if self.timeout is not None :
+            end = time.time () + self.timeout
+        try :
+            worker = self.idle.get (timeout = self.timeout)
+        except Empty :
+            raise TimeoutError ("No free worker")
+        try :
+            process, conn = worker
+            conn.send ((id, kw))
+            if not conn.poll (None if end is None else end - time.time ()) :
+                self._stop (worker)
+                worker = self._start ()
+                raise TimeoutError ("Job timed out")
+            try :
+                ok, result = conn.recv ()
+            except EOFError :
+                # Worker died
+                self._stop (worker)
+                worker = self._start ()
+                raise RuntimeError ("Worker process died")
+        finally :
+            self.idle.put (worker)
+        if not ok :
+            raise result
+        return result
+    # end def render
+
+    def close (self) :
+        """ Stop the workers after they finished their current job """
+        for n in range (self.jobs) :
+            process, conn = self.idle.get ()
+            conn.send (None)
+            process.join ()
+            conn.close ()
+    # end def close
+# end class Render_Pool
+
+class _Lazy_Writer (autosuper) :
+    """ Write-only file calling start before the first write, e.g., to
+        send HTTP headers only when the document is produced. Has no
+        tell method, so zipfile treats it as unseekable.
+    """
+
+    def __init__ (self, file, start) :
+        self.file    = file
+        self.start   = start
+        self.written = 0
+    # end def __init__
+
+    def write (self, data) :
+        if not self.written :
+            self.start ()
+        self.written += len (data)
+        return self.file.write (data)
+    # end def write
+
+    def flush (self) :
+        if self.written :
+            self.file.flush ()
+    # end def flush
+# end class _Lazy_Writer
+
+class Render_Handler (BaseHTTPRequestHandler, autosuper) :
+    """ HTTP interface of the render server:
+
+        - POST /render/<template-id> with a JSON object containing
+          either fields (an object) or records (a list of objects) and
+          optionally repeat (list of keys of repeat regions),
+          conditions and only_duplicates (booleans) returns the
+          rendered document
+        - GET /health returns a short status
+        - GET /metrics returns job counts and timings
+
+        Documents are streamed to the client if the server renders in
+        process (no worker pool), there is no Content-Length then and
+        the connection is closed after the document.
+    """
+    server_version = 'ooo_server'
+
+    def address_string (self) :
+        # Unix domain sockets don't have a client address
+        if isinstance (self.client_address, tuple) :
+            return self.client_address [0]
+        return 'local'
+    # end def address_string
+
+    def log_message (self, format, * args) :
+        if not self.server.quiet :
+            self.__super.log_message (format, * args)
+    # end def log_message
+
+    def reply (self, code, data, content_type = 'application/json') :
+        if not isinstance (data, bytes) :
+            data = (json.dumps (data, sort_keys = True) + '\n') \
+                .encode ('utf-8')
+        self.send_response (code)
+        self.send_header ('Content-Type',   content_type)
+        self.send_header ('Content-Length', str (len (data)))
+        self.end_headers ()
+        self.wfile.write (data)
+    # end def reply
+
+    def do_GET (self) :
+        if self.path == '/health' :
+            n = len (self.server.templates)
+            self.reply (200, dict (status = 'ok', templates = n))
+        elif self.path == '/metrics' :
+            self.reply (200, self.server.renderer.metrics ())
+        else :
+            self.reply (404, dict (error = 'Not found: %s' % self.path))
+    # end def do_GET
+
+    def do_POST (self) :
+        prefix = '/render/'
+        if not self.path.startswith (prefix) :
+            return self.reply (404, dict (error = 'Not found: %s' % self.path))
+        id     = self.path [len (prefix):]
+        length = int (self.headers.get ('Content-Length') or 0)
+        try :
+            body = self.rfile.read (length).decode ('utf-8')
+            job  = json.loads (body or '{}')
+            if not isinstance (job, dict) :
+                raise ValueError ("Job must be a JSON object")
+            kw  = dict \
+                ( (k, job [k])
+                  for k in ('fields', 'records', 'repeat', 'conditions'
+                           , 'only_duplicates'
+                           )
+                  if k in job
+                )
+        except (ValueError, TypeError) as err :
+            return self.reply (400, dict (error = str (err)))
+        if id not in self.server.templates :
+            return self.reply (404, dict (error = 'No template: %s' % id))
+        if self.server.pool :
+            self.render_pool (id, kw)
+        else :
+            self.render_stream (id, kw)
+    # end def do_POST
+
+    def render_pool (self, id, kw) :
+        start = self.server.renderer.begin ()
+        try :
+            mt, data = self.server.pool.render (id, ** kw)
+        except TimeoutError :
+            self.server.renderer.account (id, start, 'timeouts')
+            return self.reply (504, dict (error = 'Timeout'))
+        except Exception as err :
+            self.server.renderer.account (id, start, 'errors')
+            return self.reply (500, dict (error = str (err) or repr (err)))
+        self.server.renderer.account (id, start)
+        self.reply (200, data, mt)
+    # end def render_pool
+
+    def render_stream (self, id, kw) :
+        mt = self.server.renderer.template (id).mimetype
+        def start () :
+            self.send_response (200)
+            self.send_header ('Content-Type', mt)
+            self.send_header ('Connection',   'close')
+            self.end_headers ()
+        out = _Lazy_Writer (self.wfile, start)
+        try :
+            self.server.renderer.render (id, out, ** kw)
+        except Exception as err :
+            if out.written :
+                # Headers are sent, all we can do is drop the connection
+                self.close_connection = True
+                raise
+            self.reply (500, dict (error = str (err) or repr (err)))
+        self.close_connection = True
+    # end def render_stream
+# end class Render_Handler
+
+class Render_Server_Mixin (ThreadingMixIn, autosuper) :
+    daemon_threads = True
+
+    def setup_renderer \
+        ( self
+        , templates
+        , jobs       = 1
+        , timeout    = None
+        , quiet      = False
+        , cache_dir  = None
+        , result_dir = None
+        ) :
+        """ With jobs <= 1 rendering is done in the request threads
+            (each job has its own Transformer, the templates are
+            shared), otherwise jobs are passed to a pool of worker
+            processes.
+            The renderer of the server process is used for the
+            statistics, with a pool it does not parse the templates.
+            For cache_dir and result_dir see the renderer function.
+        """
+        if timeout is not None and jobs <= 1 :
+            raise ValueError ("A timeout needs worker processes (jobs > 1)")
+        self.templates = templates
+        self.quiet     = quiet
+        self.pool      = None
+        if jobs > 1 :
+            self.renderer = Renderer ()
+            self.pool     = Render_Pool \
+                (templates, jobs, timeout, cache_dir, result_dir)
+        else :
+            self.renderer = renderer (templates, cache_dir, result_dir)
+    # end def setup_renderer
+
+    def server_close (self) :
+        self.__super.server_close ()
+        if self.pool :
+            self.pool.close ()
+    # end def server_close
+# end class Render_Server_Mixin
+
+class Render_Server (Render_Server_Mixin, HTTPServer) :
+    """ Render server on a TCP port (default: localhost only), the
+        templates are given as a dict of id to filename, for the other
+        options see setup_renderer.
+
+        >>> from threading import Thread
+        >>> from http.client import HTTPConnection
+        >>> s = Render_Server \\
+        ...     (dict (rechng = 'testfiles/rechng.odt'), quiet = True)
+        >>> th = Thread (target = s.serve_forever)
+        >>> th.start ()
+        >>> def request (method, path, body = None) :
+        ...     c = HTTPConnection (* s.server_address)
+        ...     c.request (method, path, body)
+        ...     r = c.getresponse ()
+        ...     data = r.read ()
+        ...     c.close ()
+        ...     return r.status, r.getheader ('Content-Type'), data
+        >>> request ('GET', '/health')
+        (200, 'application/json', b'{"status": "ok", "templates": 1}\\n')
+        >>> body = json.dumps (dict (fields = {'address.firstname' : 'Erika'}))
+        >>> status, mt, data = request ('POST', '/render/rechng', body)
+        >>> print (status, mt)
+        200 application/vnd.oasis.opendocument.text
+        >>> from ooopy.Text import paragraphs
+        >>> o = OOoPy (infile = BytesIO (data))
+        >>> print (list (paragraphs (o)) [3])
+        Dr. Erika Zahler
+        >>> o.close ()
+        >>> request ('POST', '/render/nonexisting', body) [0]
+        404
+        >>> request ('POST', '/render/rechng', '{') [0]
+        400
+        >>> m = json.loads (request ('GET', '/metrics') [2].decode ('utf-8'))
+        >>> print (m ['jobs'], m ['errors'], m ['busy'])
+        1 0 0
+        >>> s.shutdown ()
+        >>> s.server_close ()
+        >>> th.join ()
+    """
+
+    def __init__ (self, templates, address = ('127.0.0.1', 0), ** kw) :
+        self.__super.__init__ (address, Render_Handler)
+        self.setup_renderer (templates, ** kw)
+    # end def __init__
+# end class Render_Server
+
+class Unix_Render_Server (Render_Server_Mixin, UnixStreamServer) :
+    """ Render server on a Unix domain socket, speaks HTTP like
+        Render_Server. An existing socket file is removed.
+    """
+
+    def __init__ (self, templates, path, ** kw) :
+        if os.path.exists (path) :
+            os.unlink (path)
+        self.path = path
+        self.__super.__init__ (path, Render_Handler)
+        self.setup_renderer (templates, ** kw)
+    # end def __init__
+
+    def server_close (self) :
+        self.__super.server_close ()
+        if os.path.exists (self.path) :
+            os.unlink (self.path)
+    # end def server_close
+# end class Unix_Render_Server
@@ -0,0 +1,1600 @@
+#!/usr/bin/env python
+# Copyright (C) 2007-20 Dr. Ralf Schlatterbeck Open Source Consulting.
+# Reichergasse 131, A-3411 Weidling.
+# Web: http://www.runtux.com Email: office@runtux.com
+# All rights reserved
+# ****************************************************************************
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+# ****************************************************************************
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import re
+from array                   import array
+from bisect                  import bisect_right
+from copy                    import deepcopy
+from datetime                import date
+from datetime                import datetime
+from decimal                 import Decimal
+from numbers                 import Number
+from io                      import BytesIO
+try :
+    from xml.etree.ElementTree   import Element, SubElement
+except ImportError :
+    from elementtree.ElementTree import Element, SubElement
+from xml.sax.saxutils        import escape, quoteattr, unescape
+from xml.parsers.expat       import ParserCreate
+from ooopy.autosuper         import autosuper
+from ooopy.OOoPy             import OOoElementTree, mimetypes
+from ooopy.Transformer       import OOo_Tag, namespace_by_name
+try :
+    import numpy
+except ImportError :
+    numpy = None
+
+# Converters for typed cells: Each gets the text of a cell and the
+# decimal point and returns the serialised cell or None if the text
+# doesn't match the type.
+
+_number  = r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?'
+_float   = re.compile (r'^%s$' % _number)
+_percent = re.compile (r'^(%s)\s*%%$' % _number)
+_date    = re.compile \
+    (r'^(\d{4})-(\d\d)-(\d\d)(?:[T ](\d\d):(\d\d)(?::(\d\d)(\.\d+)?)?)?$')
+_cell    = '<table:table-cell office:value-type="%s"%s>' \
+           '<text:p>%s</text:p></table:table-cell>'
+
+def cell_string (text, decimal = '.') :
+    return _cell % ('string', '', escape (text))
+# end def cell_string
+
+def cell_float (text, decimal = '.') :
+    t = text.strip ()
+    if decimal != '.' :
+        t = t.replace (decimal, '.')
+    if not _float.match (t) :
+        return None
+    return _cell % ('float', ' office:value="%s"' % t, escape (text))
+# end def cell_float
+
+def cell_percentage (text, decimal = '.') :
+    t = text.strip ()
+    if decimal != '.' :
+        t = t.replace (decimal, '.')
+    m = _percent.match (t)
+    if not m :
+        return None
+    v = Decimal (m.group (1)).scaleb (-2)
+    return _cell % \
+        ( 'percentage'
+        , ' table:style-name="ce1" office:value="%s"' % v
+        , escape (text)
+        )
+# end def cell_percentage
+
+def cell_date (text, decimal = '.') :
+    t = text.strip ()
+    m = _date.match (t)
+    if not m :
+        return None
+    try :
+        datetime (* (int (x) for x in m.groups () [:6] if x is not None))
+    except ValueError :
+        return None
+    t = t.replace (' ', 'T')
+    return _cell % \
+        ( 'date'
+        , ' table:style-name="ce2" office:date-value="%s"' % t
+        , escape (text)
+        )
+# end def cell_date
+
+def cell_boolean (text, decimal = '.') :
+    t = text.strip ().lower ()
+    if t not in ('true', 'false') :
+        return None
+    return _cell % ('boolean', ' office:boolean-value="%s"' % t, escape (text))
+# end def cell_boolean
+
+def column_index (column) :
+    """ Convert column letters (or an integer index) to a 0-based index
+
+        >>> print (column_index ('A'), column_index ('z'), column_index (3))
+        0 25 3
+        >>> print (column_index ('AA'), column_index ('XFD'))
+        26 16383
+    """
+    if isinstance (column, int) :
+        return column
+    n = 0
+    for c in column.upper () :
+        n = n * 26 + ord (c) - ord ('A') + 1
+    return n - 1
+# end def column_index
+
+cell_types = dict \
+    ( string     = cell_string
+    , float      = cell_float
+    , percentage = cell_percentage
+    , date       = cell_date
+    , boolean    = cell_boolean
+    )
+# Order in which types are tried when inferring the type
+inference_order = ('boolean', 'float', 'percentage', 'date')
+
+class Spreadsheet_Writer (autosuper) :
+    """ Write a spreadsheet (content.xml and manifest) to the output
+        archive of the given OOoPy object without building an element
+        tree: Each row is serialised and streamed into the compressed
+        content.xml member as soon as it is written, memory usage does
+        not depend on the number of rows. Rows are sequences of strings,
+        e.g., from a csv reader. If no sheet was started with add_sheet,
+        the first row starts a sheet named "Sheet1". The content.xml is
+        finished and the manifest written on close, after that the
+        OOoPy object must be closed to finish the archive.
+
+        Runs of identical cells in a row and of identical rows are
+        written only once with table:number-columns-repeated and
+        table:number-rows-repeated, respectively; empty cells at the
+        end of a row are omitted.
+
+        By default all cells are strings. The types parameter enables
+        typed cells (float, percentage, date, boolean): It is either a
+        list of type names per column (see cell_types, missing columns
+        are strings) or 'auto' for inferring the type. Without sample
+        the type is inferred for each cell. With sample the type of each
+        column is inferred from the first sample rows (after header
+        rows) of each sheet, only these rows are kept in memory: The
+        first of the types in inference_order matching all non-empty
+        cells of a column in the sample is used, cells later not
+        matching the type of their column are written as strings. The
+        first header rows of each sheet are always strings. Numbers may
+        use a different decimal point.
+
+        >>> from ooopy.OOoPy import OOoPy
+        >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+        >>> w = Spreadsheet_Writer (o)
+        >>> w.write_row (['Name', 'Value'])
+        >>> w.write_rows ([['a < b', '1'], ['"x" & y', '']])
+        >>> w.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.ods')
+        >>> print (o.mimetype)
+        application/vnd.oasis.opendocument.spreadsheet
+        >>> for n in o.izip.namelist () :
+        ...     print (n)
+        mimetype
+        content.xml
+        META-INF/manifest.xml
+        >>> mt    = o.mimetype
+        >>> root  = o.read ('content.xml').getroot ()
+        >>> for t in root.iter (OOo_Tag ('table', 'table', mt)) :
+        ...     print (t.get (OOo_Tag ('table', 'name', mt)))
+        ...     for row in t :
+        ...         print ([c [0].text for c in row])
+        Sheet1
+        ['Name', 'Value']
+        ['a < b', '1']
+        ['"x" & y']
+        >>> m = o.read ('META-INF/manifest.xml').getroot ()
+        >>> for e in m :
+        ...     print (e.get (OOo_Tag ('manifest', 'full-path', mt)))
+        /
+        content.xml
+        styles.xml
+        >>> o.close ()
+
+        Typed cells, repeated cells and rows, several sheets:
+
+        >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+        >>> w = Spreadsheet_Writer (o, types = 'auto', sample = 2, header = 1)
+        >>> w.add_sheet ('Typed')
+        >>> w.write_row (['n', 'p', 'd', 'b', 's'])
+        >>> w.write_row (['1.5', '15 %', '2020-02-29', 'TRUE', 'x'])
+        >>> w.write_row (['-2', '', '2020-03-01 12:00', 'false', '1'])
+        >>> w.write_row (['x', '1%', '2020-02-30', 'true', '2'])
+        >>> w.add_sheet ('Sparse')
+        >>> w.write_rows ([['', '', 'a', 'a', 'a', '', '']] * 3)
+        >>> w.write_rows ([[]] * 2)
+        >>> w.write_row  (['1', '1'])
+        >>> w.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.ods')
+        >>> root = o.read ('content.xml').getroot ()
+        >>> def a (e, ns, name) :
+        ...     return e.get (OOo_Tag (ns, name, mt))
+        >>> for t in root.iter (OOo_Tag ('table', 'table', mt)) :
+        ...     print (a (t, 'table', 'name'))
+        ...     for row in t :
+        ...         print (a (row, 'table', 'number-rows-repeated'))
+        ...         for c in row :
+        ...             v = a (c, 'office', 'value-type')
+        ...             print ( ' '
+        ...                 , a (c, 'table', 'number-columns-repeated')
+        ...                 , v
+        ...                 , v and a (c, 'office', 'value')
+        ...                 , v and a (c, 'office', 'date-value')
+        ...                 , v and a (c, 'office', 'boolean-value')
+        ...                 , v and c [0].text
+        ...                 )
+        Typed
+        None
+          None string None None None n
+          None string None None None p
+          None string None None None d
+          None string None None None b
+          None string None None None s
+        None
+          None float 1.5 None None 1.5
+          None percentage 0.15 None None 15 %
+          None date None 2020-02-29 None 2020-02-29
+          None boolean None None true TRUE
+          None string None None None x
+        None
+          None float -2 None None -2
+          None None None None None None
+          None date None 2020-03-01T12:00 None 2020-03-01 12:00
+          None boolean None None false false
+          None string None None None 1
+        None
+          None string None None None x
+          None percentage 0.01 None None 1%
+          None string None None None 2020-02-30
+          None boolean None None true true
+          None string None None None 2
+        Sparse
+        3
+          2 None None None None None
+          3 string None None None a
+        2
+          None None None None None None
+        None
+          2 string None None None 1
+        >>> o.close ()
+
+        Without sample the type of each cell is inferred, a decimal
+        comma may be used:
+
+        >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+        >>> w = Spreadsheet_Writer (o, types = 'auto', decimal = ',')
+        >>> w.write_row (['1,5', 'false', '2,5%', '2020-01-01', 'a,b'])
+        >>> w.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.ods')
+        >>> root = o.read ('content.xml').getroot ()
+        >>> for c in root.iter (OOo_Tag ('table', 'table-cell', mt)) :
+        ...     print (a (c, 'office', 'value-type'), c [0].text)
+        float 1,5
+        boolean false
+        percentage 2,5%
+        date 2020-01-01
+        string a,b
+        >>> o.close ()
+    """
+
+    namespaces = ('office', 'style', 'table', 'text', 'number')
+    styles     = \
+        ( '<office:automatic-styles>'
+          '<number:percentage-style style:name="N1">'
+          '<number:number number:min-integer-digits="1"/>'
+          '<number:text>%</number:text>'
+          '</number:percentage-style>'
+          '<number:date-style style:name="N2">'
+          '<number:year number:style="long"/><number:text>-</number:text>'
+          '<number:month number:style="long"/><number:text>-</number:text>'
+          '<number:day number:style="long"/>'
+          '</number:date-style>'
+          '<style:style style:name="ce1" style:family="table-cell"'
+          ' style:data-style-name="N1"/>'
+          '<style:style style:name="ce2" style:family="table-cell"'
+          ' style:data-style-name="N2"/>'
+          '</office:automatic-styles>'
+        )
+    empty_cell = '<table:table-cell/>'
+    empty_row  = '<table:table-row>' + empty_cell + '</table:table-row>'
+
+    def __init__ \
+        ( self
+        , ooopy
+        , types   = None
+        , sample  = 0
+        , header  = 0
+        , decimal = '.'
+        , bufsize = 65536
+        ) :
+        self.ooopy   = ooopy
+        self.mt      = ooopy.mimetype
+        self.types   = types
+        self.sample  = sample
+        self.header  = header
+        self.decimal = decimal
+        self.bufsize = bufsize
+        self.buf     = []
+        self.size    = 0
+        self.sheet   = None
+        self.converters = None
+        if types is not None and types != 'auto' :
+            self.converters = [cell_types [t] for t in types]
+        self._start ()
+    # end def __init__
+
+    def add_sheet (self, name) :
+        """ Start a new sheet (table) with the given name, a previously
+            written sheet is finished.
+        """
+        if self.sheet is not None :
+            self._end_sheet ()
+        self.sheet    = name
+        self.rows     = 0
+        self.last_row = None
+        self.repeat   = 0
+        self.pending  = []
+        if self.sample and self.types == 'auto' :
+            self.converters = None
+        self._out ('<table:table table:name=%s>' % quoteattr (name))
+    # end def add_sheet
+
+    def write_row (self, row) :
+        if self.sheet is None :
+            self.add_sheet ('Sheet1')
+        self.rows += 1
+        if self.rows <= self.header :
+            self._row (self._strings (row))
+        elif self.types == 'auto' and self.converters is None :
+            if not self.sample :
+                self._row ([self._infer (c) for c in row])
+            else :
+                self.pending.append (row)
+                if len (self.pending) >= self.sample :
+                    self._infer_columns ()
+        elif self.converters :
+            self._row (self._convert (row))
+        else :
+            self._row (self._strings (row))
+    # end def write_row
+
+    def write_rows (self, rows) :
+        for row in rows :
+            self.write_row (row)
+    # end def write_rows
+
+    def close (self) :
+        """ Finish content.xml and write the manifest """
+        if self.sheet is None :
+            self.add_sheet ('Sheet1')
+        self._end_sheet ()
+        self._out ('</office:spreadsheet></office:body>')
+        self._out ('</office:document-content>')
+        self._flush ()
+        self.file.close ()
+        self.write_manifest ()
+    # end def close
+
+    def _start (self) :
+        ns = namespace_by_name [self.mt]
+        decl = ''.join \
+            (' xmlns:%s=%s' % (n, quoteattr (ns [n])) for n in self.namespaces)
+        # The size is not known in advance, the sheet may exceed 2GiB
+        self.file = self.ooopy.open ('content.xml', 'w', force_zip64 = True)
+        self._out \
+            ( "<?xml version='1.0' encoding='UTF-8'?>\n"
+              '<office:document-content%s office:version="1.2">%s'
+              '<office:body><office:spreadsheet>' % (decl, self.styles)
+            )
+    # end def _start
+
+    def _convert (self, row) :
+        """ Convert row with the column converters """
+        conv = self.converters
+        cells = []
+        for n, c in enumerate (row) :
+            if not c :
+                cells.append (None)
+                continue
+            cell = None
+            if n < len (conv) :
+                cell = conv [n] (c, self.decimal)
+            cells.append (cell or cell_string (c))
+        return cells
+    # end def _convert
+
+    def _end_sheet (self) :
+        if self.pending :
+            self._infer_columns ()
+        self._flush_rows ()
+        self._out ('</table:table>')
+    # end def _end_sheet
+
+    def _flush_rows (self) :
+        if self.repeat > 1 :
+            self._out \
+                ( '<table:table-row table:number-rows-repeated="%d"%s'
+                % (self.repeat, self.last_row [len ('<table:table-row'):])
+                )
+        elif self.repeat :
+            self._out (self.last_row)
+        self.repeat = 0
+    # end def _flush_rows
+
+    def _infer (self, text) :
+        if not text :
+            return None
+        for t in inference_order :
+            cell = cell_types [t] (text, self.decimal)
+            if cell :
+                return cell
+        return cell_string (text)
+    # end def _infer
+
+    def _infer_columns (self) :
+        """ Infer column types from pending rows and write them """
+        ncol = max (len (r) for r in self.pending)
+        conv = []
+        for n in range (ncol) :
+            values = [r [n] for r in self.pending if n < len (r) and r [n]]
+            for t in inference_order :
+                f = cell_types [t]
+                if values and all (f (v, self.decimal) for v in values) :
+                    conv.append (f)
+                    break
+            else :
+                conv.append (cell_string)
+        self.converters = conv
+        for r in self.pending :
+            self._row (self._convert (r))
+        self.pending = []
+    # end def _infer_columns
+
+    def _strings (self, row) :
+        return [c and cell_string (c) or None for c in row]
+    # end def _strings
+
+    def _row (self, cells) :
+        """ Serialise row from list of serialised cells (None for an
+            empty cell), runs of identical cells and rows are collapsed.
+        """
+        while cells and cells [-1] is None :
+            del cells [-1]
+        if not cells :
+            row = self.empty_row
+        else :
+            r    = ['<table:table-row>']
+            last = cells [0]
+            n    = 0
+            for c in cells + [False] :
+                if c == last :
+                    n += 1
+                    continue
+                cell = last or self.empty_cell
+                if n > 1 :
+                    cell = '<table:table-cell table:number-columns-repeated=' \
+                           '"%d"%s' % (n, cell [len ('<table:table-cell'):])
+                r.append (cell)
+                last = c
+                n    = 1
+            r.append ('</table:table-row>')
+            row = ''.join (r)
+        if row == self.last_row :
+            self.repeat += 1
+        else :
+            self._flush_rows ()
+            self.last_row = row
+            self.repeat   = 1
+    # end def _row
+
+    def write_manifest (self) :
+        mt    = self.mt
+        root  = Element \
+            ( OOo_Tag ('manifest', 'manifest', mt)
+            , { OOo_Tag ('manifest', 'version', mt) : '1.2' }
+            )
+        SubElement \
+            ( root, OOo_Tag ('manifest', 'file-entry', mt)
+            , { OOo_Tag ('manifest', 'media-type', mt) : mimetypes [2]
+              , OOo_Tag ('manifest', 'version', mt)    : '1.2'
+              , OOo_Tag ('manifest', 'full-path', mt)  : '/'
+              }
+            )
+        SubElement \
+            ( root, OOo_Tag ('manifest', 'file-entry', mt)
+            , { OOo_Tag ('manifest', 'media-type', mt) : 'text/xml'
+              , OOo_Tag ('manifest', 'full-path', mt)  : 'content.xml'
+              }
+            )
+        # OOo ignores missing styles.xml but it must be present in the
+        # manifest :-)
+        SubElement \
+            ( root, OOo_Tag ('manifest', 'file-entry', mt)
+            , { OOo_Tag ('manifest', 'media-type', mt) : 'text/xml'
+              , OOo_Tag ('manifest', 'full-path', mt)  : 'styles.xml'
+              }
+            )
+        tree = OOoElementTree (self.ooopy, 'META-INF/manifest.xml', root)
+        tree.write ()
+    # end def write_manifest
+
+    def _out (self, s) :
+        self.buf.append (s)
+        self.size += len (s)
+        if self.size >= self.bufsize :
+            self._flush ()
+    # end def _out
+
+    def _flush (self) :
+        if self.buf :
+            self.file.write (''.join (self.buf).encode ('utf-8'))
+        self.buf  = []
+        self.size = 0
+    # end def _flush
+# end class Spreadsheet_Writer
+
+class Spreadsheet_Appender (Spreadsheet_Writer) :
+    """ Append rows to a sheet of an existing spreadsheet: The given
+        OOoPy object must have an input and an output archive. The
+        content.xml of the input is not parsed, the sheet (the first
+        one or the one given by name or index) is located in the raw
+        bytes of the member. Rows are serialised like in
+        Spreadsheet_Writer (see there for the keyword arguments) and
+        spliced in at the end of the sheet, the rest of the member is
+        copied unchanged. The cost is proportional to the number of
+        appended rows plus one decompression and compression of the
+        raw member, the sheet is never parsed or serialised. If the
+        sheet ends in repeated empty rows (as written by OOo for
+        formatted but unused rows) the new rows are inserted before
+        them and their repeat count is reduced accordingly. Styles for
+        typed cells are added to the automatic styles if necessary
+        (under a different name if the document uses the names of
+        Spreadsheet_Writer for other styles). After close the OOoPy
+        object must be closed to copy the other members.
+
+        >>> from ooopy.OOoPy import OOoPy
+        >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+        >>> w = Spreadsheet_Writer (o)
+        >>> w.add_sheet ('Data')
+        >>> w.write_rows ([['a', '1'], ['b', '2']])
+        >>> w.add_sheet ('Log')
+        >>> w.write_row (['date', 'value'])
+        >>> w.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.ods', outfile = 'testout2.ods')
+        >>> w = Spreadsheet_Appender (o, sheet = 'Log', types = 'auto')
+        >>> w.write_rows ([['2020-02-29', '5%'], ['2020-03-01', '7%']])
+        >>> w.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout2.ods')
+        >>> for s in 'Data', 'Log' :
+        ...     print (list (Spreadsheet_Reader (o, sheet = s, typed = True)))
+        [('a', '1'), ('b', '2')]
+        [('date', 'value'), (datetime.date(2020, 2, 29), 0.05), (datetime.date(2020, 3, 1), 0.07)]
+        >>> o.close ()
+
+        A sheet ending in a million formatted empty rows and a document
+        using the style names ce1 and ce2 for something else:
+
+        >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+        >>> f = o.open ('content.xml', 'w')
+        >>> ns = namespace_by_name [mimetypes [2]]
+        >>> xml = \\
+        ...     ( '<office:document-content xmlns:office="%s"'
+        ...       ' xmlns:table="%s" xmlns:text="%s" xmlns:style="%s"'
+        ...       ' xmlns:number="%s"><office:automatic-styles>'
+        ...       '<style:style style:name="ce1"'
+        ...       ' style:family="table-cell"/>'
+        ...       '</office:automatic-styles><office:body>'
+        ...       '<office:spreadsheet><table:table table:name="S">'
+        ...       '<table:table-row><table:table-cell table:style-name="ce1">'
+        ...       '<text:p>x</text:p></table:table-cell></table:table-row>'
+        ...       '<table:table-row table:style-name="ro1"'
+        ...       ' table:number-rows-repeated="1048575">'
+        ...       '<table:table-cell table:number-columns-repeated="1024"/>'
+        ...       '</table:table-row>'
+        ...       '</table:table></office:spreadsheet></office:body>'
+        ...       '</office:document-content>'
+        ...     )
+        >>> xml = xml % tuple \\
+        ...     (ns [n] for n in 'office table text style number'.split ())
+        >>> n = f.write (xml.encode ('utf-8'))
+        >>> f.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.ods', outfile = 'testout2.ods')
+        >>> w = Spreadsheet_Appender (o, types = 'auto')
+        >>> w.write_rows ([['y', '50%']] * 3)
+        >>> w.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout2.ods')
+        >>> print (list (Spreadsheet_Reader (o, typed = True)))
+        [('x',), ('y', 0.5), ('y', 0.5), ('y', 0.5)]
+        >>> mt   = o.mimetype
+        >>> root = o.read ('content.xml').getroot ()
+        >>> for s in root.iter (OOo_Tag ('style', 'style', mt)) :
+        ...     print (s.get (OOo_Tag ('style', 'name', mt)))
+        ce1
+        OOoPy-ce1
+        OOoPy-ce2
+        >>> for r in root.iter (OOo_Tag ('table', 'table-row', mt)) :
+        ...     print (r.get (OOo_Tag ('table', 'number-rows-repeated', mt)))
+        ...     print (r [-1].get (OOo_Tag ('table', 'style-name', mt)))
+        None
+        ce1
+        3
+        OOoPy-ce1
+        1048572
+        None
+        >>> o.close ()
+
+        Appending to an empty sheet without a name:
+
+        >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+        >>> f = o.open ('content.xml', 'w')
+        >>> xml = \\
+        ...     ( '<office:document-content xmlns:office="%s"'
+        ...       ' xmlns:table="%s" xmlns:text="%s">'
+        ...       '<office:body><office:spreadsheet><table:table/>'
+        ...       '</office:spreadsheet></office:body>'
+        ...       '</office:document-content>'
+        ...     ) % (ns ['office'], ns ['table'], ns ['text'])
+        >>> n = f.write (xml.encode ('utf-8'))
+        >>> f.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.ods', outfile = 'testout2.ods')
+        >>> w = Spreadsheet_Appender (o)
+        >>> w.write_rows ([['a', 'b'], ['c']])
+        >>> w.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout2.ods')
+        >>> print (list (Spreadsheet_Reader (o)))
+        [('a', 'b'), ('c',)]
+        >>> o.close ()
+    """
+
+    table_re  = re.compile (br'<(/?)table:table(?=[\s/>])[^>]*>')
+    name_re   = re.compile \
+        (br'\stable:name\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+    row_re    = re.compile (br'<table:table-row(?=[\s/>])')
+    filler_re = re.compile \
+        ( br'<table:table-row\s[^>]*table:number-rows-repeated="(\d+)"[^>]*>'
+          br'(?:<table:table-cell(?:\s[^>]*)?/>)*</table:table-row>\s*$'
+        )
+    style_re  = re.compile (br'style:name="(?:N1|N2|ce1|ce2)"')
+
+    def __init__ (self, ooopy, sheet = None, ** kw) :
+        self.sheet_id = sheet
+        self.rename   = None
+        self.__super.__init__ (ooopy, ** kw)
+    # end def __init__
+
+    def add_sheet (self, name) :
+        raise ValueError ("Can only append to an existing sheet")
+    # end def add_sheet
+
+    def close (self) :
+        """ Write content.xml with the appended rows """
+        if self.pending :
+            self._infer_columns ()
+        self._flush_rows ()
+        self._flush ()
+        tail = self.tail
+        if self.filler :
+            start, end = self.filler
+            n = int (tail [start:end]) - self.rows
+            if n > 0 :
+                tail = tail [:start] + str (n).encode ('ascii') + tail [end:]
+            else :
+                tail = self.filler_re.sub (b'', tail, count = 1)
+        body = self.file.getvalue ()
+        size = len (self.head) + len (body) + len (tail)
+        f = self.ooopy.open \
+            ('content.xml', 'w', force_zip64 = size > 0x7fffffff)
+        f.write (self.head)
+        f.write (body)
+        f.write (tail)
+        f.close ()
+    # end def close
+
+    def _find_table (self, content) :
+        """ Return positions of start and end of the start tag and of
+            the end tag (None for an empty element) of the sheet.
+        """
+        depth = 0
+        n     = 0
+        found = None
+        for m in self.table_re.finditer (content) :
+            if m.group (1) :
+                depth -= 1
+                if not depth and found :
+                    return found + (m.start (),)
+                continue
+            empty = m.group (0).endswith (b'/>')
+            if not depth and not found :
+                name = self.name_re.search (m.group (0))
+                name = name and unescape \
+                    ( (name.group (1) or name.group (2)).decode ('utf-8')
+                    , {'&quot;' : '"', '&apos;' : "'"}
+                    )
+                if  (  self.sheet_id is None
+                    or self.sheet_id == n
+                    or self.sheet_id == name
+                    ) :
+                    found = (m.start (), m.end ())
+                    # A sheet is open (add_sheet is not called), the
+                    # sheet may have no name
+                    self.sheet = n if name is None else name
+                    if empty :
+                        return found + (None,)
+                n += 1
+            if not empty :
+                depth += 1
+        raise KeyError ("Sheet not found: %s" % self.sheet_id)
+    # end def _find_table
+
+    def _start (self) :
+        content = self.ooopy.izip.read ('content.xml')
+        start, end, close = self._find_table (content)
+        self.filler = None
+        if close is None :
+            content = content [:end - 2] + b'></table:table>' + content [end:]
+            split   = end - 1
+        else :
+            row = None
+            for m in self.row_re.finditer (content, end, close) :
+                row = m
+            filler = row and self.filler_re.match \
+                (content, row.start (), close)
+            if filler :
+                split       = row.start ()
+                self.filler = \
+                    (filler.start (1) - split, filler.end (1) - split)
+            else :
+                split = content.rfind (b'</table:table-row>', end, close)
+                if split < 0 :
+                    split = close
+                else :
+                    split += len (b'</table:table-row>')
+        head = content [:split]
+        if self.types is not None :
+            head = self._add_styles (head)
+        self.head     = head
+        self.tail     = content [split:]
+        self.file     = BytesIO ()
+        self.rows     = 0
+        self.last_row = None
+        self.repeat   = 0
+        self.pending  = []
+    # end def _start
+
+    def _add_styles (self, head) :
+        """ Add styles for typed cells to the automatic styles unless
+            already present, if the style names of Spreadsheet_Writer
+            are used for other styles, the styles are renamed.
+        """
+        styles = self.styles
+        inner  = styles [len ('<office:automatic-styles>'):]
+        inner  = inner  [:-len ('</office:automatic-styles>')]
+        if inner.encode ('utf-8') in head :
+            return head
+        if self.style_re.search (head) :
+            self.rename = {}
+            for name in 'N1', 'N2', 'ce1', 'ce2' :
+                new = '"OOoPy-%s"' % name
+                styles = styles.replace ('"%s"' % name, new)
+                self.rename ['"%s"' % name] = new
+            inner  = styles [len ('<office:automatic-styles>'):]
+            inner  = inner  [:-len ('</office:automatic-styles>')]
+            if inner.encode ('utf-8') in head :
+                return head
+        styles = styles.encode ('utf-8')
+        inner  = inner.encode ('utf-8')
+        if b'<office:automatic-styles/>' in head :
+            return head.replace (b'<office:automatic-styles/>', styles, 1)
+        if b'</office:automatic-styles>' in head :
+            return head.replace \
+                ( b'</office:automatic-styles>'
+                , inner + b'</office:automatic-styles>'
+                , 1
+                )
+        return head.replace (b'<office:body', styles + b'<office:body', 1)
+    # end def _add_styles
+
+    def _row (self, cells) :
+        if self.rename :
+            for n, c in enumerate (cells) :
+                if c and ' table:style-name="ce' in c :
+                    for old, new in self.rename.items () :
+                        c = c.replace \
+                            ( 'table:style-name=%s' % old
+                            , 'table:style-name=%s' % new
+                            )
+                    cells [n] = c
+        self.__super._row (cells)
+    # end def _row
+# end class Spreadsheet_Appender
+
+class _Sheet_Done (Exception) :
+    pass
+# end class _Sheet_Done
+
+class _Column_Loader (object) :
+    """ Expat handlers for Spreadsheet_Reader.columns: For speed these
+        work directly on the expat names ("uri}local") and attributes,
+        no events are generated.
+    """
+
+    numeric = set (('float', 'percentage', 'currency'))
+    nan     = float ('nan')
+
+    def __init__ (self, reader, columns, skip) :
+        def raw (name) :
+            return reader.tags [name][1:]
+        self.sheet   = reader.sheet
+        self.skip    = skip
+        self.idx     = set (column_index (c) for c in columns)
+        self.maxcol  = max (self.idx)
+        self.arrays  = dict ((i, array ('d')) for i in self.idx)
+        self.t_table = raw ('table')
+        self.t_row   = raw ('table-row')
+        self.t_cells = (raw ('table-cell'), raw ('covered-table-cell'))
+        self.a_name  = raw ('name')
+        self.a_ccnt  = raw ('number-columns-repeated')
+        self.a_rcnt  = raw ('number-rows-repeated')
+        self.a_vt    = raw ('value-type')
+        self.a_value = raw ('value')
+        self.a_bool  = raw ('boolean-value')
+        self.nsheet  = -1
+        self.level   = 0     # nesting level of tables, 1 = our sheet
+        self.erows   = 0     # pending empty rows
+    # end def __init__
+
+    def start (self, tag, attrib) :
+        if tag in self.t_cells :
+            if self.level != 1 :
+                return
+            n  = int (attrib.get (self.a_ccnt, 1))
+            vt = attrib.get (self.a_vt)
+            col = self.col
+            if vt is not None :
+                self.filled = True
+                if col <= self.maxcol :
+                    v = self.nan
+                    if vt in self.numeric :
+                        v = float (attrib [self.a_value])
+                    elif vt == 'boolean' :
+                        v = float (attrib [self.a_bool] == 'true')
+                    for i in self.idx :
+                        if col <= i < col + n :
+                            self.row [i] = v
+            self.col = col + n
+        elif tag == self.t_row :
+            if self.level != 1 :
+                return
+            self.rcount = int (attrib.get (self.a_rcnt, 1))
+            self.col    = 0
+            self.row    = {}
+            self.filled = False
+        elif tag == self.t_table :
+            if self.level :
+                self.level += 1
+                return
+            self.nsheet += 1
+            sheet = self.sheet
+            if  (  sheet is None and self.nsheet == 0
+                or sheet == self.nsheet
+                or sheet == attrib.get (self.a_name)
+                ) :
+                self.level = 1
+    # end def start
+
+    def end (self, tag) :
+        if tag == self.t_row :
+            if self.level != 1 :
+                return
+            rcount = self.rcount
+            if not self.filled :
+                self.erows += rcount
+                return
+            erows = self.erows
+            if self.skip :
+                k          = min (self.skip, erows)
+                self.skip -= k
+                erows     -= k
+                k          = min (self.skip, rcount)
+                self.skip -= k
+                rcount    -= k
+            row = self.row
+            nan = self.nan
+            for i, a in self.arrays.items () :
+                if erows :
+                    a.extend (array ('d', [nan]) * erows)
+                if rcount == 1 :
+                    a.append (row.get (i, nan))
+                elif rcount :
+                    a.extend (array ('d', [row.get (i, nan)]) * rcount)
+            self.erows = 0
+        elif tag == self.t_table :
+            if self.level == 1 :
+                raise _Sheet_Done ()
+            if self.level :
+                self.level -= 1
+    # end def end
+# end class _Column_Loader
+
+class Spreadsheet_Reader (autosuper) :
+    """ Streaming reader for the rows of a sheet (table:table) in the
+        content.xml of a spreadsheet. The member is processed as a
+        stream of parse events, rows are produced while parsing, memory
+        does not depend on the number of rows. Repeated cells and rows
+        (table:number-columns-repeated, table:number-rows-repeated) are
+        expanded lazily: Empty cells at the end of a row and empty rows
+        at the end of a sheet are dropped without ever being expanded,
+        so a sheet ending in a million empty formatted rows is no
+        problem.
+
+        With typed, the values are python objects according to the
+        office:value-type of the cell (float for float, percentage
+        and currency, date or datetime, bool, the string for time),
+        empty cells are None. Otherwise the values are the text of the
+        cells (paragraphs separated by newlines), empty cells are empty
+        strings. Rows are tuples, empty rows inside the sheet are empty
+        tuples.
+
+        >>> from ooopy.OOoPy import OOoPy
+        >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+        >>> w = Spreadsheet_Writer (o, types = 'auto', header = 1)
+        >>> w.add_sheet ('Data')
+        >>> w.write_row (['firstname', 'lastname', 'amount', 'date', 'paid'])
+        >>> w.write_rows ([['Erika', 'Mustermann', '12.5', '2020-02-29']] * 2)
+        >>> w.write_row (['Hugo', '', '3%', '2020-03-01 12:00', 'TRUE'])
+        >>> w.add_sheet ('Other')
+        >>> w.write_row (['x'])
+        >>> w.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.ods')
+        >>> r = Spreadsheet_Reader (o)
+        >>> r.sheets ()
+        ['Data', 'Other']
+        >>> for row in r :
+        ...     print (row)
+        ('firstname', 'lastname', 'amount', 'date', 'paid')
+        ('Erika', 'Mustermann', '12.5', '2020-02-29')
+        ('Erika', 'Mustermann', '12.5', '2020-02-29')
+        ('Hugo', '', '3%', '2020-03-01 12:00', 'TRUE')
+        >>> for row in Spreadsheet_Reader (o, sheet = 0, typed = True) :
+        ...     print (row)
+        ('firstname', 'lastname', 'amount', 'date', 'paid')
+        ('Erika', 'Mustermann', 12.5, datetime.date(2020, 2, 29))
+        ('Erika', 'Mustermann', 12.5, datetime.date(2020, 2, 29))
+        ('Hugo', None, 0.03, datetime.datetime(2020, 3, 1, 12, 0), True)
+        >>> print (list (Spreadsheet_Reader (o, sheet = 'Other')))
+        [('x',)]
+        >>> for d in Spreadsheet_Reader (o).dicts () :
+        ...     print (sorted (d.items ()))
+        [('amount', '12.5'), ('date', '2020-02-29'), ('firstname', 'Erika'), ('lastname', 'Mustermann'), ('paid', '')]
+        [('amount', '12.5'), ('date', '2020-02-29'), ('firstname', 'Erika'), ('lastname', 'Mustermann'), ('paid', '')]
+        [('amount', '3%'), ('date', '2020-03-01 12:00'), ('firstname', 'Hugo'), ('lastname', ''), ('paid', 'TRUE')]
+        >>> o.close ()
+
+        Huge repeat counts of empty cells and rows are not expanded,
+        a repeated row is not copied:
+
+        >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+        >>> f = o.open ('content.xml', 'w')
+        >>> ns = namespace_by_name [mimetypes [2]]
+        >>> xml = \\
+        ...     ( '<office:document-content xmlns:office="%s"'
+        ...       ' xmlns:table="%s" xmlns:text="%s"><office:body>'
+        ...       '<office:spreadsheet><table:table table:name="S">'
+        ...       '<table:table-row table:number-rows-repeated="1000000">'
+        ...       '<table:table-cell office:value-type="float"'
+        ...       ' office:value="1"><text:p>1</text:p></table:table-cell>'
+        ...       '<table:table-cell table:number-columns-repeated="9999"/>'
+        ...       '<table:table-cell><text:p>a<text:s text:c="2"/>b</text:p>'
+        ...       '<text:p>c</text:p>'
+        ...       '<office:annotation><text:p>note</text:p></office:annotation>'
+        ...       '</table:table-cell>'
+        ...       '<table:table-cell table:number-columns-repeated="16000"/>'
+        ...       '</table:table-row>'
+        ...       '<table:table-row table:number-rows-repeated="1048000">'
+        ...       '<table:table-cell table:number-columns-repeated="1024"/>'
+        ...       '</table:table-row>'
+        ...       '</table:table></office:spreadsheet></office:body>'
+        ...       '</office:document-content>'
+        ...     ) % (ns ['office'], ns ['table'], ns ['text'])
+        >>> n = f.write (xml.encode ('utf-8'))
+        >>> f.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.ods')
+        >>> n = 0
+        >>> for row in Spreadsheet_Reader (o, typed = True) :
+        ...     n += 1
+        >>> print (n, len (row), row [0], repr (row [-1]), row [1:3])
+        1000000 10001 1.0 'a  b\\nc' (None, None)
+        >>> o.close ()
+    """
+
+    def __init__ (self, ooopy, sheet = None, typed = False) :
+        self.ooopy = ooopy
+        self.sheet = sheet
+        self.typed = typed
+        mt         = ooopy.mimetype
+        self.tags  = tags = {}
+        for ns, name in \
+            ( ('table',  'table')
+            , ('table',  'table-row')
+            , ('table',  'table-cell')
+            , ('table',  'covered-table-cell')
+            , ('table',  'name')
+            , ('table',  'number-columns-repeated')
+            , ('table',  'number-rows-repeated')
+            , ('text',   'p')
+            , ('text',   'h')
+            , ('text',   's')
+            , ('text',   'c')
+            , ('text',   'tab')
+            , ('text',   'line-break')
+            , ('office', 'annotation')
+            , ('office', 'value-type')
+            , ('office', 'value')
+            , ('office', 'date-value')
+            , ('office', 'time-value')
+            , ('office', 'boolean-value')
+            , ('office', 'string-value')
+            ) :
+            tags [name] = OOo_Tag (ns, name, mt)
+    # end def __init__
+
+    def sheets (self) :
+        """ Return list of sheet names """
+        table = self.tags ['table']
+        name  = self.tags ['name']
+        return \
+            [ value [1].get (name)
+              for ev, value in self.ooopy.iterevents ('content.xml', False)
+              if ev == 'start' and value [0] == table
+            ]
+    # end def sheets
+
+    def dicts (self) :
+        """ Generator for dicts of the rows after the first, the first
+            row contains the keys, e.g., as a data source for Mailmerge.
+            Missing values at the end of a row are empty.
+        """
+        rows   = iter (self)
+        header = next (rows, None)
+        if header is None :
+            return
+        empty = None if self.typed else ''
+        for row in rows :
+            d = dict.fromkeys (header, empty)
+            d.update (zip (header, row))
+            yield d
+    # end def dicts
+
+    def columns (self, columns, skip = 0, use_numpy = True) :
+        """ Load the given columns (letters or 0-based indexes) of the
+            sheet into compact typed storage of floats: A dict indexed
+            by the given columns containing an array ('d') or, if numpy
+            is available and use_numpy is True, a numpy array. Only the
+            office:value (and office:boolean-value) attributes of cells
+            are used, the text of cells is not even parsed. Cells
+            without numeric value (empty, text, dates) are NaN. Repeated
+            cells are not expanded, only the requested columns are
+            stored. The first skip rows (e.g., a header) are ignored,
+            empty rows at the end of the sheet are dropped.
+
+            >>> from ooopy.OOoPy import OOoPy
+            >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+            >>> w = Spreadsheet_Writer (o, types = 'auto', header = 1)
+            >>> w.write_row (['name', 'amount', 'percent', 'flag'])
+            >>> w.write_rows ([['a', '1.5', '10 %', 'true']] * 3)
+            >>> w.write_row (['b', 'x', '', 'false', '7'])
+            >>> w.write_row (['', '', '', '', '', '', '', '', '', '', '5'])
+            >>> w.write_rows ([[]] * 5)
+            >>> w.close ()
+            >>> o.close ()
+            >>> o = OOoPy (infile = 'testout.ods')
+            >>> r = Spreadsheet_Reader (o)
+            >>> c = r.columns (('B', 2, 'd', 'K'), skip = 1, use_numpy = False)
+            >>> for k in sorted (c, key = str) :
+            ...     print (k, c [k].typecode, c [k].tolist ())
+            2 d [0.1, 0.1, 0.1, nan, nan]
+            B d [1.5, 1.5, 1.5, nan, nan]
+            K d [nan, nan, nan, nan, 5.0]
+            d d [1.0, 1.0, 1.0, 0.0, nan]
+            >>> o.close ()
+        """
+        np     = use_numpy and numpy is not None
+        loader = _Column_Loader (self, columns, skip)
+        parser = ParserCreate (namespace_separator = '}')
+        parser.StartElementHandler = loader.start
+        parser.EndElementHandler   = loader.end
+        f = self.ooopy.open ('content.xml')
+        try :
+            while True :
+                chunk = f.read (65536)
+                parser.Parse (chunk, not chunk)
+                if not chunk :
+                    break
+        except _Sheet_Done :
+            pass
+        finally :
+            f.close ()
+        result = {}
+        for c in columns :
+            result [c] = loader.arrays [column_index (c)]
+            if np :
+                result [c] = numpy.frombuffer (result [c], dtype = 'float64')
+        return result
+    # end def columns
+
+    def _value (self, attrib, text) :
+        """ Compute typed value of a cell """
+        tags = self.tags
+        vt   = attrib.get (tags ['value-type'])
+        if vt is None :
+            return text or None
+        if vt in ('float', 'percentage', 'currency') :
+            return float (attrib [tags ['value']])
+        if vt == 'boolean' :
+            return attrib [tags ['boolean-value']] == 'true'
+        if vt == 'date' :
+            v = attrib [tags ['date-value']]
+            m = _date.match (v)
+            if m :
+                d = [int (x) for x in m.groups () [:6] if x is not None]
+                if len (d) == 3 :
+                    return datetime (* d).date ()
+                return datetime (* d)
+            return v
+        if vt == 'time' :
+            return attrib [tags ['time-value']]
+        return attrib.get (tags ['string-value'], text)
+    # end def _value
+
+    def __iter__ (self) :
+        tags    = self.tags
+        sheet   = self.sheet
+        typed   = self.typed
+        empty   = None if typed else ''
+        t_table = tags ['table']
+        t_row   = tags ['table-row']
+        t_cells = (tags ['table-cell'], tags ['covered-table-cell'])
+        t_paras = (tags ['p'], tags ['h'])
+        t_note  = tags ['annotation']
+        t_s     = tags ['s']
+        t_tab   = tags ['tab']
+        t_lb    = tags ['line-break']
+        a_ccnt  = tags ['number-columns-repeated']
+        a_rcnt  = tags ['number-rows-repeated']
+        nsheet  = -1
+        level   = 0     # nesting level of tables, 1 = our sheet
+        erows   = 0     # pending empty rows
+        ecells  = 0     # pending empty cells
+        note    = 0     # nesting level of annotations
+        inpara  = 0
+        row     = cell = text = None
+        for ev, value in self.ooopy.iterevents ('content.xml') :
+            if ev == 'data' :
+                if inpara and not note :
+                    text.append (value)
+                continue
+            if ev == 'start' :
+                tag, attrib = value
+                if tag == t_table :
+                    if level :
+                        level += 1
+                        continue
+                    nsheet += 1
+                    if  (  sheet is None and nsheet == 0
+                        or sheet == nsheet
+                        or sheet == attrib.get (tags ['name'])
+                        ) :
+                        level = 1
+                elif level != 1 :
+                    continue
+                elif tag == t_row :
+                    row    = []
+                    rcount = int (attrib.get (a_rcnt, 1))
+                    ecells = 0
+                elif tag in t_cells :
+                    cell   = attrib
+                    text   = []
+                    npara  = 0
+                elif tag == t_note :
+                    note += 1
+                elif note or text is None :
+                    continue
+                elif tag in t_paras :
+                    if npara :
+                        text.append ('\n')
+                    npara  += 1
+                    inpara += 1
+                elif inpara and tag == t_s :
+                    text.append (' ' * int (attrib.get (tags ['c'], 1)))
+                elif inpara and tag == t_tab :
+                    text.append ('\t')
+                elif inpara and tag == t_lb :
+                    text.append ('\n')
+                continue
+            # end event
+            tag = value
+            if tag == t_table :
+                if level == 1 :
+                    return
+                if level :
+                    level -= 1
+            elif level != 1 :
+                continue
+            elif tag == t_note :
+                note -= 1
+            elif note :
+                continue
+            elif tag in t_paras :
+                inpara -= 1
+            elif tag in t_cells :
+                v = ''.join (text)
+                if typed :
+                    v = self._value (cell, v)
+                n = int (cell.get (a_ccnt, 1))
+                if v is empty or v == empty :
+                    ecells += n
+                else :
+                    if ecells :
+                        row.extend ([empty] * ecells)
+                        ecells = 0
+                    row.extend ([v] * n)
+                cell = text = None
+            elif tag == t_row :
+                if not row :
+                    erows += rcount
+                    continue
+                for k in range (erows) :
+                    yield ()
+                erows = 0
+                row   = tuple (row)
+                for k in range (rcount) :
+                    yield row
+    # end def __iter__
+# end class Spreadsheet_Reader
+
+_address = re.compile \
+    (r"^(?:\$?(?:'((?:[^']|'')+)'|([^.']+))\.)?\$?([A-Za-z]+)\$?(\d+)$")
+
+def parse_address (address) :
+    """ Parse a cell address in A1 notation, optionally with a sheet
+        name, return (sheet, row, column) with 0-based row and column,
+        sheet is None if not given.
+
+        >>> print (parse_address ('B3'))
+        (None, 2, 1)
+        >>> print (parse_address ('$Sheet1.$AA$10'))
+        ('Sheet1', 9, 26)
+        >>> print (parse_address ("'It''s a sheet'.c1"))
+        ("It's a sheet", 0, 2)
+        >>> parse_address ('3B')
+        Traceback (most recent call last):
+        ...
+        ValueError: Invalid cell address: 3B
+    """
+    m = _address.match (address)
+    if not m :
+        raise ValueError ("Invalid cell address: %s" % address)
+    quoted, sheet, col, row = m.groups ()
+    if quoted is not None :
+        sheet = quoted.replace ("''", "'")
+    return sheet, int (row) - 1, column_index (col)
+# end def parse_address
+
+class Sheet_Index (autosuper) :
+    """ Index of the cells of a table:table element (a sheet) of an
+        element tree for addressing cells by (0-based) row and column.
+        Rows and cells with a repeat count (number-rows-repeated,
+        number-columns-repeated) are found by bisection over the start
+        positions of the runs, the cells of a row are indexed when the
+        row is first accessed. A run is split into (at most) three
+        runs only when a cell in it is written, cells beyond the end of
+        the sheet or row are created on write.
+
+        >>> from ooopy.OOoPy import OOoPy
+        >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+        >>> w = Spreadsheet_Writer (o)
+        >>> w.write_rows ([['a', 'a', 'a', '', '', 'b']] * 5)
+        >>> w.close ()
+        >>> o.close ()
+        >>> o  = OOoPy (infile = 'testout.ods')
+        >>> mt = o.mimetype
+        >>> t  = o.read ('content.xml').getroot ().find \\
+        ...     ('.//' + OOo_Tag ('table', 'table', mt))
+        >>> idx = Sheet_Index (t, mt)
+        >>> print (idx.nrows, len (t))
+        5 1
+        >>> print (idx.cell (3, 1) [0].text, len (idx.cell (3, 4)))
+        a 0
+        >>> print (idx.cell (3, 7), idx.cell (9, 0))
+        None None
+        >>> idx.set_cells ([((3, 1), 42), ((3, 4), 'x'), ((7, 2), True)])
+        >>> print (idx.nrows, len (t))
+        8 5
+        >>> def show (t) :
+        ...     for row in t :
+        ...         print \\
+        ...             ( row.get (OOo_Tag ('table', 'number-rows-repeated', mt))
+        ...             , [ ( c.get (OOo_Tag
+        ...                     ('table', 'number-columns-repeated', mt))
+        ...                 , c.get (OOo_Tag ('office', 'value-type', mt))
+        ...                 , c [0].text if len (c) else None
+        ...                 )
+        ...                 for c in row
+        ...               ]
+        ...             )
+        >>> show (t)
+        3 [('3', 'string', 'a'), ('2', None, None), (None, 'string', 'b')]
+        None [(None, 'string', 'a'), (None, 'float', '42'), (None, 'string', 'a'), (None, None, None), (None, 'string', 'x'), (None, 'string', 'b')]
+        None [('3', 'string', 'a'), ('2', None, None), (None, 'string', 'b')]
+        2 [(None, None, None)]
+        None [('2', None, None), (None, 'boolean', 'TRUE')]
+        >>> idx.set_cell (2, 5, None)
+        >>> idx.set_cell (2, 5, date (2020, 2, 29))
+        >>> c = idx.cell (2, 5)
+        >>> print (c.get (OOo_Tag ('office', 'date-value', mt)), c [0].text)
+        2020-02-29 2020-02-29
+        >>> print (idx.nrows, len (t))
+        8 6
+        >>> o.close ()
+    """
+
+    row_containers = \
+        ('table-header-rows', 'table-rows', 'table-row-group')
+
+    def __init__ (self, table, mimetype) :
+        self.table     = table
+        self.mt        = mt = mimetype
+        self.t_row     = OOo_Tag ('table', 'table-row', mt)
+        self.t_cells   = \
+            ( OOo_Tag ('table', 'table-cell',         mt)
+            , OOo_Tag ('table', 'covered-table-cell', mt)
+            )
+        self.t_cont    = set \
+            (OOo_Tag ('table', c, mt) for c in self.row_containers)
+        self.a_rcnt    = OOo_Tag ('table', 'number-rows-repeated',    mt)
+        self.a_ccnt    = OOo_Tag ('table', 'number-columns-repeated', mt)
+        self.starts    = []  # first row number of each row element
+        self.rows      = []  # row elements
+        self.parents   = []  # parent elements of rows
+        self.cellidx   = {}  # row element -> [starts, cells]
+        n     = 0
+        stack = [iter (table)]
+        parents = [table]
+        while stack :
+            for e in stack [-1] :
+                if e.tag == self.t_row :
+                    self.starts.append  (n)
+                    self.rows.append    (e)
+                    self.parents.append (parents [-1])
+                    n += int (e.get (self.a_rcnt, 1))
+                elif e.tag in self.t_cont :
+                    stack.append   (iter (e))
+                    parents.append (e)
+                    break
+            else :
+                stack.pop   ()
+                parents.pop ()
+        self.nrows = n
+    # end def __init__
+
+    def cell (self, row, col) :
+        """ Return cell element at the given position or None if the
+            position is beyond the end of the sheet or row. The element
+            may be part of a run of repeated cells.
+        """
+        if row >= self.nrows :
+            return None
+        r = self.rows [bisect_right (self.starts, row) - 1]
+        starts, cells, n = self._cells (r)
+        if col >= n :
+            return None
+        return cells [bisect_right (starts, col) - 1]
+    # end def cell
+
+    def set_cell (self, row, col, value) :
+        set_cell_value (self._split_cell (row, col), value, self.mt)
+    # end def set_cell
+
+    def set_cells (self, cells) :
+        """ Set cells from an iterable of ((row, col), value) pairs """
+        for (row, col), value in cells :
+            self.set_cell (row, col, value)
+    # end def set_cells
+
+    def _cells (self, row) :
+        try :
+            return self.cellidx [row]
+        except KeyError :
+            pass
+        starts = []
+        cells  = []
+        n      = 0
+        for c in row :
+            if c.tag in self.t_cells :
+                starts.append (n)
+                cells.append  (c)
+                n += int (c.get (self.a_ccnt, 1))
+        idx = self.cellidx [row] = [starts, cells, n]
+        return idx
+    # end def _cells
+
+    def _split \
+        (self, parent, starts, elements, i, pos, attr, parents = None) :
+        """ Split run elements [i] (starting at starts [i]) so that
+            position pos is a single element, return it. The parents
+            list (parallel to elements) is updated if given.
+        """
+        e     = elements [i]
+        start = starts [i]
+        rep   = int (e.get (attr, 1))
+        if rep == 1 :
+            return e
+        before = pos - start
+        after  = rep - before - 1
+        new    = []
+        if before :
+            new.append ((start, e))
+            if before > 1 :
+                e.set (attr, str (before))
+            else :
+                e.attrib.pop (attr, None)
+        this = deepcopy (e)
+        this.attrib.pop (attr, None)
+        new.append ((pos, this))
+        if after :
+            rest = deepcopy (e)
+            if after > 1 :
+                rest.set (attr, str (after))
+            else :
+                rest.attrib.pop (attr, None)
+            new.append ((pos + 1, rest))
+        k = list (parent).index (e)
+        parent.remove (e)
+        for j, (s, x) in enumerate (new) :
+            parent.insert (k + j, x)
+        starts   [i:i + 1] = [s for s, x in new]
+        elements [i:i + 1] = [x for s, x in new]
+        if parents is not None :
+            parents [i:i + 1] = [parent] * len (new)
+        return this
+    # end def _split
+
+    def _split_cell (self, row, col) :
+        """ Get a single (non-repeated) cell at the given position,
+            create rows and cells if necessary.
+        """
+        if row >= self.nrows :
+            parent = self.parents [-1] if self.parents else self.table
+            if row > self.nrows :
+                self._append_row (parent, row - self.nrows)
+            self._append_row (parent, 1, empty = False)
+        i = bisect_right (self.starts, row) - 1
+        r = self._split \
+            ( self.parents [i], self.starts, self.rows, i, row, self.a_rcnt
+            , self.parents
+            )
+        idx = self._cells (r)
+        starts, cells, n = idx
+        if col >= n :
+            if col > n :
+                c = SubElement (r, self.t_cells [0])
+                if col - n > 1 :
+                    c.set (self.a_ccnt, str (col - n))
+                starts.append (n)
+                cells.append  (c)
+            starts.append (col)
+            cells.append  (SubElement (r, self.t_cells [0]))
+            idx [2] = col + 1
+        j = bisect_right (starts, col) - 1
+        return self._split (r, starts, cells, j, col, self.a_ccnt)
+    # end def _split_cell
+
+    def _append_row (self, parent, n, empty = True) :
+        """ Append n rows, a row without cells is only allowed if the
+            caller adds cells (empty = False).
+        """
+        r = SubElement (parent, self.t_row)
+        if empty :
+            SubElement (r, self.t_cells [0])
+        if n > 1 :
+            r.set (self.a_rcnt, str (n))
+        self.starts.append  (self.nrows)
+        self.rows.append    (r)
+        self.parents.append (parent)
+        self.nrows += n
+    # end def _append_row
+# end class Sheet_Index
+
+def set_cell_value (cell, value, mimetype) :
+    """ Set value of the given table-cell element: A string, number
+        (int, float, Decimal or another number convertible to float),
+        bool, date or datetime or None for an empty cell, other values
+        are stored as their string representation. Old values, formula
+        and paragraphs of the cell are removed, the style is kept.
+
+        >>> from ooopy.OOoPy import mimetypes
+        >>> mt   = mimetypes [2]
+        >>> cell = Element (OOo_Tag ('table', 'table-cell', mt))
+        >>> from fractions import Fraction
+        >>> for v in Decimal ('1.50'), Fraction (1, 4), 7, date (2020, 1, 2) :
+        ...     set_cell_value (cell, v, mt)
+        ...     print (cell.get (OOo_Tag ('office', 'value-type', mt))
+        ...           , cell.get (OOo_Tag ('office', 'value', mt))
+        ...           , cell [0].text
+        ...           )
+        float 1.50 1.50
+        float 0.25 0.25
+        float 7 7
+        date None 2020-01-02
+        >>> class Code (object) :
+        ...     def __str__ (self) :
+        ...         return 'A-17'
+        >>> set_cell_value (cell, Code (), mt)
+        >>> print (cell [0].text, cell.get (OOo_Tag ('office', 'value', mt)))
+        A-17 None
+        >>> try :
+        ...     set_cell_value (cell, 1j, mt)
+        ... except TypeError as err :
+        ...     print ("TypeError")
+        TypeError
+    """
+    mt = mimetype
+    for ns, name in \
+        ( ('office',  'value-type')
+        , ('office',  'value')
+        , ('office',  'date-value')
+        , ('office',  'time-value')
+        , ('office',  'boolean-value')
+        , ('office',  'string-value')
+        , ('office',  'currency')
+        , ('calcext', 'value-type')
+        , ('table',   'formula')
+        ) :
+        cell.attrib.pop (OOo_Tag (ns, name, mt), None)
+    p = OOo_Tag ('text', 'p', mt)
+    for e in cell.findall (p) :
+        cell.remove (e)
+    if value is None :
+        return
+    if isinstance (value, bool) :
+        vt   = 'boolean'
+        text = str (value).upper ()
+        cell.set \
+            (OOo_Tag ('office', 'boolean-value', mt), str (value).lower ())
+    elif isinstance (value, (int, float, Decimal)) :
+        vt   = 'float'
+        text = str (value)
+        cell.set (OOo_Tag ('office', 'value', mt), text)
+    elif isinstance (value, Number) :
+        # e.g. Fraction: str would not be a valid office:value
+        vt   = 'float'
+        text = repr (float (value))
+        cell.set (OOo_Tag ('office', 'value', mt), text)
+    elif isinstance (value, date) :
+        vt   = 'date'
+        text = value.isoformat ()
+        cell.set (OOo_Tag ('office', 'date-value', mt), text)
+    else :
+        vt   = 'string'
+        text = '%s' % (value,)
+    cell.set (OOo_Tag ('office', 'value-type', mt), vt)
+    e = Element (p)
+    e.text = text
+    cell.insert (0, e)
+# end def set_cell_value
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# Copyright (C) 2007-20 Dr. Ralf Schlatterbeck Open Source Consulting.
+# Reichergasse 131, A-3411 Weidling.
+# Web: http://www.runtux.com Email: office@runtux.com
+# All rights reserved
+# ****************************************************************************
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Library General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+# ****************************************************************************
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+try :
+    from io                  import StringIO
+except ImportError :
+    from StringIO            import StringIO
+import os
+from ooopy.OOoPy             import OOoPy
+from ooopy.Transformer       import OOo_Tag
+
+# Extensions of OOo/ODF documents searched when walking directories
+extensions = set \
+    (( '.odt', '.ott', '.ods', '.ots', '.odp', '.otp', '.odg', '.otg'
+     , '.sxw', '.stw', '.sxc', '.stc', '.sxi', '.sti', '.sxd', '.std'
+    ))
+
+def document_files (names, recursive = False) :
+    """ Generator for filenames: If recursive is set, directories in
+        names are walked (in sorted order) and yield all files with
+        one of the known extensions, other names are returned as is.
+
+        >>> for f in document_files (['testfiles'], recursive = True) :
+        ...     print (f)
+        testfiles/carta.odt
+        testfiles/carta.stw
+        testfiles/page1.odt
+        testfiles/page2.odt
+        testfiles/rechng.odt
+        testfiles/rechng.sxw
+        testfiles/tbl_first.odt
+        testfiles/tbl_second.odt
+        testfiles/test.odt
+        testfiles/test.sxw
+        testfiles/testenum.odt
+    """
+    for name in names :
+        if recursive and os.path.isdir (name) :
+            for dir, dirs, files in os.walk (name) :
+                dirs.sort ()
+                for f in sorted (files) :
+                    if os.path.splitext (f) [1].lower () in extensions :
+                        yield os.path.join (dir, f)
+        else :
+            yield name
+# end def document_files
+
+def text_fragments (ooopy, newlines = False) :
+    """ Generator for the text of the content.xml of the given OOoPy
+        object in document order. The member is parsed as a stream of
+        events, no ElementTree is built. Each text and tail fragment is
+        followed by a blank, if newlines is True a newline is produced
+        after each paragraph (after the tail of the paragraph element,
+        as the old recursive implementation of ooo_as_text did).
+
+        The output is identical to the old recursive tree-walking
+        implementation:
+
+        >>> from ooopy.Transforms import OOo_Tag
+        >>> def old_as_text (node, out, mimetype, newlines) :
+        ...     if node.text is not None :
+        ...         print (node.text, end = ' ', file = out)
+        ...     for subnode in node :
+        ...         old_as_text (subnode, out, mimetype, newlines)
+        ...     if node.tail is not None :
+        ...         print (node.tail, end = ' ', file = out)
+        ...     if newlines and node.tag == OOo_Tag ('text', 'p', mimetype) :
+        ...         print ("", file = out)
+        >>> import os
+        >>> for f in sorted (os.listdir ('testfiles')) :
+        ...     if f.endswith ('.csv') :
+        ...         continue
+        ...     o = OOoPy (infile = os.path.join ('testfiles', f))
+        ...     for nl in False, True :
+        ...         old = StringIO ()
+        ...         e   = o.read ('content.xml')
+        ...         old_as_text (e.getroot (), old, o.mimetype, nl)
+        ...         new = StringIO ()
+        ...         as_text (o, new, nl)
+        ...         if old.getvalue () != new.getvalue () :
+        ...             print ("Mismatch:", f, nl)
+        ...     o.close ()
+        >>> o = OOoPy (infile = 'testfiles/rechng.odt')
+        >>> print (''.join (text_fragments (o, newlines = True)) [:57])
+        Verlag der Zeitung 
+        .... 
+        Anrede 
+        Dr.   Vorname   Zahler 
+        >>> o.close ()
+    """
+    para = OOo_Tag ('text', 'p', ooopy.mimetype)
+    nl   = False
+    for ev, value in ooopy.iterevents ('content.xml') :
+        if ev == 'data' :
+            yield value + ' '
+            if nl :
+                yield '\n'
+                nl = False
+            continue
+        if nl :
+            yield '\n'
+            nl = False
+        if newlines and ev == 'end' and value == para :
+            nl = True
+    if nl :
+        yield '\n'
+# end def text_fragments
+
+def as_text (ooopy, out, newlines = False, bufsize = 65536) :
+    """ Write the text of the content.xml of the given OOoPy object to
+        the file-like object out. Fragments are collected and written
+        in chunks of about bufsize characters, see text_fragments.
+    """
+    buf = []
+    l   = 0
+    for t in text_fragments (ooopy, newlines) :
+        buf.append (t)
+        l += len (t)
+        if l >= bufsize :
+            out.write (''.join (buf))
+            buf = []
+            l   = 0
+    if buf :
+        out.write (''.join (buf))
+# end def as_text
+
+def paragraphs (ooopy) :
+    """ Generator for the paragraphs (including headings) of the
+        content.xml of the given OOoPy object as strings in document
+        order. In contrast to text_fragments the text is reproduced
+        faithfully: No blanks are inserted between fragments, spaces
+        (text:s), tabs and line breaks are converted to the
+        corresponding characters. A paragraph nested in another one
+        (e.g., in a frame anchored at the paragraph) is returned before
+        the enclosing paragraph.
+
+        >>> o = OOoPy (infile = 'testfiles/rechng.odt')
+        >>> p = list (paragraphs (o))
+        >>> for n in 0, 1, 3, 25 :
+        ...     print (n, repr (p [n]).lstrip ('u'))
+        0 'Verlag der Zeitung'
+        1 '....\\n'
+        3 'Dr. Vorname Zahler'
+        25 'Anrede Dr. VorName Abonnent Funkt Strasse 23 D-4711 Woanders V.   940053 10.12.2001-9.12.2002'
+        >>> o.close ()
+    """
+    mt     = ooopy.mimetype
+    paras  = (OOo_Tag ('text', 'p', mt), OOo_Tag ('text', 'h', mt))
+    space  = OOo_Tag ('text', 's',          mt)
+    tab    = OOo_Tag ('text', 'tab',        mt)
+    lbreak = OOo_Tag ('text', 'line-break', mt)
+    count  = OOo_Tag ('text', 'c',          mt)
+    stack  = []
+    for ev, value in ooopy.iterevents ('content.xml') :
+        if ev == 'data' :
+            if stack :
+                stack [-1].append (value)
+        elif ev == 'start' :
+            tag, attrib = value
+            if tag in paras :
+                stack.append ([])
+            elif stack :
+                if tag == space :
+                    stack [-1].append (' ' * int (attrib.get (count, 1)))
+                elif tag == tab :
+                    stack [-1].append ('\t')
+                elif tag == lbreak :
+                    stack [-1].append ('\n')
+        elif value in paras :
+            yield ''.join (stack.pop ())
+# end def paragraphs
+
+def file_as_text (infile, newlines = False) :
+    """ Return the text of the given file (a filename or a file-like
+        object) as a string. Suitable for use in worker processes.
+    """
+    o   = OOoPy (infile = infile)
+    out = StringIO ()
+    try :
+        as_text (o, out, newlines)
+    finally :
+        o.close ()
+    return out.getvalue ()
+# end def file_as_text
@@ -26,14 +26,17 @@ import time
 import re
 try :
     from xml.etree.ElementTree   import dump, SubElement, Element, tostring
-    from xml.etree.ElementTree   import _namespace_map
+    from xml.etree.ElementTree   import _namespace_map, fromstring
 except ImportError :
     from elementtree.ElementTree import dump, SubElement, Element, tostring
-    from elementtree.ElementTree import _namespace_map
+    from elementtree.ElementTree import _namespace_map, fromstring
 from copy                    import deepcopy
+from threading               import Lock
 from ooopy.autosuper         import autosuper
 from ooopy.Version           import VERSION
-from ooopy.OOoPy             import OOoPy, files, mimetypes, namespace_by_name
+from ooopy.OOoPy             import OOoPy, OOoElementTree
+from ooopy.OOoPy             import files, mimetypes, namespace_by_name
+from ooopy.OOoPy             import name_by_namespace
 
 def OOo_Tag (namespace, name, mimetype) :
     """Return combined XML tag
@@ -51,9 +54,80 @@ def split_tag (tag) :
         operation of OOo_Tag.
     """
     ns, t = tag.split ('}')
-    return (_namespace_map [ns [1:]], t)
+    ns    = ns [1:]
+    if ns in name_by_namespace :
+        return (name_by_namespace [ns], t)
+    return (_namespace_map [ns], t)
 # end def split_tag
 
+class Trees (dict) :
+    """ The ElementTrees of the XML members of an OOoPy object indexed
+        by member name. A member is only read (parsed) when it is first
+        accessed, iteration yields the members read so far. Members
+        that are never accessed by a transform are copied unchanged to
+        the output archive when the OOoPy object is closed.
+
+        A transform working on the bytes of a member (see Field_Index)
+        can store the modified bytes of a member that was not read in
+        raw. If a later transform accesses the member, it is parsed
+        from these bytes, otherwise they are written as they are.
+        Instead of bytes an object with a data attribute (the bytes)
+        and a write method (taking the OOoPy object and the member
+        name) may be stored, e.g., a Deflated_Member.
+
+        >>> o = OOoPy (infile = 'testfiles/test.odt')
+        >>> t = Trees (o)
+        >>> 'content.xml' in t, 'Pictures/x.png' in t, list (t)
+        (True, False, [])
+        >>> print (t ['styles.xml'].getroot ().tag.split ('}') [1])
+        document-styles
+        >>> list (t)
+        ['styles.xml']
+        >>> t.raw ['content.xml'] = b'<a>b</a>'
+        >>> p = t.parsed ('content.xml')
+        >>> print (p, t ['content.xml'].getroot ().text)
+        False b
+        >>> print (t.parsed ('content.xml'), list (t.raw))
+        True []
+        >>> o.close ()
+    """
+
+    def __init__ (self, ooopy) :
+        self.ooopy = ooopy
+        names      = ooopy.izip.namelist ()
+        # e.g., spreadsheets written by ooo_from_csv have no styles
+        self.names = set (f for f in files if f in names)
+        self.raw   = {}
+    # end def __init__
+
+    def __contains__ (self, name) :
+        return name in self.names
+    # end def __contains__
+
+    def __missing__ (self, name) :
+        if name not in self.names :
+            raise KeyError (name)
+        if name in self.raw :
+            root = fromstring (self.raw_data (name))
+            del self.raw [name]
+            tree = self [name] = OOoElementTree (self.ooopy, name, root)
+        else :
+            tree = self [name] = self.ooopy.read (name)
+        return tree
+    # end def __missing__
+
+    def raw_data (self, name) :
+        """ The bytes of a member stored in raw """
+        raw = self.raw [name]
+        return getattr (raw, 'data', raw)
+    # end def raw_data
+
+    def parsed (self, name) :
+        """ True if the member was already read """
+        return dict.__contains__ (self, name)
+    # end def parsed
+# end class Trees
+
 class Transform (autosuper) :
     """
         Base class for individual transforms on OOo files. An individual
@@ -74,14 +148,17 @@ class Transform (autosuper) :
     textbody_names = \
         { mimetypes [0] : 'body'
         , mimetypes [1] : 'text'
+        , mimetypes [2] : 'spreadsheet'
         }
     paragraph_props = \
         { mimetypes [0] : 'properties'
         , mimetypes [1] : 'paragraph-properties'
+        , mimetypes [2] : 'paragraph-properties'
         }
     font_decls = \
         { mimetypes [0] : 'font-decls'
         , mimetypes [1] : 'font-face-decls'
+        , mimetypes [2] : 'font-face-decls'
         }
 
     def __init__ (self, prio = None, transformer = None) :
@@ -97,6 +174,16 @@ class Transform (autosuper) :
         raise NotImplementedError ('derived transforms must implement "apply"')
     # end def apply
 
+    def cache_key (self) :
+        """ The parameters that determine the output of the transform
+            as a JSON-serialisable value, part of the key of a cached
+            result (see Result_Cache in ooopy.Cache). A transform is
+            only cacheable if it overrides this.
+        """
+        raise TypeError \
+            ("Transform %s can't be cached" % self.__class__.__name__)
+    # end def cache_key
+
     def apply_all (self, trees) :
         """ Apply myself to all the files given in trees. The variable
             trees contains a dictionary of ElementTree indexed by the
@@ -123,13 +210,22 @@ class Transform (autosuper) :
             variables stored in the tranformer by other transforms.
 
             Also needed for tag-computation: The transformer knows which
-            version of OOo document we are processing.
+            version of OOo document we are processing. The tables of
+            the class indexed by mimetype are not modified:
+
+            >>> t = Transform ()
+            >>> a = Transformer (mimetypes [0], t)
+            >>> print (split_tag (t.properties_tag) [1])
+            properties
+            >>> b = Transformer (mimetypes [1], t)
+            >>> print (split_tag (t.properties_tag) [1])
+            paragraph-properties
         """
         self.transformer     = transformer
         mt                   = self.mimetype = transformer.mimetype
         self.textbody_name   = self.textbody_names [mt]
-        self.paragraph_props = self.paragraph_props [mt]
-        self.properties_tag  = self.oootag ('style', self.paragraph_props)
+        self.properties_tag  = self.oootag \
+            ('style', self.paragraph_props [mt])
         self.textbody_tag    = self.oootag ('office', self.textbody_name)
         self.font_decls_tag  = self.oootag ('office', self.font_decls [mt])
     # end def register
@@ -1366,6 +1462,7 @@ class Transformer (autosuper) :
         self.dictionary   = {}
         # 2-tuples of filename, content
         self.appendfiles  = []
+        self.lock         = Lock ()
     # end def __init__
 
     def insert (self, transform) :
@@ -1377,25 +1474,178 @@ class Transformer (autosuper) :
         t.register (self)
     # end def append
 
-    def transform (self, ooopy) :
+    def transform (self, ooopy, write_behind = None) :
         """
             Apply all the transforms in priority order.
             Priority order is global over all transforms.
+            If a Write_Behind queue is given, the modified members are
+            written and the ooopy object is closed by the queue, the
+            caller can transform the next document in the meantime.
+            Closing the ooopy object waits for this (and raises the
+            error if writing failed).
+
+            >>> from io import BytesIO
+            >>> from ooopy.OOoPy import Write_Behind
+            >>> from ooopy.Transforms import Field_Replace
+            >>> def render (n, wb = None, out = None) :
+            ...     out = out or BytesIO ()
+            ...     o = OOoPy \\
+            ...         ( infile  = 'testfiles/test.odt', outfile = out
+            ...         , timestamp = 0, digest = True
+            ...         )
+            ...     r = Field_Replace (replace = {'firstname' : str (n)})
+            ...     t = Transformer (o.mimetype, r)
+            ...     t.transform (o, write_behind = wb)
+            ...     return o
+            >>> with Write_Behind (maxsize = 2) as wb :
+            ...     docs    = [render (n, wb) for n in range (6)]
+            ...     digests = [o.close () for o in docs]
+            >>> digests == [render (n).close () for n in range (6)]
+            True
+            >>> len (set (digests))
+            6
+
+            Errors are raised when closing the document:
+
+            >>> class Full (BytesIO) :
+            ...     full = True
+            ...     def write (self, data) :
+            ...         if self.full :
+            ...             self.full = False
+            ...             raise IOError ("Disk full")
+            ...         return BytesIO.write (self, data)
+            >>> with Write_Behind () as wb :
+            ...     o = render (1, wb, Full ())
+            ...     try :
+            ...         o.close ()
+            ...     except IOError as err :
+            ...         print (err)
+            Disk full
+
+            The transformer and its transforms keep the state of the
+            document being transformed (e.g., the values in the
+            transformer dictionary), so concurrent calls of transform
+            on the same transformer are serialised by a lock. For
+            transforming documents in parallel each thread uses its own
+            Transformer, OOoPy objects and templates (see ooopy.Cache)
+            may be shared. Results are the same as when rendering
+            sequentially:
+
+            >>> from datetime import datetime
+            >>> from threading import Thread
+            >>> from ooopy.Cache import Template_Cache
+            >>> from ooopy.Transforms import Mailmerge, renumber_all
+            >>> from ooopy.Transforms import get_meta, set_meta
+            >>> from ooopy.Transforms import Addpagebreak_Style
+            >>> from ooopy.Transforms import Fix_OOo_Tag
+            >>> cache = Template_Cache ()
+            >>> rechng = 'testfiles/rechng.odt'
+            >>> def merge (n) :
+            ...     out = BytesIO ()
+            ...     o = cache.open (rechng, out)
+            ...     o.timestamp = datetime (2020, 1, 1)
+            ...     records = \\
+            ...         [ {'address.firstname' : 'N%d' % (n * 10 + i)}
+            ...           for i in range (3)
+            ...         ]
+            ...     t = Transformer \\
+            ...         ( o.mimetype
+            ...         , get_meta (o.mimetype)
+            ...         , Addpagebreak_Style ()
+            ...         , Mailmerge (iterator = records)
+            ...         , renumber_all (o.mimetype)
+            ...         , set_meta (o.mimetype)
+            ...         , Fix_OOo_Tag ()
+            ...         )
+            ...     t.transform (o)
+            ...     o.close ()
+            ...     return out.getvalue ()
+            >>> jobs = [(render, n) for n in range (8)] \\
+            ...      + [(merge,  n) for n in range (8)]
+            >>> def result (f, n) :
+            ...     if f is render :
+            ...         return render (n, out = BytesIO ()).close ()
+            ...     return merge (n)
+            >>> expected = [result (f, n) for f, n in jobs]
+            >>> results  = {}
+            >>> def work (k) :
+            ...     for i in range (k, len (jobs), 4) :
+            ...         results [i] = result (* jobs [i])
+            >>> threads = \\
+            ...     [Thread (target = work, args = (k,)) for k in range (4)]
+            >>> for th in threads :
+            ...     th.start ()
+            >>> for th in threads :
+            ...     th.join ()
+            >>> [results [i] for i in range (len (jobs))] == expected
+            True
+            >>> len (set (expected))
+            16
+
+            A transformer shared by several threads gives the same
+            results, its transform calls are serialised:
+
+            >>> r  = Field_Replace (replace = dict (firstname = 'Shared'))
+            >>> tr = Transformer (mimetypes [1], r)
+            >>> def shared (k) :
+            ...     for i in range (4) :
+            ...         o = OOoPy \\
+            ...             ( infile    = 'testfiles/test.odt'
+            ...             , outfile   = BytesIO ()
+            ...             , timestamp = 0
+            ...             , digest    = True
+            ...             )
+            ...         tr.transform (o)
+            ...         results [k, i] = o.close ()
+            >>> results  = {}
+            >>> threads = \\
+            ...     [Thread (target = shared, args = (k,)) for k in range (4)]
+            >>> for th in threads :
+            ...     th.start ()
+            >>> for th in threads :
+            ...     th.join ()
+            >>> len (results), len (set (results.values ()))
+            (16, 1)
         """
-        self.trees = {}
-        for f in files :
-            self.trees [f] = ooopy.read (f)
-        #self.dictionary = {} # clear dict when transforming another ooopy
-        for p in sorted (self.transforms.keys ()) :
-            for t in self.transforms [p] :
-                t.apply_all (self.trees)
-        for t in self.trees :
-            e = self.trees [t]
-            e.write ()
-        for fname, fcontent in self.appendfiles :
-            e.ooopy.append_file (fname, fcontent)
+        with self.lock :
+            self.trees = trees = Trees (ooopy)
+            #self.dictionary = {} # clear dict when transforming another ooopy
+            for p in sorted (self.transforms.keys ()) :
+                for t in self.transforms [p] :
+                    t.apply_all (trees)
+            appendfiles = list (self.appendfiles)
+            if not write_behind :
+                self._write (ooopy, trees, appendfiles)
+        if write_behind :
+            ooopy.job = write_behind.submit \
+                (self._write_close, ooopy, trees, appendfiles)
     # end def transform
 
+    def _write (self, ooopy, trees, appendfiles) :
+        # Keep the order of members of the input archive
+        names = ooopy.izip.namelist ()
+        done  = set (trees) | set (trees.raw)
+        for t in sorted (done, key = names.index) :
+            if t in trees.raw :
+                raw = trees.raw [t]
+                if isinstance (raw, bytes) :
+                    ooopy.append_file (t, raw)
+                else :
+                    raw.write (ooopy, t)
+            else :
+                trees [t].write ()
+        for fname, fcontent in appendfiles :
+            ooopy.append_file (fname, fcontent)
+    # end def _write
+
+    def _write_close (self, ooopy, trees, appendfiles) :
+        try :
+            self._write (ooopy, trees, appendfiles)
+        finally :
+            result = ooopy.close ()
+        return result
+    # end def _write_close
+
     def __contains__ (self, key) :
         return key in self.dictionary
     # end def __contains__
@@ -23,18 +23,26 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
 import sys
+import os
 import time
 import re
+import json
 try :
     from xml.etree.ElementTree   import dump, SubElement, Element, tostring
+    from xml.etree.ElementTree   import Comment
 except ImportError :
     from elementtree.ElementTree import dump, SubElement, Element, tostring
+    from elementtree.ElementTree import Comment
+from xml.sax.saxutils        import escape, quoteattr
+from xml.parsers.expat       import ParserCreate
 from copy                    import deepcopy
 from ooopy.autosuper         import autosuper
 from ooopy.Version           import VERSION
-from ooopy.OOoPy             import OOoPy
+from ooopy.OOoPy             import OOoPy, Deflated_Fragments
 from ooopy.Transformer       import files, split_tag, OOo_Tag, Transform
-from ooopy.Transformer       import mimetypes, namespace_by_name
+from ooopy.Transformer       import mimetypes, namespace_by_name, Trees
+from ooopy.Spreadsheet       import Sheet_Index, parse_address
+from ooopy.Condition         import Condition
 
 # counts in meta.xml
 meta_counts = \
@@ -63,6 +71,13 @@ class Access_Attribute (autosuper) :
         self.transformer = transformer
     # end def register
 
+    def prepare (self, root) :
+        """ Called with the root element before the attribute accesses
+            of an Attribute_Access transform are applied to root.
+        """
+        pass
+    # end def prepare
+
     def use_value (self, oldval = None) :
         """ Can change the given value by returning the new value. If
             returning None or oldval the attribute stays unchanged.
@@ -126,18 +141,71 @@ class Renumber (Access_Attribute) :
 
         The force parameter specifies if the new renumbered name should
         be inserted even if the attribute in question does not exist.
+
+        If only_duplicates is set, we do not renumber all elements:
+        Before applying the renumbering we index all names of the given
+        tag that are in use. The first element with a given name keeps
+        its name, only later elements with the same name are renamed.
+        The new name is built from the old name with trailing digits
+        removed and a counter per such base name, skipping names that
+        are already in use. This keeps names stable and is a lot
+        cheaper after a mailmerge or concatenation of large documents.
+
+        >>> from ooopy.Transformer import Transformer
+        >>> try :
+        ...     from io import BytesIO
+        ... except ImportError :
+        ...     from StringIO import StringIO as BytesIO
+        >>> sio = BytesIO ()
+        >>> o   = OOoPy (infile = 'testfiles/test.odt', outfile = sio)
+        >>> m   = o.mimetype
+        >>> t   = Transformer \\
+        ...     ( m
+        ...     , get_meta (m)
+        ...     , Addpagebreak_Style ()
+        ...     , Mailmerge (iterator = (dict (firstname = 'Erika'), {}, {}))
+        ...     , renumber_all (m, only_duplicates = True)
+        ...     , set_meta (m)
+        ...     )
+        >>> t.transform (o)
+        >>> o.close ()
+        >>> o = OOoPy (infile = sio)
+        >>> c = o.read ('content.xml')
+        >>> o.close ()
+        >>> names = [n.get (OOo_Tag ('text', 'name', m))
+        ...          for n in c.findall ('.//' + OOo_Tag ('text', 'section', m))]
+        >>> print (' '.join (names [:9]))
+        Name Address country Name1 Address1 country1 Name2 Address2 country2
+        >>> print (' '.join (names [9:]))
+        Section1 Section2 Section3 Section4 Section5 Section6 Section7 Section8 Section9
+        >>> for n in c.findall ('.//' + OOo_Tag ('table', 'table', m)) :
+        ...     print (n.get (OOo_Tag ('table', 'name', m)), end = ' ')
+        Table1 Table2 Table3 
+        >>> for n in c.findall ('.//' + OOo_Tag ('draw', 'frame', m)) :
+        ...     print (n.get (OOo_Tag ('draw', 'name', m)), end = ' ')
+        Frame2 Frame3 Frame4 Frame1 Frame5 Frame6 
     """
+    trailing_digits = re.compile (r'[0-9]+$')
 
     def __init__ \
-        (self, tag, name = None, attr = None, start = 1, force = False) :
+        ( self
+        , tag
+        , name            = None
+        , attr            = None
+        , start           = 1
+        , force           = False
+        , only_duplicates = False
+        ) :
         self.__super.__init__ ()
         tag_ns, tag_name = split_tag (tag)
         self.tag_ns      = tag_ns
         self.tag         = tag
         self.name        = name or tag_name [0].upper () + tag_name [1:]
+        self.start       = start
         self.num         = start
         self.force       = force
         self.attribute   = attr
+        self.only_duplicates = only_duplicates
     # end def __init__
 
     def register (self, transformer) :
@@ -146,14 +214,46 @@ class Renumber (Access_Attribute) :
             self.attribute = OOo_Tag (self.tag_ns, 'name', transformer.mimetype)
     # end def register
 
+    def prepare (self, root) :
+        """ Index names in use if only duplicates are renamed """
+        if self.only_duplicates :
+            self.used    = set (n.get (self.attribute)
+                                for n in root.iter (self.tag))
+            self.seen    = set ()
+            self.counter = {}
+    # end def prepare
+
     def use_value (self, oldval = None) :
         if oldval is None and not self.force :
             return
+        if self.only_duplicates :
+            return self._unique_name (oldval)
         name = "%s%d" % (self.name, self.num)
         self.num += 1
         return name
     # end def use_value
 
+    def _unique_name (self, oldval) :
+        """ Return None (unchanged) for the first occurrence of a name
+            and a new unused name for later occurrences.
+        """
+        if oldval is not None and oldval not in self.seen :
+            self.seen.add (oldval)
+            return None
+        base = self.name
+        if oldval :
+            base = self.trailing_digits.sub ('', oldval) or self.name
+        num  = self.counter.get (base, self.start)
+        name = "%s%d" % (base, num)
+        while name in self.used :
+            num += 1
+            name = "%s%d" % (base, num)
+        self.counter [base] = num + 1
+        self.used.add (name)
+        self.seen.add (name)
+        return name
+    # end def _unique_name
+
 # end class Renumber
 
 class Set_Attribute (Access_Attribute) :
@@ -282,9 +382,19 @@ class Attribute_Access (Transform) :
 
     def apply (self, root) :
         """ Search for all tags for which we renumber and replace name """
-        for n in [root] + root.findall ('.//*') :
-            changers = \
-                self.attrchangers [None] + self.attrchangers.get (n.tag, [])
+        for r in self.changers :
+            prepare = getattr (r, 'prepare', None)
+            if prepare :
+                prepare (root)
+        untagged = self.attrchangers [None]
+        for n in root.iter () :
+            changers = self.attrchangers.get (n.tag)
+            if changers is None :
+                if not untagged :
+                    continue
+                changers = untagged
+            elif untagged :
+                changers = untagged + changers
             if not self.match_all :
                 by_tag_attr = {}
                 for r in changers :
@@ -359,12 +469,32 @@ class Editinfo (Transform) :
         the OOo file, modification time, number of edit cyles and overall
         edit duration).  It's easy to subclass this transform and replace
         the "replace" variable (pun intended) in the derived class.
+
+        The modification time (dc:date) is the given date (a string or
+        a datetime), the timestamp of the output archive if one was
+        given for reproducible output (see OOoPy) or the current time.
+
+        >>> from ooopy.Transformer import Transformer
+        >>> from datetime import datetime
+        >>> from io import BytesIO
+        >>> out = BytesIO ()
+        >>> o   = OOoPy \\
+        ...     ( infile    = 'testfiles/test.odt'
+        ...     , outfile   = out
+        ...     , timestamp = datetime (2020, 2, 29, 12, 30)
+        ...     )
+        >>> Transformer (o.mimetype, Editinfo ()).transform (o)
+        >>> o.close ()
+        >>> o = OOoPy (infile = out)
+        >>> m = o.read ('meta.xml').getroot ()
+        >>> print (m.find ('.//' + OOo_Tag ('dc', 'date', o.mimetype)).text)
+        2020-02-29T12:30:00
+        >>> o.close ()
     """
     filename = 'meta.xml'
     prio     = 20
     repl     = \
         { ('meta', 'generator')        : 'OOoPy field replacement'
-        , ('dc',   'date')             : time.strftime ('%Y-%m-%dT%H:%M:%S')
         , ('meta', 'editing-cycles')   : '0'
         , ('meta', 'editing-duration') : 'PT0M0S'
         }
@@ -375,11 +505,39 @@ class Editinfo (Transform) :
         for params in repl :
             value = repl [params]
             replace [OOo_Tag (mimetype = m, *params)] = value
+    date_format = '%Y-%m-%dT%H:%M:%S'
+
+    def __init__ (self, date = None, ** kw) :
+        self.__super.__init__ (** kw)
+        self.date = date
+    # end def __init__
+
+    def apply_all (self, trees) :
+        date = self.date
+        if date is None :
+            date = trees [self.filename].ooopy.timestamp
+        if date is None :
+            date = time.strftime (self.date_format)
+        elif not isinstance (date, str) :
+            date = date.strftime (self.date_format)
+        self.date_text = date
+        self.__super.apply_all (trees)
+    # end def apply_all
+
+    def cache_key (self) :
+        date = self.date
+        if date is not None and not isinstance (date, str) :
+            date = date.strftime (self.date_format)
+        return date
+    # end def cache_key
 
     def apply (self, root) :
+        date = self.oootag ('dc', 'date')
         for node in root.findall (self.oootag ('office', 'meta') + '/*') :
             if node.tag in self.replace :
                 node.text = self.replace [node.tag]
+            elif node.tag == date :
+                node.text = self.date_text
     # end def apply
 # end class Editinfo
 
@@ -431,6 +589,339 @@ class Autoupdate (Transform) :
 # content.xml transforms
 #
 
+def _lookup (record, name) :
+    """ Look up name in a record (something dict-like or callable) """
+    if callable (record) :
+        return record (name)
+    try :
+        return record [name]
+    except KeyError :
+        return None
+# end def _lookup
+
+class Repeat_Regions (autosuper) :
+    """ Repeat regions of a document compiled once for repeatedly
+        expanding them with data from records (e.g., in a mailmerge).
+        Each key in keys names a region: It is the section with that
+        name or else the table row containing variable fields named
+        <key>.<name>. The region is expanded for each item of the
+        iterable found under key in a record, the fields in the region
+        get the values of <name> in the item. Keys of nested regions
+        are dotted, e.g., with keys ('items', 'items.parts') a region
+        for 'items.parts' inside the region for 'items' is expanded for
+        the items of 'parts' in each item. Other fields in a region are
+        left alone.
+
+        On compilation the regions are removed from the tree, each is
+        kept as a fragment with the paths to its fields, so instances
+        are created with a copy of the fragment only. Since the regions
+        are located by position, expand must be called with the
+        compiled tree or an unmodified copy of it.
+
+        >>> from ooopy.Transformer import Transformer
+        >>> o = OOoPy (infile = 'testfiles/test.odt')
+        >>> m = o.mimetype
+        >>> c = o.read ('content.xml').getroot ()
+        >>> o.close ()
+        >>> table = c.find ('.//' + OOo_Tag ('table', 'table', m))
+        >>> row   = table [-1]
+        >>> for n, cell in enumerate (row [1:3]) :
+        ...     p = cell [0]
+        ...     f = SubElement (p, OOo_Tag ('text', 'variable-get', m))
+        ...     f.set (OOo_Tag ('text', 'name', m), 'items.f%d' % n)
+        >>> r = Repeat_Regions (c, ('items',), m)
+        >>> print (len (table))
+        2
+        >>> r.expand (c, dict (items = [dict (f0 = 'x', f1 = 1), {}] * 2))
+        >>> for row in table [2:] :
+        ...     print ([''.join (cell.itertext ()) for cell in row])
+        ['description', 'ax', 'b1', 'c', 'd']
+        ['description', 'a', 'b', 'c', 'd']
+        ['description', 'ax', 'b1', 'c', 'd']
+        ['description', 'a', 'b', 'c', 'd']
+    """
+
+    def __init__ (self, root, keys, mimetype, scope = None) :
+        self.mimetype = mimetype
+        self.scope    = scope
+        fieldtags     = set \
+            ( OOo_Tag ('text', t, mimetype)
+              for t in ('variable-set', 'variable-get', 'variable-input')
+            )
+        name     = OOo_Tag ('text', 'name',      mimetype)
+        section  = OOo_Tag ('text', 'section',   mimetype)
+        row      = OOo_Tag ('table', 'table-row', mimetype)
+        prefix   = scope and scope + '.' or ''
+        keys     = sorted \
+            (k for k in keys if k.startswith (prefix) and k != scope)
+        parent   = dict ((c, p) for p in root.iter () for c in p)
+        sections = dict \
+            ((e.get (name), e) for e in root.iter (section) if e is not root)
+        regions  = {}
+        order    = dict ((e, n) for n, e in enumerate (root.iter ()))
+        fields   = []
+        for f in root.iter () :
+            if f.tag not in fieldtags :
+                continue
+            fname = f.get (name) or ''
+            for k in keys :
+                if fname.startswith (k + '.') :
+                    break
+            else :
+                if scope is not None and fname.startswith (prefix) :
+                    fields.append (f)
+                continue
+            region = sections.get (k)
+            e = f
+            while region is None and e in parent :
+                e = parent [e]
+                if e.tag == row :
+                    region = e
+            if region is not None :
+                regions [region] = k
+        # Only outermost regions, nested ones are part of a fragment
+        for region in list (regions) :
+            e = region
+            while e in parent :
+                e = parent [e]
+                if e in regions :
+                    del regions [region]
+                    break
+        self.regions = []
+        removed      = {}
+        for region in sorted (regions, key = lambda e : order [e]) :
+            p   = parent [region]
+            idx = list (p).index (region)
+            self.regions.append \
+                ( [ p
+                  , idx - removed.get (p, 0)
+                  , regions [region]
+                  , _Fragment (region, regions [region], keys, mimetype)
+                  ]
+                )
+            removed [p] = removed.get (p, 0) + 1
+        for p, idx, k, fragment in self.regions :
+            p.remove (fragment.element)
+        # Paths are computed after all regions are removed
+        for r in self.regions :
+            r [0] = _path (parent, root, r [0])
+        self.fields = \
+            [ (_path (parent, root, f), f.get (name) [len (prefix):])
+              for f in fields
+              if  not any
+                  (_path (parent, fr.element, f) is not None
+                   for p, i, k, fr in self.regions
+                  )
+            ]
+    # end def __init__
+
+    def expand (self, root, record) :
+        """ Expand regions in root (the compiled tree or a copy of it)
+            with the data in record.
+        """
+        for path, idx, key, fragment in reversed (self.regions) :
+            parent = root
+            for i in path :
+                parent = parent [i]
+            k     = key
+            if self.scope is not None :
+                k = key [len (self.scope) + 1:]
+            items = _lookup (record, k) or ()
+            for n, item in enumerate (items) :
+                parent.insert (idx + n, fragment.instance (item))
+    # end def expand
+# end class Repeat_Regions
+
+class _Fragment (autosuper) :
+    """ A region of a document that is repeated for several items """
+
+    def __init__ (self, element, key, keys, mimetype) :
+        self.element = element
+        self.regions = Repeat_Regions (element, keys, mimetype, scope = key)
+    # end def __init__
+
+    def instance (self, item) :
+        element = deepcopy (self.element)
+        for path, name in self.regions.fields :
+            node = element
+            for i in path :
+                node = node [i]
+            value = _lookup (item, name)
+            if value is not None :
+                node.text = '%s' % value
+        self.regions.expand (element, item)
+        return element
+    # end def instance
+# end class _Fragment
+
+def _path (parent, root, element) :
+    """ Return the child indexes leading from root to element (or None
+        if element is not below root) using the parent dictionary.
+    """
+    path = []
+    while element is not root :
+        if element not in parent :
+            return None
+        p = parent [element]
+        path.append (list (p).index (element))
+        element = p
+    path.reverse ()
+    return path
+# end def _path
+
+class Field_Index (autosuper) :
+    """
+        Byte offsets of the fields (variable-set, variable-get and
+        variable-input) in the text body of the raw bytes of an XML
+        member (usually content.xml). The member is scanned once, then
+        replace produces the bytes of the member with the text of the
+        fields replaced without building an ElementTree, the result is
+        equivalent to the one of Field_Replace (without repeat
+        regions). The index of a template can be kept, see
+        Template.field_index in ooopy.Cache.
+
+        >>> o = OOoPy (infile = 'testfiles/test.odt')
+        >>> from xml.etree.ElementTree import fromstring
+        >>> idx = Field_Index (o.izip.read ('content.xml'), o.mimetype)
+        >>> o.close ()
+        >>> print (' '.join (sorted (idx.names)))
+        city country firstname lastname postalcode salutation street
+        >>> data = idx.replace ({'firstname' : 'A & B', 'city' : None})
+        >>> c = fromstring (data)
+        >>> print ([len (l) for l in idx.fields])
+        [14, 0, 0]
+        >>> vs = list (c.iter (OOo_Tag ('text', 'variable-set', o.mimetype)))
+        >>> name = OOo_Tag ('text', 'name', o.mimetype)
+        >>> for node in vs [:7] :
+        ...     print (node.get (name), node.text)
+        salutation Mr.
+        firstname A & B
+        lastname Testman
+        street Example Road 42
+        country A
+        postalcode 4711
+        city None
+    """
+    kinds     = ('variable-set', 'variable-get', 'variable-input')
+    start_tag = re.compile \
+        ( br'<([^\s/>]+)'
+          br'(?:\s+[^\s=]+\s*=\s*(?:"[^"]*"|\'[^\']*\'))*\s*(/?)>'
+        )
+
+    def __init__ (self, data, mimetype) :
+        self.data     = data
+        self.mimetype = mimetype
+        tags  = dict \
+            ((OOo_Tag ('text', k, mimetype) [1:], n)
+             for n, k in enumerate (self.kinds)
+            )
+        name  = OOo_Tag ('text', 'name', mimetype) [1:]
+        tbody = OOo_Tag \
+            ('office', Transform.textbody_names [mimetype], mimetype) [1:]
+        # For each kind: list of (name, start, text_start, text_end, tag)
+        # tag is the qualified tag name of a self-closing element, the
+        # number of the region is appended below
+        self.fields = [[] for k in self.kinds]
+        stack  = []
+        parser = ParserCreate (namespace_separator = '}')
+        def start (tag, attrib) :
+            pos = parser.CurrentByteIndex
+            if stack and stack [-1] and stack [-1][3] is None :
+                # first child ends text of enclosing field
+                stack [-1][3] = pos
+            if tag == tbody :
+                self.body = True
+            if self.body and tag in tags :
+                m = self.start_tag.match (data, pos)
+                f = [attrib.get (name), pos, m.end (), None, None]
+                if m.group (2) :
+                    f [3] = m.end ()
+                    f [4] = m.group (1)
+                self.fields [tags [tag]].append (f)
+                stack.append (f)
+            else :
+                stack.append (None)
+        def end (tag) :
+            f = stack.pop ()
+            if f and f [3] is None :
+                f [3] = parser.CurrentByteIndex
+            if tag == tbody :
+                self.body = False
+        self.body = False
+        parser.StartElementHandler = start
+        parser.EndElementHandler   = end
+        parser.Parse (data, True)
+        self.names = set (f [0] for l in self.fields for f in l)
+        # The replaced regions in document order, the fragments of the
+        # member alternate between static text and region contents
+        regions = []
+        fields  = sorted \
+            ((f for l in self.fields for f in l), key = lambda f : f [1])
+        for f in fields :
+            name, pos, tstart, tend, tag = f
+            f.append (len (regions))
+            if tag :
+                # self-closing element: <tag .../> becomes <tag ...>v</tag>
+                slash = data.rindex (b'/', pos, tstart)
+                regions.append ((slash, tstart, b'>', b'</' + tag + b'>'))
+            else :
+                regions.append ((tstart, tend, b'', b''))
+        self.regions   = regions
+        self.fragments = []
+        last           = 0
+        for start, end, prefix, suffix in regions :
+            self.fragments.extend ((data [last:start], data [start:end]))
+            last = end
+        self.fragments.append (data [last:])
+        self._deflated = None
+    # end def __init__
+
+    def values (self, replace = None, ** kw) :
+        """ Dict of replaced fragments by fragment index, replace (a
+            dict or a callable) and kw are used as in Field_Replace.
+        """
+        replace = replace or {}
+        result  = {}
+        for l in self.fields :
+            for name, pos, tstart, tend, tag, n in l :
+                if callable (replace) :
+                    value = replace (name)
+                    if not value :
+                        continue
+                elif name in replace :
+                    value = replace [name]
+                elif name in kw :
+                    value = kw [name]
+                else :
+                    continue
+                start, end, prefix, suffix = self.regions [n]
+                result [2 * n + 1] = b''.join \
+                    ((prefix, escape (value or '').encode ('utf-8'), suffix))
+        return result
+    # end def values
+
+    def replace (self, replace = None, ** kw) :
+        """ Bytes of the member with fields replaced """
+        values = self.values (replace, ** kw)
+        return b''.join \
+            (values.get (n, f) for n, f in enumerate (self.fragments))
+    # end def replace
+
+    def deflated (self) :
+        """ The fragments compressed once, see Deflated_Fragments """
+        if self._deflated is None :
+            self._deflated = Deflated_Fragments (self.fragments)
+        return self._deflated
+    # end def deflated
+
+    def member (self, replace = None, ** kw) :
+        """ Like replace but return a Deflated_Member that is written
+            from the precompressed fragments.
+        """
+        return self.deflated ().member (self.values (replace, ** kw))
+    # end def member
+# end class Field_Index
+
 class Field_Replace (Transform) :
     """
         Takes a dict of replacement key-value pairs. The key is the name
@@ -439,22 +930,112 @@ class Field_Replace (Transform) :
         variable name lookups is provided. The callback function is
         given the name of a variable in OOo and is expected to return
         the replacement value or None if the variable value should not
-        be replaced.
+        be replaced. The keys of repeat regions (see Repeat_Regions) may
+        be given in repeat, these are expanded with the iterables found
+        with the same name before replacing the other fields.
+
+        If fast is True (the default) and no repeat regions are given,
+        the fields are replaced in the bytes of content.xml with the
+        help of a Field_Index without parsing the member, provided no
+        earlier transform already needed the parsed tree. If a later
+        transform needs the tree it is parsed from the modified bytes.
+        If the document is a Template from ooopy.Cache, content.xml is
+        written from the fragments of the template compressed once, see
+        Field_Index.member. The result is the same as with the
+        tree-based replacement:
+
+        >>> from ooopy.Cache import Template
+        >>> from ooopy.Transformer import Transformer
+        >>> from xml.etree.ElementTree import fromstring
+        >>> from io import BytesIO
+        >>> def fields (name) :
+        ...     o = OOoPy (infile = name)
+        ...     idx = Field_Index (o.izip.read ('content.xml'), o.mimetype)
+        ...     o.close ()
+        ...     return idx.names
+        >>> def render (name, names, fast, template = False) :
+        ...     out = BytesIO ()
+        ...     if template :
+        ...         o = Template (name).open (out)
+        ...     else :
+        ...         o = OOoPy (infile = name, outfile = out)
+        ...     r = dict ((f, u'<%s> & \\xe4\\u20ac' % f) for f in names)
+        ...     f = Field_Replace (replace = r, fast = fast)
+        ...     t = Transformer (o.mimetype, f, Fix_OOo_Tag ())
+        ...     t.transform (o)
+        ...     o.close ()
+        ...     o = OOoPy (infile = out)
+        ...     c = o.read ('content.xml').getroot ()
+        ...     o.close ()
+        ...     return tostring (c)
+        >>> count = 0
+        >>> for name in sorted (os.listdir ('testfiles')) :
+        ...     name = os.path.join ('testfiles', name)
+        ...     if name.endswith (('.odt', '.sxw', '.ods', '.stw')) :
+        ...         names = fields (name)
+        ...         fast = render (name, names, True)
+        ...         if fast != render (name, names, False) :
+        ...             print ("Differs:", name)
+        ...         if fast != render (name, names, True, True) :
+        ...             print ("Template differs:", name)
+        ...         count += bool (names)
+        >>> print (count)
+        7
+
+        The mimetype stays the first member of the archive:
+
+        >>> out = BytesIO ()
+        >>> o = OOoPy (infile = 'testfiles/test.odt', outfile = out)
+        >>> r = Field_Replace (replace = dict (firstname = 'Erika'))
+        >>> Transformer (o.mimetype, r).transform (o)
+        >>> o.close ()
+        >>> o = OOoPy (infile = out)
+        >>> print (o.izip.namelist () [:2])
+        ['mimetype', 'content.xml']
+        >>> o.close ()
     """
     filename = 'content.xml'
     prio     = 100
 
-    def __init__ (self, prio = None, replace = None, ** kw) :
+    def __init__ \
+        (self, prio = None, replace = None, repeat = (), fast = True, ** kw) :
         """ replace is something behaving like a dict or something
             callable for name lookups
         """
         self.__super.__init__ (prio, ** kw)
         self.replace  = replace or {}
+        self.repeat   = repeat
+        self.fast     = fast
         self.dict     = kw
     # end def __init__
 
+    def apply_all (self, trees) :
+        """ Use the Field_Index of the unparsed content.xml if possible """
+        name = self.filename
+        if  (   not self.fast
+            or  self.repeat
+            or  not isinstance (trees, Trees)
+            or  name not in trees
+            or  trees.parsed (name)
+            ) :
+            return self.__super.apply_all (trees)
+        if name in trees.raw :
+            index = Field_Index (trees.raw_data (name), self.mimetype)
+        elif hasattr (trees.ooopy, 'field_index') :
+            # Index of a template, its fragments are compressed only once
+            index = trees.ooopy.field_index (name)
+            trees.raw [name] = index.member (self.replace, ** self.dict)
+            return
+        else :
+            index = Field_Index (trees.ooopy.izip.read (name), self.mimetype)
+        trees.raw [name] = index.replace (self.replace, ** self.dict)
+    # end def apply_all
+
     def apply (self, root) :
         tbody = self.find_tbody (root)
+        if self.repeat :
+            regions = Repeat_Regions (tbody, self.repeat, self.mimetype)
+            regions.expand (tbody, self._lookup)
         for tag in 'variable-set', 'variable-get', 'variable-input' :
             for node in tbody.findall ('.//' + self.oootag ('text', tag)) :
                 attr = 'name'
@@ -470,8 +1051,161 @@ class Field_Replace (Transform) :
                 elif name in self.dict :
                     node.text = self.dict    [name]
     # end def apply
+
+    def cache_key (self) :
+        if not isinstance (self.replace, dict) :
+            raise TypeError ("Only a dict of field values can be cached")
+        return [self.replace, self.repeat, self.fast]
+    # end def cache_key
+
+    def _lookup (self, name) :
+        if callable (self.replace) or name in self.replace :
+            return _lookup (self.replace, name)
+        return self.dict.get (name)
+    # end def _lookup
 # end class Field_Replace
 
+class Evaluate_Conditions (Transform) :
+    """
+        Evaluate the conditions of conditional sections, hidden
+        paragraphs, hidden text and conditional text with the values of
+        the given replacement dict (or callable, as for Field_Replace)
+        and remove the content that would not be displayed: Sections
+        and paragraphs whose hide-condition is true are removed
+        (otherwise the condition is removed), conditional and hidden
+        text is replaced by the text to display. Elements with
+        conditions that are not supported (see Condition) are left
+        alone. This makes the document smaller and independent of
+        field values, Mailmerge can evaluate conditions for each data
+        set with the conditions option.
+
+        >>> from ooopy.Transformer import Transformer
+        >>> o = OOoPy (infile = 'testfiles/test.odt', outfile = 'testout.odt')
+        >>> m = o.mimetype
+        >>> v = dict (salutation = 'Frau', firstname = 'Erika', street = '')
+        >>> t = Transformer \\
+        ...     ( m
+        ...     , Field_Replace (replace = v)
+        ...     , Evaluate_Conditions (replace = v)
+        ...     )
+        >>> t.transform (o)
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.odt')
+        >>> c = o.read ('content.xml').getroot ()
+        >>> o.close ()
+        >>> for s in c.iter (OOo_Tag ('text', 'section', m)) :
+        ...     print (s.get (OOo_Tag ('text', 'name', m)), end = ' ')
+        ...     print (s.get (OOo_Tag ('text', 'condition', m)))
+        Name None
+        Section1 None
+        >>> cond = OOo_Tag ('text', 'conditional-text', m)
+        >>> print (len (list (c.iter (cond))))
+        0
+        >>> section = c.find ('.//' + OOo_Tag ('text', 'section', m))
+        >>> print (repr (''.join (section.itertext ())).lstrip ('u'))
+        'Frau Erika Testman'
+    """
+    filename = 'content.xml'
+    prio     = 105
+
+    def __init__ (self, prio = None, replace = None, ** kw) :
+        self.__super.__init__ (prio, ** kw)
+        self.replace = replace or {}
+    # end def __init__
+
+    def register (self, transformer) :
+        self.__super.register (transformer)
+        tag = self.oootag
+        self.t_section   = tag ('text', 'section')
+        self.t_paras     = (tag ('text', 'p'), tag ('text', 'h'))
+        self.t_hidden_p  = tag ('text', 'hidden-paragraph')
+        self.t_hidden    = tag ('text', 'hidden-text')
+        self.t_condtext  = tag ('text', 'conditional-text')
+        self.a_condition = tag ('text', 'condition')
+        self.a_display   = tag ('text', 'display')
+        self.a_value     = tag ('text', 'string-value')
+        self.a_if_true   = tag ('text', 'string-value-if-true')
+        self.a_if_false  = tag ('text', 'string-value-if-false')
+    # end def register
+
+    def apply (self, root) :
+        self.evaluate (self.find_tbody (root), self.replace)
+    # end def apply
+
+    def evaluate (self, element, record) :
+        """ Evaluate conditions below element with values from record
+            (a dict or something callable for name lookups).
+        """
+        if callable (record) :
+            lookup = record
+        else :
+            lookup = lambda name : _lookup (record, name)
+        self._evaluate (element, lookup)
+    # end def evaluate
+
+    def _condition (self, element, lookup) :
+        """ Evaluate condition of element, None if not supported """
+        c = Condition.compiled (element.get (self.a_condition) or '')
+        if c is None :
+            return None
+        return c (lookup)
+    # end def _condition
+
+    def _evaluate (self, element, lookup) :
+        for child in list (element) :
+            tag = child.tag
+            if tag == self.t_section :
+                if child.get (self.a_display) == 'condition' :
+                    hide = self._condition (child, lookup)
+                    if hide :
+                        _replace_by_text (element, child, '')
+                        continue
+                    if hide is not None :
+                        del child.attrib [self.a_condition]
+                        del child.attrib [self.a_display]
+            elif tag in self.t_paras :
+                hidden = child.findall (self.t_hidden_p)
+                if hidden :
+                    hide = [self._condition (h, lookup) for h in hidden]
+                    if any (hide) :
+                        _replace_by_text (element, child, '')
+                        continue
+                    if None not in hide :
+                        for h in hidden :
+                            _replace_by_text (child, h, '')
+            elif tag == self.t_condtext :
+                show = self._condition (child, lookup)
+                if show is not None :
+                    a = show and self.a_if_true or self.a_if_false
+                    _replace_by_text (element, child, child.get (a) or '')
+                    continue
+            elif tag == self.t_hidden :
+                hide = self._condition (child, lookup)
+                if hide is not None :
+                    text = ''
+                    if not hide :
+                        text = child.get (self.a_value) or child.text or ''
+                    _replace_by_text (element, child, text)
+                    continue
+            self._evaluate (child, lookup)
+    # end def _evaluate
+# end class Evaluate_Conditions
+
+def _replace_by_text (parent, element, text) :
+    """ Replace element (a child of parent) by text, the tail of element
+        is kept.
+    """
+    text = text + (element.tail or '')
+    idx  = list (parent).index (element)
+    if text :
+        if idx :
+            prev = parent [idx - 1]
+            prev.tail = (prev.tail or '') + text
+        else :
+            parent.text = (parent.text or '') + text
+    del parent [idx]
+# end def _replace_by_text
+
 class Addpagebreak_Style (Transform) :
     """
         This transformation adds a new ad-hoc paragraph style to the
@@ -551,6 +1285,350 @@ class Addpagebreak (Transform) :
     # end def apply
 # end class Addpagebreak
 
+class Set_Cells (Transform) :
+    """
+        Set cells of a spreadsheet by address. The cells are given as a
+        dict or an iterable of (address, value) pairs, an address is
+        either a string in A1 notation, optionally with a sheet name
+        ("Sheet1.B3"), or a 2-tuple (row, column) with 0-based indexes
+        or a 3-tuple (sheet, row, column). The default sheet is given
+        with the sheet parameter (a name or 0-based number), otherwise
+        it is the first sheet. Values are strings, numbers, bool, dates
+        or None for clearing a cell, see Spreadsheet.set_cell_value.
+        Cells are looked up via a Sheet_Index per sheet, repeated rows
+        and cells are only split where a value is set.
+
+        >>> from ooopy.Transformer import Transformer
+        >>> from ooopy.Spreadsheet import Spreadsheet_Writer
+        >>> from ooopy.Spreadsheet import Spreadsheet_Reader
+        >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+        >>> w = Spreadsheet_Writer (o)
+        >>> w.add_sheet ('Invoice')
+        >>> w.write_rows ([['Item', 'Price'], ['', '']])
+        >>> w.add_sheet ('Prices')
+        >>> w.write_rows ([['x']] * 1000)
+        >>> w.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.ods', outfile = 'testout2.ods')
+        >>> t = Transformer \\
+        ...     ( o.mimetype
+        ...     , Set_Cells
+        ...         ( { 'A2' : 'Widget', 'B2' : 12.5, 'D1' : True
+        ...           , 'Prices.B500' : 3, (3, 0) : 'Total'
+        ...           }
+        ...         )
+        ...     , Set_Cells ([((1, 499, 0), None)], sheet = 'Prices')
+        ...     )
+        >>> t.transform (o)
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout2.ods')
+        >>> for row in Spreadsheet_Reader (o, typed = True) :
+        ...     print (row)
+        ('Item', 'Price', None, True)
+        ('Widget', 12.5)
+        ()
+        ('Total',)
+        >>> rows = list (Spreadsheet_Reader (o, sheet = 'Prices'))
+        >>> print (len (rows), rows [498], rows [499], rows [500])
+        1000 ('x',) ('', '3') ('x',)
+        >>> o.close ()
+
+        A sheet may be addressed by number and by name:
+
+        >>> o = OOoPy (outfile = 'testout.ods', mimetype = mimetypes [2])
+        >>> w = Spreadsheet_Writer (o)
+        >>> w.add_sheet ('S')
+        >>> w.write_rows ([['x']] * 10)
+        >>> w.close ()
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.ods', outfile = 'testout2.ods')
+        >>> c = [('B2', 1), ('S.B5', 2), ('B8', 3)]
+        >>> Transformer (o.mimetype, Set_Cells (c)).transform (o)
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout2.ods')
+        >>> rows = list (Spreadsheet_Reader (o))
+        >>> print (len (rows), rows [1], rows [4], rows [7], rows [9])
+        10 ('x', '1') ('x', '2') ('x', '3') ('x',)
+        >>> o.close ()
+    """
+    filename = 'content.xml'
+    prio     = 100
+
+    def __init__ (self, cells = None, sheet = None, ** kw) :
+        self.__super.__init__ (** kw)
+        if hasattr (cells, 'items') :
+            cells = cells.items ()
+        self.cells = cells or ()
+        self.sheet = sheet
+    # end def __init__
+
+    def apply (self, root) :
+        # Only sheets count, not tables nested in cells
+        tbody   = self.find_tbody (root)
+        tables  = tbody.findall (self.oootag ('table', 'table'))
+        names   = dict \
+            ((t.get (self.oootag ('table', 'name')), t) for t in tables)
+        # By table element, a sheet may be given by number and by name
+        indexes = {}
+        for addr, value in self.cells :
+            sheet = self.sheet
+            if isinstance (addr, tuple) :
+                if len (addr) == 3 :
+                    sheet, row, col = addr
+                else :
+                    row, col = addr
+            else :
+                s, row, col = parse_address (addr)
+                if s is not None :
+                    sheet = s
+            if sheet is None :
+                sheet = 0
+            if isinstance (sheet, int) :
+                table = tables [sheet]
+            else :
+                table = names [sheet]
+            if table not in indexes :
+                indexes [table] = Sheet_Index (table, self.mimetype)
+            indexes [table].set_cell (row, col, value)
+    # end def apply
+# end class Set_Cells
+
+class Table_Builder (Transform) :
+    """
+        Fill a table of a text document with rows from an iterator
+        without building elements for the rows: The rows are
+        serialised from a template row of the table and streamed into
+        the content.xml when it is written (see OOoElementTree.splice),
+        so tables with many thousand rows need neither much time nor
+        memory. The template row is the row containing the placeholder
+        text (in any table) or, if no placeholder is given, the last row
+        of the table with the given name (the default is the first
+        table). It is replaced by the rows, each cell gets the
+        attributes of the corresponding cell of the template row and
+        a paragraph with the attributes (e.g., the paragraph style) of
+        the first paragraph of the template cell. Rows are sequences of
+        values: strings (newlines are converted to line breaks),
+        numbers (written as float cells) or None for an empty cell.
+        Since only the rows are streamed the table itself stays in the
+        tree, so later transforms like renumber_tables see it (the prio
+        is after Mailmerge and Concatenate and before renumbering).
+
+        >>> from ooopy.Transformer import Transformer
+        >>> o = OOoPy (infile = 'testfiles/test.odt', outfile = 'testout.odt')
+        >>> m = o.mimetype
+        >>> rows = (('r%d' % i, i, None, 'x\\ny') for i in range (10000))
+        >>> t = Transformer \\
+        ...     ( m
+        ...     , Table_Builder (rows, table = 'Table1')
+        ...     , Attribute_Access (renumber_tables (m))
+        ...     )
+        >>> t.transform (o)
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.odt')
+        >>> c = o.read ('content.xml').getroot ()
+        >>> o.close ()
+        >>> table = c.find ('.//' + OOo_Tag ('table', 'table', m))
+        >>> print (table.get (OOo_Tag ('table', 'name', m)))
+        Table1
+        >>> rows = table.findall ('.//' + OOo_Tag ('table', 'table-row', m))
+        >>> print (len (rows))
+        10001
+        >>> for row in rows [:2] + rows [-1:] :
+        ...     print ([''.join (cell.itertext ()) for cell in row])
+        ['table', 'cell', 'cell2', 'cell3', 'cell4']
+        ['r0', '0', '', 'xy', '']
+        ['r9999', '9999', '', 'xy', '']
+        >>> cell = rows [-1][1]
+        >>> for a in 'style-name', 'value-type', 'value' :
+        ...     print (cell.get (OOo_Tag ('table', a, m))
+        ...           or cell.get (OOo_Tag ('office', a, m)))
+        Table1.A2
+        float
+        9999
+        >>> p = rows [1][3][0]
+        >>> print (p.get (OOo_Tag ('text', 'style-name', m)), len (p))
+        Table_20_Contents 1
+
+        With a placeholder:
+
+        >>> o = OOoPy \\
+        ...     (infile = 'testfiles/tbl_second.odt', outfile = 'testout.odt')
+        >>> b = Table_Builder ([['E', 'F']], placeholder = 'B')
+        >>> t = Transformer (m, b)
+        >>> t.transform (o)
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout.odt')
+        >>> c = o.read ('content.xml').getroot ()
+        >>> o.close ()
+        >>> for table in c.iter (OOo_Tag ('table', 'table', m)) :
+        ...     for row in table.iter (OOo_Tag ('table', 'table-row', m)) :
+        ...         print ([''.join (cell.itertext ()) for cell in row])
+        ['TITLE', 'DESCR']
+        ['E', 'F']
+        ['TITLE', 'DESC']
+        ['C', 'D']
+    """
+    filename = 'content.xml'
+    prio     = 90
+
+    def __init__ \
+        ( self
+        , rows
+        , table       = None
+        , placeholder = None
+        , bufsize     = 65536
+        , ** kw
+        ) :
+        self.__super.__init__ (** kw)
+        self.rows        = rows
+        self.table       = table
+        self.placeholder = placeholder
+        self.bufsize     = bufsize
+        self.key         = '%s-%s' % (self.__class__.__name__, id (self))
+    # end def __init__
+
+    def apply_all (self, trees) :
+        tree = trees [self.filename]
+        if self.apply (tree.getroot ()) :
+            tree.splice (self.key, self._chunks ())
+    # end def apply_all
+
+    def apply (self, root) :
+        """ Replace the template row by a comment marking the position
+            of the rows, return True if the template row was found.
+        """
+        parent = row = None
+        tables = root.iter (self.oootag ('table', 'table'))
+        for n, table in enumerate (tables) :
+            if self.placeholder is not None :
+                for parent, row in self._rows (table) :
+                    if self.placeholder in ''.join (row.itertext ()) :
+                        break
+                else :
+                    row = None
+                    continue
+                break
+            if  (  self.table is None and n == 0
+                or table.get (self.oootag ('table', 'name')) == self.table
+                ) :
+                for parent, row in self._rows (table) :
+                    pass
+                break
+        if row is None :
+            return False
+        self._template (row)
+        idx = list (parent).index (row)
+        parent.remove (row)
+        comment = Comment (self.key)
+        comment.tail = row.tail
+        parent.insert (idx, comment)
+        return True
+    # end def apply
+
+    def _rows (self, element) :
+        """ Generator for (parent, row) of the rows of a table, rows
+            may be grouped in header rows, row groups etc.
+        """
+        row_tag = self.oootag ('table', 'table-row')
+        groups  = set \
+            ( self.oootag ('table', g)
+              for g in ('table-header-rows', 'table-rows', 'table-row-group')
+            )
+        for e in element :
+            if e.tag == row_tag :
+                yield element, e
+            elif e.tag in groups :
+                for r in self._rows (e) :
+                    yield r
+    # end def _rows
+
+    def _template (self, row) :
+        """ Compute serialised start and end of row and cells """
+        cells   = \
+            ( self.oootag ('table', 'table-cell')
+            , self.oootag ('table', 'covered-table-cell')
+            )
+        paras   = (self.oootag ('text', 'p'), self.oootag ('text', 'h'))
+        values  = set \
+            ( self.oootag ('office', a)
+              for a in ('value-type', 'value', 'date-value', 'time-value'
+                       , 'boolean-value', 'string-value', 'currency'
+                       )
+            )
+        self.row_start = _start_tag (row)
+        self.cells     = []
+        for cell in row :
+            if cell.tag not in cells :
+                continue
+            p = cell.find (paras [0])
+            if p is None :
+                p = cell.find (paras [1])
+            if p is None :
+                p_start, p_end = '<text:p>', '</text:p>'
+            else :
+                p_start = _start_tag (p)
+                p_end   = '</%s:%s>' % split_tag (p.tag)
+            self.cells.append \
+                ( ( _start_tag (cell, values) [:-1]
+                  , p_start
+                  , p_end + '</%s:%s>' % split_tag (cell.tag)
+                  )
+                )
+        self.row_end = '</%s:%s>' % split_tag (row.tag)
+    # end def _template
+
+    def _chunks (self) :
+        """ Generator for the serialised rows in chunks of about bufsize
+            bytes.
+        """
+        buf  = []
+        size = 0
+        for row in self.rows :
+            r = [self.row_start]
+            for (c_start, p_start, p_end), value in zip (self.cells, row) :
+                if value is None :
+                    r.append (c_start + '>' + p_start + p_end)
+                elif  (   isinstance (value, (int, float))
+                      and not isinstance (value, bool)
+                      ) :
+                    r.append \
+                        ( '%s office:value-type="float" office:value="%s">'
+                          '%s%s%s'
+                        % (c_start, value, p_start, value, p_end)
+                        )
+                else :
+                    value = escape ('%s' % value).replace \
+                        ('\n', '<text:line-break/>')
+                    r.append (c_start + '>' + p_start + value + p_end)
+            for c_start, p_start, p_end in self.cells [len (row):] :
+                r.append (c_start + '>' + p_start + p_end)
+            r.append (self.row_end)
+            r = ''.join (r)
+            buf.append (r)
+            size += len (r)
+            if size >= self.bufsize :
+                yield ''.join (buf).encode ('utf-8')
+                buf  = []
+                size = 0
+        if buf :
+            yield ''.join (buf).encode ('utf-8')
+    # end def _chunks
+# end class Table_Builder
+
+def _start_tag (element, exclude = ()) :
+    """ Serialise start tag of element (using the OOo namespace prefixes)
+        without attributes in exclude.
+    """
+    tag = [':'.join (split_tag (element.tag))]
+    for k, v in element.attrib.items () :
+        if k in exclude :
+            continue
+        if k.startswith ('{') :
+            k = ':'.join (split_tag (k))
+        tag.append ('%s=%s' % (k, quoteattr (v)))
+    return '<%s>' % ' '.join (tag)
+# end def _start_tag
+
 class Fix_OOo_Tag (Transform) :
     """
         OOo writer conditions are attributes where the *value* is
@@ -558,15 +1636,43 @@ class Fix_OOo_Tag (Transform) :
         is not in scope, all conditions will evaluate to false. I
         consider this a bug (a violation of the ideas of XML) of OOo.
         Nevertheless to make conditions work, we insert the ooow
-        namespace declaration into the top-level element.
+        namespace declaration into the top-level element. If the member
+        was not parsed by an earlier transform, the declaration is
+        inserted into the start tag of the raw bytes (if missing).
     """
     filename = 'content.xml'
     prio     = 10000
+    root_tag = re.compile (br'<[^?!][^>]*?(/?)>')
+
+    def apply_all (self, trees) :
+        name = self.filename
+        if  (   self.mimetype != mimetypes [1]
+            or  not isinstance (trees, Trees)
+            or  name not in trees
+            or  trees.parsed (name)
+            ) :
+            return self.__super.apply_all (trees)
+        if name in trees.raw :
+            data = trees.raw_data (name)
+        else :
+            data = trees.ooopy.izip.read (name)
+        m = self.root_tag.search (data)
+        if b'xmlns:ooow=' not in m.group (0) :
+            ns = namespace_by_name [self.mimetype]['ooow'].encode ('utf-8')
+            trees.raw [name] = b''.join \
+                ((data [:m.start (1)], b' xmlns:ooow="', ns, b'"'
+                , data [m.start (1):]
+                ))
+    # end def apply_all
 
     def apply (self, root) :
         if self.mimetype == mimetypes [1] :
             root.set ('xmlns:ooow', namespace_by_name [self.mimetype]['ooow'])
     # end def apply
+
+    def cache_key (self) :
+        return None
+    # end def cache_key
 # end class Fix_OOo_Tag
 
 class _Body_Concat (Transform) :
@@ -677,16 +1783,81 @@ class Mailmerge (_Body_Concat) :
         the stylename (or the stylekey if a different name should be used
         for lookup in the current transformer) can be given in the
         constructor.
+
+        Repeat regions (e.g., table rows for the items of an invoice)
+        are given with their keys in repeat, see Repeat_Regions. They
+        are compiled once and expanded for each data set with the
+        iterable found under the key. If conditions is set, conditional
+        sections, hidden paragraphs etc. are evaluated for each data set
+        and content that is not displayed is dropped, see
+        Evaluate_Conditions.
+
+        >>> from ooopy.Transformer import Transformer
+        >>> o = OOoPy (infile = 'testfiles/test.odt', outfile = 'testout.odt')
+        >>> m = o.mimetype
+        >>> c = o.read ('content.xml')
+        >>> row = c.getroot ().find ('.//' + OOo_Tag ('table', 'table', m)) [-1]
+        >>> for n, cell in enumerate (row [:2]) :
+        ...     p = cell [0]
+        ...     p.text = None
+        ...     f = SubElement (p, OOo_Tag ('text', 'variable-get', m))
+        ...     f.set (OOo_Tag ('text', 'name', m), 'lines.f%d' % n)
+        >>> c.write ()
+        >>> o.close ()
+        >>> invoices = \\
+        ...     [ dict (firstname = 'Erika', lines = [('a', 1), ('b', 2)])
+        ...     , dict (firstname = 'Max',   lines = [('c', 3)])
+        ...     ]
+        >>> data = \\
+        ...     ( dict
+        ...         ( firstname = i ['firstname']
+        ...         , lines     = [dict (f0 = l [0], f1 = l [1])
+        ...                        for l in i ['lines']
+        ...                       ]
+        ...         )
+        ...       for i in invoices
+        ...     )
+        >>> t = Transformer \\
+        ...     ( m
+        ...     , get_meta (m)
+        ...     , Addpagebreak_Style ()
+        ...     , Mailmerge (iterator = data, repeat = ('lines',))
+        ...     , renumber_all (m)
+        ...     , set_meta (m)
+        ...     )
+        >>> o = OOoPy (infile = 'testout.odt', outfile = 'testout2.odt')
+        >>> t.transform (o)
+        >>> o.close ()
+        >>> o = OOoPy (infile = 'testout2.odt')
+        >>> r = o.read ('content.xml').getroot ()
+        >>> for table in r.iter (OOo_Tag ('table', 'table', m)) :
+        ...     for row in table.iter (OOo_Tag ('table', 'table-row', m)) :
+        ...         print ([''.join (cell.itertext ()) for cell in row])
+        ['table', 'cell', 'cell2', 'cell3', 'cell4']
+        ['a', '1', 'b', 'c', 'd']
+        ['b', '2', 'b', 'c', 'd']
+        ['table', 'cell', 'cell2', 'cell3', 'cell4']
+        ['c', '3', 'b', 'c', 'd']
+        >>> o.close ()
     """
     filename = 'content.xml'
     prio     = 60
 
     def __init__ \
-        (self, iterator, stylename = None, stylekey = None, ** kw) :
+        ( self
+        , iterator
+        , stylename = None
+        , stylekey  = None
+        , repeat     = ()
+        , conditions = False
+        , ** kw
+        ) :
         self.__super.__init__ (** kw)
-        self.iterator  = iterator
-        self.stylename = stylename
-        self.stylekey  = stylekey
+        self.iterator   = iterator
+        self.stylename  = stylename
+        self.stylekey   = stylekey
+        self.repeat     = repeat
+        self.conditions = conditions
     # end def __init__
 
     def apply (self, root) :
@@ -717,6 +1888,13 @@ class Mailmerge (_Body_Concat) :
             )
         self.divide_body (root)
         self.bodyparts = [self._textbody () for i in self.copyparts]
+        regions        = None
+        ev             = None
+        if self.conditions :
+            ev = Evaluate_Conditions (transformer = self.transformer)
+        if self.repeat :
+            regions = Repeat_Regions \
+                (self.copyparts, self.repeat, self.mimetype)
 
         count = 0
         for i in self.iterator :
@@ -730,7 +1908,11 @@ class Mailmerge (_Body_Concat) :
             else :
                 self.append_declarations ()
             cp = deepcopy (self.copyparts)
+            if regions :
+                regions.expand (cp, i)
             fr.apply (cp)
+            if ev :
+                ev.evaluate (cp, i)
             self.append_to_body (cp)
         # new page-count:
         for i in meta_counts :
@@ -766,11 +1948,188 @@ def tree_serialise (element, prefix = '', mimetype = mimetypes [1]) :
     return tuple (serial)
 # end def tree_serialise
 
+def _tuplify (item) :
+    """ Convert nested lists (as returned by json) back to the nested
+        tuples produced by tree_serialise.
+    """
+    if isinstance (item, list) :
+        return tuple (_tuplify (i) for i in item)
+    return item
+# end def _tuplify
+
+class Concat_Session (autosuper) :
+    """
+        Persistent merge state of a Concatenate transform. Passing a
+        session to Concatenate allows appending new documents to the
+        output of an earlier concatenation without re-merging all the
+        documents that were appended before: The serialised style map,
+        the style names in use, the body declarations, the meta counts,
+        the maximum z-index, the page-break style and the renumbering
+        counters are stored in a sidecar file (json format) when calling
+        save after the transform. When the session is loaded again and
+        the master document is the unchanged output of the last run
+        (checked via the CRC of the XML members), Concatenate uses the
+        stored state and only processes the newly appended documents.
+        Otherwise the state is ignored and recomputed from scratch.
+
+        A Concatenate with a session does its own renumbering of
+        frames, sections, tables etc., so renumber_all must not be used
+        in the same Transformer.
+
+        >>> from ooopy.Transformer import Transformer
+        >>> try :
+        ...     from io import BytesIO
+        ... except ImportError :
+        ...     from StringIO import StringIO as BytesIO
+        >>> if os.path.exists ('testout.session') :
+        ...     os.unlink ('testout.session')
+        >>> def concat (master, * docs) :
+        ...     s   = Concat_Session ('testout.session')
+        ...     out = BytesIO ()
+        ...     o   = OOoPy (infile = master, outfile = out)
+        ...     t   = Transformer \\
+        ...         ( o.mimetype
+        ...         , get_meta (o.mimetype)
+        ...         , Concatenate (* docs, session = s)
+        ...         , set_meta (o.mimetype)
+        ...         , Fix_OOo_Tag ()
+        ...         )
+        ...     t.transform (o)
+        ...     s.save (o)
+        ...     o.close ()
+        ...     return s, out
+        >>> s, out = concat ('testfiles/test.odt', 'testfiles/rechng.odt')
+        >>> s.incremental
+        False
+        >>> s, out = concat (out, 'testfiles/test.odt')
+        >>> s.incremental
+        True
+        >>> o = OOoPy (infile = out)
+        >>> m = o.mimetype
+        >>> c = o.read ('content.xml')
+        >>> meta = o.read ('meta.xml')
+        >>> o.close ()
+        >>> names = [n.get (OOo_Tag ('text', 'name', m))
+        ...          for n in c.findall ('.//' + OOo_Tag ('text', 'section', m))]
+        >>> len (names), len (set (names)), names [-1]
+        (33, 33, 'Section33')
+        >>> names = [n.get (OOo_Tag ('draw', 'name', m))
+        ...          for n in c.findall ('.//' + OOo_Tag ('draw', 'frame', m))]
+        >>> len (names), len (set (names))
+        (20, 20)
+        >>> stat = meta.find ('.//' + OOo_Tag ('meta', 'document-statistic', m))
+        >>> stat.get (OOo_Tag ('meta', 'page-count', m))
+        '3'
+        >>> s = Concat_Session ('testout.session')
+        >>> s.matches (OOoPy (infile = out))
+        True
+        >>> s.matches (OOoPy (infile = 'testfiles/test.odt'))
+        False
+    """
+    version  = 1
+    crcfiles = ('content.xml', 'styles.xml', 'meta.xml')
+
+    def __init__ (self, filename = None) :
+        self.filename    = filename
+        self.state       = None
+        self.incremental = False
+        if filename and os.path.exists (filename) :
+            with open (filename) as f :
+                state = json.load (f)
+            if state.get ('version') == self.version :
+                self.state = state
+    # end def __init__
+
+    def matches (self, ooopy) :
+        """ Check if the stored state belongs to the given (input)
+            document, i.e., if the document is the unchanged output of
+            the concatenation the state was saved for.
+        """
+        if not self.state or self.state ['mimetype'] != ooopy.mimetype :
+            return False
+        names = set (f.filename for f in ooopy.izip.infolist ())
+        for f in self.crcfiles :
+            if f not in names :
+                return False
+            if ooopy.izip.getinfo (f).CRC != self.state ['crc'][f] :
+                return False
+        return True
+    # end def matches
+
+    def restore (self, concat, ooopy) :
+        """ Restore merge state into the given Concatenate transform if
+            the stored state matches the master document. Returns True
+            if the state could be used.
+        """
+        self.incremental = self.matches (ooopy)
+        if not self.incremental :
+            return False
+        st = self.state
+        concat.serialised = dict \
+            ((_tuplify (k), v) for k, v in st ['serialised'])
+        concat.stylenames = dict (((k, v), 1) for k, v in st ['stylenames'])
+        for sect in concat.body_decls :
+            concat.body_decls [sect] = dict \
+                ((k, 1) for k in st ['body_decls'].get (sect, []))
+        for r in concat.renumber.changers :
+            r.num = st ['renumber'].get \
+                (' '.join ((r.tag, r.attribute)), r.num)
+        return True
+    # end def restore
+
+    def update (self, concat, count) :
+        """ Remember the merge state of the given Concatenate transform
+            after all documents have been appended.
+        """
+        self.state = dict \
+            ( version    = self.version
+            , mimetype   = concat.mimetype
+            , serialised = list (concat.serialised.items ())
+            , stylenames = list (concat.stylenames.keys ())
+            , body_decls = dict
+                ((k, list (v.keys ())) for k, v in concat.body_decls.items ())
+            , renumber   = dict
+                ( (' '.join ((r.tag, r.attribute)), r.num)
+                  for r in concat.renumber.changers
+                )
+            , counts     = count
+            , pbname     = concat.pbname
+            )
+    # end def update
+
+    def save (self, ooopy, filename = None) :
+        """ Save the state, we need the ooopy object the transform wrote
+            to for computing the checksums of the output. This has to
+            be called after the transform and before closing ooopy.
+        """
+        filename = filename or self.filename
+        self.state ['crc'] = dict \
+            ((f, ooopy.ozip.getinfo (f).CRC) for f in self.crcfiles)
+        tmp = filename + '.tmp'
+        with open (tmp, 'w') as f :
+            json.dump (self.state, f)
+        os.replace (tmp, filename)
+    # end def save
+
+    @property
+    def pbname (self) :
+        return self.state ['pbname']
+    # end def pbname
+
+    @property
+    def counts (self) :
+        return self.state ['counts']
+    # end def counts
+
+# end class Concat_Session
+
 class Concatenate (_Body_Concat) :
     """
         This transformation is used to create a new document from a
         concatenation of several documents.  In the constructor we get a
         list of documents to append to the master document.
+        Optionally a Concat_Session can be given with the session
+        keyword argument, see there.
     """
     prio     = 80
     style_containers = {}
@@ -812,6 +2171,7 @@ class Concatenate (_Body_Concat) :
     body_decl_sections = ['variable-decl', 'sequence-decl']
 
     def __init__ (self, * docs, ** kw) :
+        self.session = kw.pop ('session', None)
         self.__super.__init__ (** kw)
         self.docs = []
         for doc in docs :
@@ -831,6 +2191,13 @@ class Concatenate (_Body_Concat) :
         self.body_decls = {}
         for s in self.body_decl_sections :
             self.body_decls [s] = {}
+        self.renumber    = None
+        self.incremental = False
+        if self.session :
+            self.renumber = renumber_all (self.mimetype)
+            self.renumber.register (self.transformer)
+            self.incremental = self.session.restore \
+                (self, trees ['content.xml'].ooopy)
         self.trees      = {}
         for f in self.oofiles :
             self.trees [f] = [trees [f].getroot ()]
@@ -848,7 +2215,10 @@ class Concatenate (_Body_Concat) :
                 self.trees [f].append (d.read (f).getroot ())
         # append a pagebreak style, will be optimized away if duplicate
         pbs = Addpagebreak_Style (transformer = self.transformer)
-        pbs.apply (self.trees ['content.xml'][0])
+        if self.incremental :
+            pbs.set ('stylename', self.session.pbname)
+        else :
+            pbs.apply (self.trees ['content.xml'][0])
         get_attr = []
         for attr in meta_counts :
             a = self.oootag ('meta', attr)
@@ -858,7 +2228,13 @@ class Concatenate (_Body_Concat) :
             ( (Get_Max (None, self.oootag ('draw', 'z-index'), 'z-index'),)
             , transformer = self.transformer
             )
-        zi.apply (self.trees ['content.xml'][0])
+        if self.incremental :
+            counts = self.session.counts
+            for i in meta_counts :
+                self._set_meta (i, counts [i], classname = 'Get_Attribute')
+            self._set_meta ('z-index', counts ['z-index'] - 1, 'Get_Max')
+        else :
+            zi.apply (self.trees ['content.xml'][0])
         self.zi = Attribute_Access \
             ( (Get_Max (None, self.oootag ('draw', 'z-index'), 'concat-z-index')
               ,
@@ -879,8 +2255,12 @@ class Concatenate (_Body_Concat) :
         self.set_pagestyle ()
         for f in 'styles.xml', 'content.xml' :
             self.style_merge (f)
-        self.body_concat ()
+        count = self.body_concat ()
         self.append_pictures ()
+        if self.session :
+            if not self.incremental :
+                self.renumber.apply (self.trees ['content.xml'][0])
+            self.session.update (self, count)
     # end def apply_all
 
     def apply_tab_correction (self, node) :
@@ -958,6 +2338,8 @@ class Concatenate (_Body_Concat) :
             pb.apply (self.bodyparts [-1])
             tr.apply (content)
             ra.apply (content)
+            if self.incremental :
+                self.renumber.apply (content)
             declarations = self._divide (tbody)
             self.body_decl (declarations)
             self.append_to_body (self.copyparts)
@@ -965,6 +2347,7 @@ class Concatenate (_Body_Concat) :
         self.assemble_body       ()
         for i in meta_counts :
             self._set_meta (i, count [i])
+        return count
     # end def body_concat
 
     def body_decl (self, decl_section, append = 1) :
@@ -1152,6 +2535,12 @@ class Concatenate (_Body_Concat) :
                         self.merge_defaultstyle (default_style, n)
                     self.apply_tab_correction (n)
                     key = prefix + n.tag
+                    # Styles of the master already known from session
+                    if  (   self.incremental
+                        and not idx
+                        and (key, name) in self.stylenames
+                        ) :
+                        continue
                     if key not in namemap : namemap [key] = {}
                     tr = self._attr_rename (idx)
                     tr.apply (n)
@@ -1196,42 +2585,423 @@ class Concatenate (_Body_Concat) :
             
 # end class Concatenate
 
-def renumber_frames (mimetype) :
+class Style_Cleanup (Transform) :
+    """
+        Remove unused and merge duplicate styles, e.g., after a
+        Concatenate or a big mailmerge. Styles reachable from the body
+        of content.xml, the master pages and the common styles are
+        computed following the style references (the reference
+        attributes of Concatenate.ref_attrs and some more, e.g., for
+        data styles, list styles and fonts). Automatic styles are
+        local to the file that defines them (content.xml or
+        styles.xml), as are the font-face declarations. Automatic
+        styles that are structurally identical (everything but the name
+        is equal, see tree_serialise) are merged, the references are
+        rewritten in one pass over each file. Unreachable automatic
+        styles and font faces are removed. If common is set, the same
+        is done for the common styles (office:styles) and master pages,
+        otherwise they are kept since they are visible to the user.
+        Since their names are visible, too, only copies made by
+        Concatenate (with a Concat_ prefix or _Concat suffix) are merged
+        into the style they were copied from (the display name is
+        ignored when comparing those). Other
+        elements of the common styles (default styles, notes and line
+        numbering configuration etc.) are always kept.
+
+        Statistics are stored in the transformer: The number of removed
+        and merged styles and the number of bytes saved (measured on the
+        serialisation of the removed styles).
+
+        >>> from ooopy.Transformer import Transformer
+        >>> try :
+        ...     from io import BytesIO
+        ... except ImportError :
+        ...     from StringIO import StringIO as BytesIO
+        >>> sio = BytesIO ()
+        >>> o   = OOoPy (infile = 'testfiles/carta.odt', outfile = sio)
+        >>> m   = o.mimetype
+        >>> t   = Transformer \\
+        ...     ( m
+        ...     , get_meta (m)
+        ...     , Concatenate ('testfiles/carta.odt', 'testfiles/test.odt')
+        ...     , renumber_all (m)
+        ...     , set_meta (m)
+        ...     )
+        >>> t.transform (o)
+        >>> o.close ()
+        >>> def styles (o) :
+        ...     r = {}
+        ...     for f in 'content.xml', 'styles.xml' :
+        ...         root = o.read (f).getroot ()
+        ...         for c in root :
+        ...             r [(f, c.tag.split ('}') [1])] = len (c)
+        ...     return r
+        >>> out = BytesIO ()
+        >>> o   = OOoPy (infile = sio, outfile = out)
+        >>> before = styles (o)
+        >>> t = Transformer (m, Style_Cleanup (common = True))
+        >>> t.transform (o)
+        >>> o.close ()
+        >>> o = OOoPy (infile = out)
+        >>> after = styles (o)
+        >>> for k in sorted (before) :
+        ...     if before [k] != after [k] :
+        ...         print (k [0], k [1], before [k], after [k])
+        content.xml automatic-styles 30 22
+        content.xml font-face-decls 14 1
+        styles.xml font-face-decls 14 5
+        styles.xml styles 194 30
+        >>> for k in 'removed', 'merged', 'bytes' :
+        ...     print (k, t ['Style_Cleanup:' + k])
+        removed 194
+        merged 0
+        bytes 158027
+        >>> o.close ()
+
+        Common styles are only merged into the style Concatenate copied
+        them from, distinct styles with the same definition are kept:
+
+        >>> names = ('Concat_Text_20_body1', 'Text_20_body_Concat', 'Other')
+        >>> class Copy_Styles (Transform) :
+        ...     def apply_all (self, trees) :
+        ...         sn  = self.oootag ('style', 'name')
+        ...         tsn = self.oootag ('text', 'style-name')
+        ...         ost = trees ['styles.xml'].getroot ().find \\
+        ...             (self.oootag ('office', 'styles'))
+        ...         std = [e for e in ost if e.get (sn) == 'Text_20_body']
+        ...         for n in names :
+        ...             s = deepcopy (std [0])
+        ...             s.set (sn, n)
+        ...             ost.append (s)
+        ...         root = trees ['content.xml'].getroot ()
+        ...         self.paras = list \\
+        ...             (root.iter (self.oootag ('text', 'p'))) [:len (names)]
+        ...         for p, n in zip (self.paras, names) :
+        ...             p.set (tsn, n)
+        >>> o  = OOoPy (infile = 'testfiles/test.odt', outfile = BytesIO ())
+        >>> cs = Copy_Styles (prio = 10)
+        >>> t  = Transformer (m, cs, Style_Cleanup (common = True))
+        >>> t.transform (o)
+        >>> tsn = OOo_Tag ('text', 'style-name', m)
+        >>> print ([p.get (tsn) for p in cs.paras], t ['Style_Cleanup:merged'])
+        ['Text_20_body', 'Text_20_body', 'Other'] 2
+        >>> o.close ()
+
+        Class names (text:class-names etc.) are lists of style names:
+
+        >>> class Class_Styles (Transform) :
+        ...     def apply_all (self, trees) :
+        ...         tag  = self.oootag
+        ...         root = trees ['content.xml'].getroot ()
+        ...         auto = root.find (tag ('office', 'automatic-styles'))
+        ...         for n in 'TA', 'TDup' :
+        ...             s = SubElement (auto, tag ('style', 'style'))
+        ...             s.set (tag ('style', 'name'), n)
+        ...             s.set (tag ('style', 'family'), 'text')
+        ...             p = SubElement (s, tag ('style', 'text-properties'))
+        ...             p.set (tag ('fo', 'font-weight'), 'bold')
+        ...         para = root.find ('.//' + tag ('text', 'p'))
+        ...         self.span = SubElement (para, tag ('text', 'span'))
+        ...         self.span.set (tag ('text', 'class-names'), 'TA TDup')
+        ...         self.auto = auto
+        >>> o  = OOoPy (infile = 'testfiles/test.odt', outfile = BytesIO ())
+        >>> cs = Class_Styles (prio = 10)
+        >>> t  = Transformer (m, cs, Style_Cleanup ())
+        >>> t.transform (o)
+        >>> print (cs.span.get (OOo_Tag ('text', 'class-names', m)))
+        TA TA
+        >>> sn = OOo_Tag ('style', 'name', m)
+        >>> names = ('TA', 'TDup')
+        >>> print ([s.get (sn) for s in cs.auto if s.get (sn) in names])
+        ['TA']
+        >>> o.close ()
+    """
+    filename  = 'content.xml'
+    prio      = 9000
+    xmlns     = re.compile (br'\s+xmlns:\w+="[^"]*"')
+    ref_names = \
+        ( ('style', 'data-style-name'),   ('style', 'list-style-name')
+        , ('style', 'next-style-name'),   ('style', 'apply-style-name')
+        , ('style', 'font-name'),         ('style', 'font-name-asian')
+        , ('style', 'font-name-complex')
+        , ('style', 'percentage-data-style-name')
+        , ('table', 'default-cell-style-name')
+        , ('text',  'visited-style-name'),  ('text', 'main-entry-style-name')
+        , ('text',  'citation-style-name')
+        , ('text',  'citation-body-style-name')
+        , ('text',  'default-style-name'),  ('text', 'master-page-name')
+        , ('text',  'cond-style-name'),     ('draw', 'master-page-name')
+        , ('draw',  'fill-gradient-name'),  ('draw', 'fill-hatch-name')
+        , ('draw',  'fill-image-name'),     ('draw', 'opacity-name')
+        , ('draw',  'stroke-dash'),         ('draw', 'marker-start')
+        , ('draw',  'marker-end'),          ('pres', 'style-name')
+        , ('chart', 'style-name')
+        )
+    # Attributes with a whitespace-separated list of style names
+    list_names = \
+        ( ('text', 'class-names'), ('draw', 'class-names')
+        , ('pres', 'class-names')
+        )
+    def_names = \
+        ( ('style',  'style'),          ('text',   'list-style')
+        , ('number', 'number-style'),   ('number', 'currency-style')
+        , ('number', 'percentage-style'), ('number', 'date-style')
+        , ('number', 'time-style'),     ('number', 'boolean-style')
+        , ('number', 'text-style')
+        )
+
+    def __init__ (self, common = False, ** kw) :
+        self.__super.__init__ (** kw)
+        self.common = common
+    # end def __init__
+
+    def register (self, transformer) :
+        self.__super.register (transformer)
+        mt = self.mimetype
+        self.refs = set (Concatenate.ref_attrs)
+        for ns, name in self.ref_names :
+            if ns in namespace_by_name [mt] :
+                self.refs.add (self.oootag (ns, name))
+        self.list_refs = set \
+            ( self.oootag (ns, name) for ns, name in self.list_names
+              if ns in namespace_by_name [mt]
+            )
+        self.t_name    = self.oootag ('style',  'name')
+        self.t_display = self.oootag ('style',  'display-name')
+        self.t_body    = self.oootag ('office', 'body')
+        self.t_master  = self.oootag ('office', 'master-styles')
+        self.t_common  = self.oootag ('office', 'styles')
+        self.t_auto    = self.oootag ('office', 'automatic-styles')
+        self.t_fonts   = self.font_decls_tag
+        # Definitions in office:styles that may be removed with common,
+        # everything else there (e.g., notes configuration) is kept
+        self.t_defs    = set ()
+        for ns, name in self.def_names :
+            if ns in namespace_by_name [mt] :
+                self.t_defs.add (self.oootag (ns, name))
+    # end def register
+
+    def apply_all (self, trees) :
+        files = [f for f in ('content.xml', 'styles.xml') if f in trees]
+        roots = dict ((f, trees [f].getroot ()) for f in files)
+        self.removed = self.merged = self.bytes = 0
+        # Definitions: local ones per file, global ones in styles.xml
+        local = dict ((f, {}) for f in files)
+        glob  = {}
+        conts = {}
+        for f in files :
+            for c in roots [f] :
+                if c.tag in (self.t_auto, self.t_fonts) :
+                    defs = local [f]
+                elif c.tag in (self.t_common, self.t_master) :
+                    defs = glob
+                else :
+                    continue
+                conts [c.tag, f] = c
+                for e in c :
+                    name = e.get (self.t_name)
+                    if name is not None :
+                        defs.setdefault (name, []).append ((c, e))
+        rename = dict ((f, {}) for f in files)
+        for f in files :
+            self._dedup (local [f], rename [f], self.t_auto)
+        if self.common :
+            grename = {}
+            self._dedup (glob, grename, self.t_common, self.t_master)
+            for f in files :
+                for k, v in grename.items () :
+                    if k not in local [f] :
+                        rename [f].setdefault (k, v)
+        for f in files :
+            if rename [f] :
+                self._rename (roots [f], rename [f])
+        # Reachability
+        reached = set ()
+        todo    = []
+        for f in files :
+            for c in roots [f] :
+                if  (  c.tag in (self.t_body, self.t_master)
+                    or c.tag == self.t_common and not self.common
+                    ) :
+                    todo.append ((f, c))
+                elif c.tag == self.t_common :
+                    todo.extend ((f, e) for e in c if e.tag not in self.t_defs)
+        while todo :
+            f, e = todo.pop ()
+            for node in e.iter () :
+                for a, v in node.attrib.items () :
+                    for name in self._names (a, v) :
+                        for c, d in local [f].get (name, ()) :
+                            if d not in reached :
+                                reached.add (d)
+                                todo.append ((f, d))
+                        for c, d in glob.get (name, ()) :
+                            if d not in reached :
+                                reached.add (d)
+                                todo.append (('styles.xml', d))
+        removable = [self.t_auto, self.t_fonts]
+        if self.common :
+            removable.append (self.t_common)
+        for defs in list (local.values ()) + [glob] :
+            for name, l in defs.items () :
+                for c, d in l :
+                    if  (   d not in reached
+                        and c.tag in removable
+                        and (c.tag != self.t_common or d.tag in self.t_defs)
+                        ) :
+                        self._remove (c, d)
+                        self.removed += 1
+        self.set ('removed', self.removed)
+        self.set ('merged',  self.merged)
+        self.set ('bytes',   self.bytes)
+    # end def apply_all
+
+    def _dedup (self, defs, rename, * tags) :
+        """ Merge structurally identical styles in containers with the
+            given tags, the renamed styles are removed and entered into
+            rename. This is repeated as long as styles are merged since
+            renaming may make more styles identical. Styles that are
+            not automatic are only merged into the style they were
+            copied from by Concatenate.
+        """
+        while True :
+            seen = {}
+            n    = 0
+            for name in sorted (defs, key = self._order) :
+                l = defs [name]
+                # Names used for several styles (e.g., of different
+                # families) are ambiguous, leave them alone
+                if len (l) != 1 or l [0][0].tag not in tags :
+                    continue
+                c, e = l [0]
+                key  = (c.tag, self._serialise (e, rename))
+                kept = seen.setdefault (key, [])
+                for other in kept :
+                    if c.tag == self.t_auto or self._copy_of (name, other) :
+                        break
+                else :
+                    kept.append (name)
+                    continue
+                rename [name] = other
+                for k, v in rename.items () :
+                    if v == name :
+                        rename [k] = other
+                self._remove (c, e)
+                del defs [name]
+                self.merged += 1
+                n += 1
+            if not n :
+                break
+    # end def _dedup
+
+    def _copy_of (self, name, base) :
+        """ Check if name was created from base by Concatenate: with
+            the _Concat suffix or the Concat_ prefix and an optional
+            number, possibly repeated.
+        """
+        while name != base :
+            if name.endswith ('_Concat') :
+                name = name [:-7]
+            elif name.startswith ('Concat_') :
+                name = name [7:]
+                if name.startswith (base) and name [len (base):].isdigit () :
+                    return True
+            else :
+                return False
+        return True
+    # end def _copy_of
+
+    def _order (self, name) :
+        """ Sort order of style names: The first of several identical
+            styles is kept, we prefer short names and names that were
+            not created by Concatenate.
+        """
+        concat = name.startswith ('Concat_') or name.endswith ('_Concat')
+        return (concat, len (name), name)
+    # end def _order
+
+    def _serialise (self, element, rename) :
+        attr = []
+        for k, v in sorted (element.attrib.items ()) :
+            if k == self.t_name or k == self.t_display and self.common :
+                continue
+            if k in self.refs or k in self.list_refs :
+                v = self._renamed (k, v, rename)
+            attr.append ((k, v))
+        serial = [element.tag, tuple (attr), element.text, element.tail]
+        for e in element :
+            serial.append (self._serialise (e, rename))
+        return tuple (serial)
+    # end def _serialise
+
+    def _names (self, attr, value) :
+        """ Style names referenced by attribute attr with value """
+        if attr in self.refs :
+            return (value,)
+        if attr in self.list_refs :
+            return value.split ()
+        return ()
+    # end def _names
+
+    def _renamed (self, attr, value, rename) :
+        """ Value of attribute attr with the references renamed """
+        if attr in self.list_refs :
+            return ' '.join (rename.get (n, n) for n in value.split ())
+        return rename.get (value, value)
+    # end def _renamed
+
+    def _rename (self, root, rename) :
+        for node in root.iter () :
+            for a, v in node.attrib.items () :
+                if a in self.refs or a in self.list_refs :
+                    new = self._renamed (a, v, rename)
+                    if new != v :
+                        node.set (a, new)
+    # end def _rename
+
+    def _remove (self, container, element) :
+        self.bytes += len (self.xmlns.sub (b'', tostring (element)))
+        container.remove (element)
+    # end def _remove
+# end class Style_Cleanup
+
+def renumber_frames (mimetype, ** kw) :
     return \
-        [ Renumber (OOo_Tag ('draw',  'text-box', mimetype), 'Frame') # OOo 1.X
-        , Renumber (OOo_Tag ('draw',  'frame',    mimetype), 'Frame') # OOo 2.X
-        ]
+        [ Renumber (OOo_Tag ('draw', 'text-box', mimetype), 'Frame', ** kw)
+        , Renumber (OOo_Tag ('draw', 'frame',    mimetype), 'Frame', ** kw)
+        ] # OOo 1.X uses draw:text-box, OOo 2.X draw:frame
 # end def renumber_frames
 
-def renumber_sections (mimetype) :
-    return [Renumber (OOo_Tag ('text',  'section', mimetype))]
+def renumber_sections (mimetype, ** kw) :
+    return [Renumber (OOo_Tag ('text',  'section', mimetype), ** kw)]
 # end def renumber_sections
 
-def renumber_tables (mimetype) :
-    return [Renumber (OOo_Tag ('table', 'table', mimetype))]
+def renumber_tables (mimetype, ** kw) :
+    return [Renumber (OOo_Tag ('table', 'table', mimetype), ** kw)]
 # end def renumber_tables
 
-def renumber_images (mimetype) :
-    return [Renumber (OOo_Tag ('draw', 'image', mimetype))]
+def renumber_images (mimetype, ** kw) :
+    return [Renumber (OOo_Tag ('draw', 'image', mimetype), ** kw)]
 # end def renumber_images
 
-def renumber_xml_id (mimetype) :
+def renumber_xml_id (mimetype, ** kw) :
     if mimetype == mimetypes [0] :
         return []
     xmlid = OOo_Tag ('xml', 'id', mimetype)
-    return [Renumber (OOo_Tag ('text', 'list', mimetype), 'list', xmlid)]
+    return [Renumber (OOo_Tag ('text', 'list', mimetype), 'list', xmlid, ** kw)]
 # end def renumber_xml_id
 
-def renumber_all (mimetype) :
+def renumber_all (mimetype, ** kw) :
     """ Factory function for all renumberings parameterized with
-        mimetype
+        mimetype, keyword arguments (e.g. only_duplicates) are passed
+        to all Renumber objects.
     """
     return Attribute_Access \
-        ( renumber_frames   (mimetype)
-        + renumber_sections (mimetype)
-        + renumber_tables   (mimetype)
-        + renumber_images   (mimetype)
-        + renumber_xml_id   (mimetype)
+        ( renumber_frames   (mimetype, ** kw)
+        + renumber_sections (mimetype, ** kw)
+        + renumber_tables   (mimetype, ** kw)
+        + renumber_images   (mimetype, ** kw)
+        + renumber_xml_id   (mimetype, ** kw)
         ) 
 # end def renumber_all
 
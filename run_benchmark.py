@@ -0,0 +1,107 @@
+from __future__ import print_function
+import os
+import sys
+import time
+from argparse           import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from io                 import BytesIO
+from ooopy.Server       import Renderer
+
+# Rendering throughput with a growing number of threads of one process
+# (these only scale on a free-threaded Python) and, for comparison, of
+# worker processes. Each worker renders documents from the templates
+# given on the command line with a field replacement or a mailmerge.
+
+renderer = None
+
+def init (templates) :
+    global renderer
+    renderer = Renderer (templates)
+# end def init
+
+def render (args) :
+    id, n, records = args
+    if records :
+        recs = [{'address.firstname' : 'Name %d.%d' % (n, i)}
+                for i in range (records)
+               ]
+        renderer.render (id, BytesIO (), records = recs)
+    else :
+        renderer.render (id, BytesIO (), fields = {'firstname' : str (n)})
+# end def render
+
+def run (executor, workers, jobs) :
+    start = time.time ()
+    with executor (workers) as ex :
+        for r in ex.map (render, jobs, chunksize = 4) :
+            pass
+    return time.time () - start
+# end def run
+
+if __name__ == '__main__' :
+    parser = ArgumentParser ()
+    parser.add_argument \
+        ( "template"
+        , help    = "Template document(s)"
+        , nargs   = '+'
+        )
+    parser.add_argument \
+        ( "-d", "--docs"
+        , help    = "Number of documents per run (default: %(default)s)"
+        , type    = int
+        , default = 200
+        )
+    parser.add_argument \
+        ( "-m", "--mailmerge"
+        , help    = "Mailmerge with the given number of records instead "
+                    "of field replacement"
+        , type    = int
+        , default = 0
+        )
+    parser.add_argument \
+        ( "-p", "--processes"
+        , help    = "Also run with worker processes for comparison"
+        , action  = "store_true"
+        )
+    parser.add_argument \
+        ( "-t", "--threads"
+        , help    = "Comma-separated numbers of workers "
+                    "(default: %(default)s)"
+        , default = '1,2,4,8'
+        )
+    args      = parser.parse_args ()
+    templates = dict ((os.path.basename (t), t) for t in args.template)
+    ids       = sorted (templates)
+    jobs      = [ (ids [n % len (ids)], n, args.mailmerge)
+                  for n in range (args.docs)
+                ]
+    gil       = getattr (sys, '_is_gil_enabled', lambda : True) ()
+    print \
+        ( "Python %s, GIL %s, %s CPUs"
+        % ( sys.version.split () [0]
+          , 'enabled' if gil else 'disabled'
+          , os.cpu_count ()
+          )
+        )
+    init (templates)
+    # Warm up: parse templates, compute field indexes
+    for j in jobs [:len (ids)] :
+        render (j)
+    modes = [('threads', ThreadPoolExecutor)]
+    if args.processes :
+        modes.append (('processes', ProcessPoolExecutor))
+    for name, executor in modes :
+        base = None
+        for workers in [int (w) for w in args.threads.split (',')] :
+            if executor is ProcessPoolExecutor :
+                ex = lambda w : executor \
+                    (w, initializer = init, initargs = (templates,))
+            else :
+                ex = executor
+            t = run (ex, workers, jobs)
+            if base is None :
+                base = t
+            print \
+                ( "%-9s %3d: %7.1f docs/s, speedup %4.2f"
+                % (name, workers, len (jobs) / t, base / t)
+                )
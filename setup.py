@@ -79,8 +79,11 @@ setup \
         , 'bin/ooo_fieldreplace'
         , 'bin/ooo_from_csv'
         , 'bin/ooo_grep'
+        , 'bin/ooo_index'
         , 'bin/ooo_mailmerge'
         , 'bin/ooo_prettyxml'
+        , 'bin/ooo_server'
+        , 'bin/ooo_to_csv'
         ]
     , classifiers      =
         [ 'Development Status :: 5 - Production/Stable'